@@ -0,0 +1,96 @@
+import threading
+
+# --- LAZY AWS CLIENT FACTORIES ---
+# Nothing here touches boto3 until a client is first requested, so importing the agent
+# modules is cheap. Objects live at module level and are reused across warm invocations.
+# - Low-level clients are thread-safe: one per (service, region) for the whole process.
+# - Resources (and their Table objects) are not: one per (service, region) per thread.
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+_local = threading.local()
+_overrides = {}        # service -> stand-in object (replay_harness, tests)
+_creation_hooks = []   # fn(service, obj) called for every newly built client/resource
+
+
+def _boto_session():
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                import boto3  # Deferred: the import alone is a noticeable share of cold start
+                _session = boto3.session.Session()
+    return _session
+
+def _notify(service, obj):
+    for hook in list(_creation_hooks):
+        hook(service, obj)
+    return obj
+
+def client(service, region):
+    """Shared low-level client, built on first use."""
+    if service in _overrides:
+        return _overrides[service]
+    key = (service, region)
+    cached = _clients.get(key)
+    if cached is None:
+        session = _boto_session()
+        with _lock:
+            cached = _clients.get(key)
+            if cached is None:
+                cached = _clients[key] = _notify(service, session.client(service, region_name=region))
+    return cached
+
+def resource(service, region):
+    """boto3 resource for the calling thread, built on first use."""
+    if service in _overrides:
+        return _overrides[service]
+    resources = getattr(_local, "resources", None)
+    if resources is None:
+        resources = _local.resources = {}
+    key = (service, region)
+    if key not in resources:
+        session = _boto_session()
+        with _lock:  # Session.resource() itself is not thread-safe
+            resources[key] = _notify(service, session.resource(service, region_name=region))
+    return resources[key]
+
+def table(name, region):
+    """DynamoDB Table object for the calling thread."""
+    if 'dynamodb' in _overrides:
+        return _overrides['dynamodb'].Table(name)
+    tables = getattr(_local, "tables", None)
+    if tables is None:
+        tables = _local.tables = {}
+    key = (name, region)
+    if key not in tables:
+        tables[key] = resource('dynamodb', region).Table(name)
+    return tables[key]
+
+
+# --- OVERRIDES ---
+
+def override(service, obj):
+    """Routes every client()/resource() call for 'service' to obj until cleared. Returns the previous override."""
+    with _lock:
+        previous = _overrides.get(service)
+        _overrides[service] = obj
+    return previous
+
+def clear_override(service, previous=None):
+    with _lock:
+        if previous is None:
+            _overrides.pop(service, None)
+        else:
+            _overrides[service] = previous
+
+def add_creation_hook(hook):
+    """hook(service, obj) runs for each real client/resource when it is built (instrumentation, stubbing)."""
+    _creation_hooks.append(hook)
+
+def built():
+    """Services built so far in this process (startup diagnostics)."""
+    with _lock:
+        return sorted({service for service, _ in _clients} |
+                      {service for service, _ in getattr(_local, "resources", {})})
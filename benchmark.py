@@ -0,0 +1,239 @@
+import argparse
+import json
+import sys
+import time
+
+import catalog_runner
+import decision_cache
+import lambda_function
+import notifications
+import rate_limiter
+import replay_harness
+import tracing
+
+# --- CONFIGURATION ---
+# A regression is a throughput drop or an invocation p95 increase beyond this fraction of the baseline
+DEFAULT_TOLERANCE = 0.15
+SIMULATED_UNLIMITED_UNITS = 1e6  # Limiter rate for capacity the in-memory tables do not simulate
+
+
+# --- JOBS ---
+
+def scenario_jobs(scenarios, runs, skus=None):
+    """
+    runs jobs per scenario, built from replay_harness.SCENARIOS. Each job gets its own
+    product unless skus is set: then the runs cycle over that many products (repeated states).
+    """
+    products, jobs = [], []
+    for name in scenarios:
+        for i in range(runs):
+            product = replay_harness.scenario_product(name, f"BENCH_{name.upper()}_{i % (skus or runs):05d}")
+            if skus is None or i < skus:
+                products.append(product)
+            jobs.append({"product_id": product["drug_id"],
+                         "trigger_reason": replay_harness.SCENARIOS[name]["trigger_reason"],
+                         "product_snapshot": product, "scenario": name})
+    return products, jobs
+
+def corpus_jobs(conversations, repeat):
+    """Each recorded conversation is replayed 'repeat' times under a fresh product id."""
+    products, jobs = [], []
+    for conversation in conversations:
+        for i in range(repeat):
+            product_id = f"{conversation['product_id']}-r{i}"
+            job = {"product_id": product_id, "trigger_reason": conversation["trigger_reason"],
+                   "episode_id": f"{conversation['trace_id']}:{i}", "scenario": conversation["trigger_reason"]}
+            if conversation["product_snapshot"] is not None:
+                product = dict(conversation["product_snapshot"], drug_id=product_id)
+                products.append(replay_harness.to_item(product))
+                job["product_snapshot"] = product
+            jobs.append(job)
+    return products, jobs
+
+
+# --- BENCHMARK ---
+
+def run_benchmark(products, jobs, bedrock, concurrency, use_fast_path=False, rate_limit=False, db_write_capacity=None,
+                  model_rps=None):
+    """
+    Runs the jobs through catalog_runner against an in-memory product table and the given
+    Bedrock stand-in. Latencies come from the trace spans of the run.
+    db_write_capacity simulates provisioned WCU/s per table; rate_limit turns the client-side limiter on
+    (sized to the simulated capacity, and to the model quota model_rps).
+    """
+    db = replay_harness.InMemoryDynamoDB(write_capacity=db_write_capacity)
+    if rate_limit:
+        # Limiters follow the simulated tables: writes at db_write_capacity, reads are not simulated
+        for table_name in ('pharma_products', 'supply_chain_actions', 'sales_transactions'):
+            rate_limiter.configure_table(table_name, SIMULATED_UNLIMITED_UNITS, db_write_capacity or SIMULATED_UNLIMITED_UNITS)
+    db.seed(products)
+    decision_cache.shared_decisions.clear()
+    before = decision_cache.shared_decisions.stats()
+    exporter = tracing.MemoryExporter()
+    previous = tracing.set_exporter(exporter)
+    try:
+        with replay_harness.offline(bedrock, db, rate_limit=rate_limit), replay_harness.ToolTap() as tap:
+            if rate_limit and model_rps:
+                rate_limiter.model_limiter(lambda_function.MODEL_ID).configure(model_rps)
+            started = time.perf_counter()
+            summary = catalog_runner.run_catalog_jobs(jobs, max_workers=concurrency, use_fast_path=use_fast_path)
+            wall_s = time.perf_counter() - started
+            notifications.shared_dispatcher.flush()
+            notified = notifications.shared_dispatcher.snapshot()
+    finally:
+        tracing.set_exporter(previous)
+
+    spans = list(exporter.spans)
+    latency = tracing.summarize(spans)
+    by_scenario = {}
+    for job, result in zip(jobs, summary["results"]):
+        row = by_scenario.setdefault(job["scenario"], {"runs": 0, "failed": 0, "turns": 0})
+        row["runs"] += 1
+        row["failed"] += result["status"] != "success"
+        row["turns"] += result["metrics"].get("turns", 0)
+    for row in by_scenario.values():
+        row["turns_per_run"] = round(row.pop("turns") / row["runs"], 2)
+
+    return {
+        "runs": summary["total"],
+        "failed": summary["failed"],
+        "concurrency": concurrency,
+        "wall_time_s": round(wall_s, 3),
+        "throughput_rps": round(summary["total"] / wall_s, 2) if wall_s else None,
+        "turns_per_run": round(summary["bedrock_turns"] / max(summary["total"], 1), 2),
+        "tokens_per_run": round(summary["total_tokens"] / max(summary["total"], 1), 1),
+        "paths": summary["paths"],
+        "scenarios": by_scenario,
+        "latency_ms": latency,
+        "first_action_ms": first_action_latency(spans),
+        "decision_cache": _decision_cache_delta(before, decision_cache.shared_decisions.stats()),
+        "notifications": notified,
+        "rate_limiter": rate_limiter.stats() if rate_limit else {},
+        "throttled": dict(db.throttled(), **({"bedrock": bedrock.capacity.throttled}
+                                              if getattr(bedrock, "capacity", None) else {})),
+        "tool_calls": tap.calls,
+    }
+
+def _decision_cache_delta(before, after):
+    """Decision cache counters of this run only (the cache is process-wide)."""
+    delta = {k: after[k] - before[k] for k in ("hits", "misses", "stores", "replay_failures")}
+    lookups = delta["hits"] + delta["misses"]
+    delta["hit_rate"] = round(delta["hits"] / lookups, 3) if lookups else 0.0
+    return delta
+
+def first_action_latency(spans):
+    """p50/p95 from invocation start to its first tool call start (streaming dispatches tools earlier)."""
+    invocation_start, first_tool = {}, {}
+    for span in spans:
+        trace, start = span["trace_id"], span["start"]
+        if span["kind"] == tracing.INVOCATION:
+            invocation_start[trace] = start
+        elif span["kind"] == tracing.TOOL_CALL:
+            first_tool[trace] = min(start, first_tool.get(trace, start))
+    values = sorted((first_tool[trace] - start) * 1000 for trace, start in invocation_start.items() if trace in first_tool)
+    if not values:
+        return {}
+    return {"count": len(values), "p50_ms": round(tracing.percentile(values, 50), 2),
+            "p95_ms": round(tracing.percentile(values, 95), 2)}
+
+def replay_fidelity(conversations, tool_calls):
+    """Replayed runs whose tool outcomes differ from the recording (order-insensitive)."""
+    expected = {c["trace_id"]: sorted(c["tools"]) for c in conversations}
+    diverged = 0
+    for episode_id, calls in tool_calls.items():
+        source = (episode_id or "").rsplit(":", 1)[0]
+        if source in expected and sorted(calls) != expected[source]:
+            diverged += 1
+    return diverged
+
+def find_regressions(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    regressions = []
+    if baseline.get("throughput_rps") and report["throughput_rps"] < baseline["throughput_rps"] * (1 - tolerance):
+        regressions.append(f"throughput {report['throughput_rps']} rps < baseline {baseline['throughput_rps']} rps")
+    current_p95 = report["latency_ms"].get(tracing.INVOCATION, {}).get("p95_ms")
+    baseline_p95 = baseline.get("latency_ms", {}).get(tracing.INVOCATION, {}).get("p95_ms")
+    if current_p95 and baseline_p95 and current_p95 > baseline_p95 * (1 + tolerance):
+        regressions.append(f"invocation p95 {current_p95} ms > baseline {baseline_p95} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the agent loop (no AWS access needed).")
+    parser.add_argument("--scenario", action="append", choices=list(replay_harness.SCENARIOS),
+                        help="Scenario to run (repeatable, default: all)")
+    parser.add_argument("--runs", type=int, default=20, help="Runs per scenario, or replays per recorded conversation")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--corpus", help="Replay a recorded corpus (replay_harness.py record) instead of the scripted model")
+    parser.add_argument("--latency-scale", type=float, default=0.0, help="Replay recorded model latency x this factor")
+    parser.add_argument("--model-latency-ms", type=float, default=0.0, help="Simulated latency of the scripted model")
+    parser.add_argument("--fast-path", action="store_true", help="Let rule-decidable triggers skip the model")
+    parser.add_argument("--skus", type=int, help="Cycle each scenario's runs over this many products (repeated states)")
+    parser.add_argument("--no-decision-cache", action="store_true", help="Always run the model for LLM-path jobs")
+    parser.add_argument("--rate-limit", action="store_true", help="Use the client-side adaptive rate limiter")
+    parser.add_argument("--db-write-capacity", type=float, help="Simulated provisioned WCU/s per table (throttles beyond it)")
+    parser.add_argument("--model-rps", type=float, help="Simulated model request quota (throttles beyond it)")
+    parser.add_argument("--stream", action="store_true", help="Call the model through converse_stream (early tool dispatch)")
+    parser.add_argument("--out", help="Write the JSON report here")
+    parser.add_argument("--baseline", help="Fail (exit 1) if this run regresses against a previous --out report")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    scripted = replay_harness.ScriptedBedrock(latency_ms=args.model_latency_ms, max_rps=args.model_rps)
+    conversations = []
+    if args.corpus:
+        conversations = replay_harness.recorded_conversations(replay_harness.load_corpus(args.corpus))
+        bedrock = replay_harness.ReplayBedrock(replay_harness.load_corpus(args.corpus), fallback=scripted,
+                                               latency_scale=args.latency_scale)
+        products, jobs = corpus_jobs(conversations, args.runs)
+    else:
+        bedrock = scripted
+        products, jobs = scenario_jobs(args.scenario or list(replay_harness.SCENARIOS), args.runs, skus=args.skus)
+    for job in jobs:
+        job["stream"] = args.stream
+        job["use_decision_cache"] = not args.no_decision_cache
+
+    report = run_benchmark(products, jobs, bedrock, args.concurrency, use_fast_path=args.fast_path,
+                           rate_limit=args.rate_limit, db_write_capacity=args.db_write_capacity, model_rps=args.model_rps)
+    tool_calls = report.pop("tool_calls")
+    if args.corpus:
+        report["replay"] = dict(bedrock.stats, diverged_runs=replay_fidelity(conversations, tool_calls))
+
+    print(f"\n🏁 [BENCH] {report['runs']} run(s), {report['failed']} failed, concurrency {report['concurrency']}")
+    print(f"   Throughput: {report['throughput_rps']} runs/s | turns/run: {report['turns_per_run']} "
+          f"| tokens/run: {report['tokens_per_run']}")
+    print(f"   {'span':<14} {'count':>7} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    for kind, row in report["latency_ms"].items():
+        print(f"   {kind:<14} {row['count']:>7} {row['p50_ms']:>10.2f} {row['p95_ms']:>10.2f} {row['p99_ms']:>10.2f}")
+    if report["first_action_ms"]:
+        row = report["first_action_ms"]
+        print(f"   First tool call after: p50 {row['p50_ms']:.2f} ms | p95 {row['p95_ms']:.2f} ms")
+    cache = report["decision_cache"]
+    print(f"   Decision cache: {cache['hits']} hits / {cache['misses']} misses ({cache['hit_rate']:.0%}), "
+          f"{cache['replay_failures']} replay failure(s)")
+    notified = report["notifications"]
+    print(f"   Notifications: {notified['published']} action event(s) in {notified['digests_sent']} digest(s), "
+          f"{notified['dropped'] + notified['failed']} lost")
+    if report["throttled"]:
+        print(f"   Throttled requests: {json.dumps(report['throttled'])}")
+    for name, row in report["rate_limiter"].items():
+        print(f"   Limiter {name}: rate {row['rate']}/s, waited {row['waited']}/{row['acquired']}, "
+              f"wait p50 {row['wait_p50_ms']} ms / p95 {row['wait_p95_ms']} ms, {row['throttles']} throttle(s)")
+    if "replay" in report:
+        print(f"   Replay: {json.dumps(report['replay'])}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"   ❌ [BENCH] Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("   ✅ [BENCH] No regression against baseline.")
+
+
+if __name__ == "__main__":
+    main()
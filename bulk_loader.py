@@ -0,0 +1,316 @@
+import argparse
+import csv
+import json
+import os
+import queue
+import threading
+import time
+from decimal import Decimal
+
+import numpy as np
+
+import catalog_scanner
+import rate_limiter
+import tools
+
+# --- CONFIGURATION ---
+DEFAULT_WORKERS = int(os.environ.get("BULK_LOAD_WORKERS", "8"))
+DEFAULT_MAX_RETRIES = int(os.environ.get("BULK_LOAD_MAX_RETRIES", "8"))
+PROGRESS_INTERVAL_SECONDS = 5.0
+MAX_FAILED_IDS = 100  # Failed product ids kept for the report
+
+NUMERIC_FIELDS = ("stock_level", "current_price", "competitor_price", "cost_price")
+# Fields a catalog reset restores; each is saved next to the item as baseline_<field>
+RESET_FIELDS = ("stock_level", "current_price", "competitor_price")
+CATEGORIES = ("Supplements", "Pain Relief", "Cold & Flu", "Allergy", "Digestive", "Skin Care", "First Aid")
+
+_DONE = object()
+
+
+def baseline_field(field):
+    return f"baseline_{field}"
+
+def with_baseline(item):
+    """Adds the baseline_* copies of the reset fields (values already given are kept)."""
+    for field in RESET_FIELDS:
+        if field in item:
+            item.setdefault(baseline_field(field), item[field])
+    return item
+
+
+# --- SOURCES (each yields product dicts with Decimal numbers) ---
+
+def _to_number(value):
+    if value is None or value == "":
+        return None
+    return Decimal(str(value))
+
+def _normalize(row):
+    item = {}
+    for field, value in row.items():
+        if field in NUMERIC_FIELDS or field.startswith("baseline_"):
+            value = _to_number(value)
+        if value is not None:  # DynamoDB rejects empty strings in keys and gains nothing from nulls
+            item[field] = value
+    if not item.get('drug_id'):
+        raise ValueError(f"Row without drug_id: {row}")
+    return with_baseline(item)
+
+def read_csv(path):
+    """Products from a CSV file with a header row (drug_id plus any product attributes)."""
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            yield _normalize(row)
+
+def read_jsonl(path):
+    """Products from a JSON Lines file, one object per line."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield _normalize(json.loads(line, parse_float=Decimal))
+
+def synthetic_products(n, seed=42, chunk_size=10000):
+    """
+    n generated products with the market simulator's distributions: log-normal cost around 60,
+    price at 1.6-2.2x cost, competitor about 8% above us and stock between 1500 and 5000.
+    Ids are SKU_0000000... like market_simulator.py, so both describe the same catalog.
+    """
+    rng = np.random.default_rng(seed)
+    for start in range(0, n, chunk_size):
+        size = min(chunk_size, n - start)
+        cost = np.round(rng.lognormal(mean=np.log(60), sigma=0.5, size=size), 2)
+        price = np.round(cost * rng.uniform(1.6, 2.2, size=size), 2)
+        competitor = np.round(price * rng.normal(1.08, 0.05, size=size), 2)
+        stock = rng.integers(1500, 5000, size=size)
+        category = rng.integers(0, len(CATEGORIES), size=size)
+        for i in range(size):
+            index = start + i
+            yield with_baseline({
+                'drug_id': f"SKU_{index:07d}",
+                'product_name': f"Synthetic Product {index}",
+                'category': CATEGORIES[category[i]],
+                'stock_level': Decimal(int(stock[i])),
+                'current_price': Decimal(f"{price[i]:.2f}"),
+                'competitor_price': Decimal(f"{competitor[i]:.2f}"),
+                'cost_price': Decimal(f"{cost[i]:.2f}"),
+            })
+
+
+# --- PARALLEL BATCH WRITER ---
+
+def sync_capacity(table_name):
+    """
+    Points the table's limiters at its provisioned capacity from describe_table.
+    On-demand tables (no provisioned units) and stand-ins without describe_table keep the configured rate.
+    """
+    try:
+        throughput = tools.get_dynamodb().meta.client.describe_table(TableName=table_name)['Table'].get(
+            'ProvisionedThroughput', {})
+    except Exception:
+        return
+    if throughput.get('WriteCapacityUnits'):
+        rate_limiter.configure_table(table_name, throughput.get('ReadCapacityUnits'), throughput['WriteCapacityUnits'])
+
+class BulkWriter:
+    """
+    Writes items to one table with parallel BatchWriteItem workers.
+    - Items are grouped into batches of 25 on the caller's thread and handed to the workers
+      through a bounded queue, so sources of any size are streamed in constant memory.
+    - Workers write through rate_limiter.batch_write: requests are sized to the write limiter's
+      burst and paced one by one, without a deadline, and UnprocessedItems are retried.
+    - Items still unwritten after max_retries (or an error) are counted as failed; the load carries on.
+    The write limiter runs at the table's provisioned WCU (read with describe_table when the table
+    is provisioned, otherwise rate_limiter.TABLE_CAPACITY); write_capacity overrides it.
+    """
+
+    def __init__(self, table_name=tools.TABLE_NAME, workers=DEFAULT_WORKERS, max_retries=DEFAULT_MAX_RETRIES,
+                 write_capacity=None):
+        self.table_name = table_name
+        self.workers = workers
+        self.max_retries = max_retries
+        if write_capacity:
+            self.limiter = rate_limiter.AdaptiveLimiter(f"dynamodb:{table_name}:bulk", write_capacity,
+                                                        rate_limiter.table_burst(write_capacity))
+        else:
+            sync_capacity(table_name)
+            self.limiter = rate_limiter.table_limiter(table_name, rate_limiter.WRITE)
+        self._batches = queue.Queue(maxsize=workers * 4)
+        self._lock = threading.Lock()
+        self._threads = []
+        self.stats = {"rows": 0, "written": 0, "failed": 0, "batch_requests": 0, "unprocessed_retries": 0,
+                      "elapsed_s": 0.0, "rows_per_s": 0.0}
+        self.failed_ids = []
+        self.errors = []
+
+    def _count(self, **deltas):
+        with self._lock:
+            for key, value in deltas.items():
+                self.stats[key] += value
+
+    def _fail(self, items, error=None):
+        with self._lock:
+            self.stats["failed"] += len(items)
+            room = MAX_FAILED_IDS - len(self.failed_ids)
+            self.failed_ids.extend(item['drug_id'] for item in items[:max(room, 0)])
+            if error is not None and len(self.errors) < 10:
+                self.errors.append(repr(error))
+
+    def _write_batch(self, items):
+        """Writes one batch; only the items that did not land are counted as failed."""
+        outcome = rate_limiter.batch_write(tools.get_dynamodb().meta.client.batch_write_item, self.table_name,
+                                           [{'PutRequest': {'Item': item}} for item in items], bucket=self.limiter,
+                                           max_retries=self.max_retries, deadline_seconds=None)
+        self._count(batch_requests=outcome["requests"], unprocessed_retries=outcome["retries"],
+                    written=outcome["written"])
+        if outcome["unwritten"]:
+            self._fail([entry['PutRequest']['Item'] for entry in outcome["unwritten"]], outcome["error"])
+
+    def _run(self):
+        while True:
+            batch = self._batches.get()
+            if batch is _DONE:
+                return
+            try:
+                self._write_batch(batch)
+            except Exception as e:  # Nothing of this batch was sent
+                self._fail(batch, e)
+
+    def write(self, items, progress=None):
+        """
+        Writes every item of the iterable and returns the stats.
+        progress(stats) is called about every PROGRESS_INTERVAL_SECONDS.
+        """
+        started = time.perf_counter()
+        self._threads = [threading.Thread(target=self._run, name=f"bulk-writer-{i}", daemon=True)
+                         for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+        batch = {}  # drug_id -> item: a BatchWriteItem request may not repeat a key, the last row wins
+        next_progress = started + PROGRESS_INTERVAL_SECONDS
+        try:
+            for item in items:
+                if item['drug_id'] not in batch:
+                    self._count(rows=1)
+                batch[item['drug_id']] = item
+                if len(batch) == rate_limiter.BATCH_WRITE_LIMIT:
+                    self._batches.put(list(batch.values()))
+                    batch = {}
+                if progress is not None and time.perf_counter() >= next_progress:
+                    next_progress += PROGRESS_INTERVAL_SECONDS
+                    progress(self._snapshot(started))
+            if batch:
+                self._batches.put(list(batch.values()))
+        finally:
+            for _ in self._threads:
+                self._batches.put(_DONE)
+            for thread in self._threads:
+                thread.join()
+        self.stats = self._snapshot(started)
+        return self.stats
+
+    def _snapshot(self, started):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            stats = dict(self.stats)
+        stats["elapsed_s"] = round(elapsed, 3)
+        stats["rows_per_s"] = round(stats["written"] / elapsed, 1) if elapsed else 0.0
+        return stats
+
+
+# --- ENTRY POINTS ---
+
+def load(items, workers=DEFAULT_WORKERS, write_capacity=None, progress=None):
+    """Writes products into 'pharma_products'. Returns the writer stats."""
+    writer = BulkWriter(tools.TABLE_NAME, workers=workers, write_capacity=write_capacity)
+    stats = writer.write(items, progress=progress)
+    stats["failed_ids"] = writer.failed_ids
+    stats["errors"] = writer.errors
+    return stats
+
+def reset_items(pages, stats):
+    """Items of the scanned pages with their reset fields put back to the baseline (unchanged ones are skipped)."""
+    for items in pages:
+        stats["scanned"] += len(items)
+        for item in items:
+            if not all(baseline_field(field) in item for field in RESET_FIELDS):
+                stats["no_baseline"] += 1
+                continue
+            if all(item.get(field) == item[baseline_field(field)] for field in RESET_FIELDS):
+                stats["unchanged"] += 1
+                continue
+            for field in RESET_FIELDS:
+                item[field] = item[baseline_field(field)]
+            yield item
+
+def reset_catalog(workers=DEFAULT_WORKERS, segments=catalog_scanner.DEFAULT_SEGMENTS, write_capacity=None,
+                  progress=None):
+    """
+    Puts stock and prices of every product back to their baseline_* values.
+    The catalog is read with the parallel segmented scan and only changed items are rewritten,
+    as whole-item puts. Writes made to a product between its scan and its put are overwritten.
+    """
+    reset_stats = {"scanned": 0, "unchanged": 0, "no_baseline": 0}
+    pages = catalog_scanner.stream_pages(segments=segments)
+    writer = BulkWriter(tools.TABLE_NAME, workers=workers, write_capacity=write_capacity)
+    stats = writer.write(reset_items(pages, reset_stats), progress=progress)
+    stats.update(reset_stats)
+    stats["failed_ids"] = writer.failed_ids
+    stats["errors"] = writer.errors
+    return stats
+
+
+def _print_progress(stats):
+    print(f"   ⏳ [BULK] {stats['written']:,} written, {stats['failed']:,} failed, {stats['rows_per_s']:,.0f} rows/s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load or reset the product catalog with parallel batch writes.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--csv", help="Load products from a CSV file with a header row")
+    source.add_argument("--jsonl", help="Load products from a JSON Lines file")
+    source.add_argument("--synthetic", type=int, metavar="N", help="Load N generated products")
+    source.add_argument("--reset", action="store_true", help="Put every product back to its baseline stock and prices")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for --synthetic")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--segments", type=int, default=catalog_scanner.DEFAULT_SEGMENTS, help="Scan segments for --reset")
+    parser.add_argument("--wcu", type=float, help="Write rate cap (WCU/s). Default: the table's provisioned capacity")
+    parser.add_argument("--offline", action="store_true",
+                        help="Write to an in-memory table instead of AWS (measures the loader itself)")
+    parser.add_argument("--offline-capacity", type=float, help="With --offline: simulated provisioned WCU/s")
+    args = parser.parse_args()
+
+    context = None
+    if args.offline:
+        import replay_harness
+        db = replay_harness.InMemoryDynamoDB(write_capacity=args.offline_capacity)
+        if args.offline_capacity:
+            # What describe_table reports for a provisioned table
+            rate_limiter.configure_table(tools.TABLE_NAME, args.offline_capacity, args.offline_capacity)
+        context = replay_harness.offline(None, db, rate_limit=bool(args.offline_capacity or args.wcu))
+        context.__enter__()
+
+    try:
+        if args.reset:
+            print(f"🔄 [BULK] Resetting '{tools.TABLE_NAME}' to baseline with {args.workers} workers...")
+            stats = reset_catalog(workers=args.workers, segments=args.segments, write_capacity=args.wcu,
+                                  progress=_print_progress)
+        else:
+            if args.csv:
+                items = read_csv(args.csv)
+            elif args.jsonl:
+                items = read_jsonl(args.jsonl)
+            else:
+                items = synthetic_products(args.synthetic, seed=args.seed)
+            print(f"📦 [BULK] Loading '{tools.TABLE_NAME}' with {args.workers} workers...")
+            stats = load(items, workers=args.workers, write_capacity=args.wcu, progress=_print_progress)
+    finally:
+        if context is not None:
+            context.__exit__(None, None, None)
+
+    print(f"✅ [BULK] {stats['written']:,} of {stats['rows']:,} rows in {stats['elapsed_s']} s "
+          f"({stats['rows_per_s']:,.0f} rows/s), {stats['failed']:,} failed")
+    print(json.dumps(stats, indent=2, cls=tools.DecimalEncoder))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import lambda_function as agent_brain
+import tools
+
+# --- CONFIGURATION ---
+# Upper bound on concurrent agent conversations. Keep it in line with the
+# Bedrock TPS quota and the DynamoDB capacity of 'pharma_products'.
+DEFAULT_MAX_WORKERS = int(os.environ.get("AGENT_MAX_WORKERS", "8"))
+
+
+# --- HELPERS ---
+
+def _normalize_job(job):
+    """Accepts (product_id, trigger_reason) tuples or {"product_id", "trigger_reason"} dicts."""
+    if isinstance(job, dict):
+        return dict(job)
+    product_id, trigger_reason = job
+    return {"product_id": product_id, "trigger_reason": trigger_reason}
+
+def _run_job(job, use_fast_path):
+    """Runs one isolated agent conversation and records its status and timing."""
+    event = dict(job)
+    event.setdefault("use_fast_path", use_fast_path)
+
+    started = time.perf_counter()
+    try:
+        missing = [field for field in ("product_id", "trigger_reason") if not job.get(field)]
+        if missing:
+            raise ValueError(f"Job is missing {', '.join(missing)}")
+        # Each lambda_handler call builds its own 'messages' history,
+        # so jobs never share conversation state.
+        result = agent_brain.lambda_handler(event, {})
+        status = "success" if result.get('statusCode') == 200 else "failed"
+        report = json.loads(result['body'])
+    except Exception as e:
+        result = {'statusCode': 500}
+        status = "error"
+        report = f"Job crashed: {e}"
+
+    return {
+        "product_id": job.get("product_id"),
+        "trigger_reason": job.get("trigger_reason"),
+        "status": status,
+        "statusCode": result.get('statusCode'),
+        "path": result.get('path'),
+        "metrics": result.get('metrics', {}),
+        "report": report,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+# --- CORE FUNCTIONS ---
+
+def run_catalog_jobs(jobs, max_workers=DEFAULT_MAX_WORKERS, use_fast_path=True):
+    """
+    Runs one agent invocation per (product_id, trigger_reason) job on a bounded worker pool.
+    Returns an aggregated summary; per-job results keep the input order.
+    """
+    jobs = [_normalize_job(job) for job in jobs]
+    if not jobs:
+        return {"total": 0, "succeeded": 0, "failed": 0, "paths": {},
+                "wall_time_ms": 0.0, "max_job_ms": 0.0, "sum_job_ms": 0.0,
+                "bedrock_turns": 0, "total_tokens": 0, "results": []}
+
+    workers = max(1, min(int(max_workers), len(jobs)))
+    print(f"🏭 [CATALOG] Dispatching {len(jobs)} job(s) on {workers} worker(s)...")
+
+    started = time.perf_counter()
+
+    # One batched read for the whole catalog slice instead of one get_item per job
+    pending = [job["product_id"] for job in jobs if job.get("product_id") and "product_snapshot" not in job]
+    if pending:
+        try:
+            snapshots = tools.batch_get_products(pending)
+        except Exception as e:
+            print(f"   ⚠️ [CATALOG] Snapshot pre-fetch failed, jobs will fetch individually: {e}")
+            snapshots = {}
+        for job in jobs:
+            if job.get("product_id") in snapshots:
+                job.setdefault("product_snapshot", snapshots[job["product_id"]])
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="agent-job") as pool:
+        results = list(pool.map(lambda job: _run_job(job, use_fast_path), jobs))
+    wall_time_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    paths = {}
+    for res in results:
+        if res["path"]:
+            paths[res["path"]] = paths.get(res["path"], 0) + 1
+    succeeded = sum(1 for res in results if res["status"] == "success")
+    durations = sorted(res["duration_ms"] for res in results)
+    bedrock_turns = sum(res["metrics"].get("turns", 0) for res in results)
+    total_tokens = sum(res["metrics"].get("total_tokens", 0) for res in results)
+
+    print(f"🏭 [CATALOG] Done: {succeeded}/{len(jobs)} succeeded in {wall_time_ms} ms.")
+    return {
+        "total": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "paths": paths,
+        "wall_time_ms": wall_time_ms,
+        "max_job_ms": durations[-1],
+        "sum_job_ms": round(sum(durations), 1),
+        "bedrock_turns": bedrock_turns,
+        "total_tokens": total_tokens,
+        "results": results,
+    }
+
+
+def lambda_handler(event, context):
+    """
+    Batch entry point.
+    Expects event = {"jobs": [{"product_id": ..., "trigger_reason": ...}, ...], "max_workers": 8}
+    """
+    summary = run_catalog_jobs(
+        event.get("jobs", []),
+        max_workers=event.get("max_workers", DEFAULT_MAX_WORKERS),
+        use_fast_path=event.get("use_fast_path", True),
+    )
+    return {
+        'statusCode': 200 if summary["failed"] == 0 else 207,
+        'body': json.dumps(summary)
+    }
@@ -0,0 +1,240 @@
+import argparse
+import heapq
+import json
+import os
+import queue
+import threading
+import time
+import zlib
+
+import numpy as np
+
+import policy_engine
+import rate_limiter
+import tools
+import tracing
+
+# --- CONFIGURATION ---
+DEFAULT_SEGMENTS = int(os.environ.get("SCAN_SEGMENTS", "4"))
+DEFAULT_PAGE_LIMIT = int(os.environ.get("SCAN_PAGE_LIMIT", "1000"))
+RULE_FIELDS = ('stock_level', 'current_price', 'competitor_price', 'cost_price')
+
+# Priority bands: stockouts first, then margin leaks, then price gaps.
+# Within a band the score grows with severity (0..1).
+PRIORITY_BAND = {
+    policy_engine.LOW_STOCK: 3.0,
+    policy_engine.PROFIT_PROTECTION: 2.0,
+    policy_engine.PRICE_DISADVANTAGE: 1.0,
+}
+
+_DONE = object()
+
+
+# --- SEGMENTED SCAN ---
+
+def _put(pages, page, stop):
+    """Blocking put that gives up once the consumer has gone away."""
+    while not stop.is_set():
+        try:
+            pages.put(page, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _scan_segment(segment, total_segments, page_limit, pages, errors, stop):
+    """Worker: streams one Scan segment page by page into the shared bounded queue."""
+    kwargs = {'Segment': segment, 'TotalSegments': total_segments, 'Limit': page_limit,
+              'ReturnConsumedCapacity': 'TOTAL'}
+    limiter = rate_limiter.table_limiter(tools.TABLE_NAME)
+    try:
+        while True:
+            with tracing.span(tracing.DB_CALL, "scan", segment=segment) as span:
+                # Background work: waits for read capacity however long it takes, without a deadline
+                response = rate_limiter.call(limiter, tools.get_table().scan, deadline_seconds=None, **kwargs)
+                units = response.get('ConsumedCapacity', {}).get('CapacityUnits', 1.0)
+                span.set(capacity_units=units)
+            items = response.get('Items', [])
+            if rate_limiter.ENABLED:
+                # A page's cost depends on its size: one unit was reserved, the rest is charged now.
+                # The next page is sized from this one so a page of every segment fits in the bucket.
+                limiter.charge(units - 1.0)
+                if items and units:
+                    kwargs['Limit'] = max(1, min(page_limit, int(limiter.burst / total_segments * len(items) / units)))
+            if not _put(pages, items, stop):
+                return
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    except Exception as e:
+        errors.append(e)
+    finally:
+        _put(pages, _DONE, stop)
+
+def stream_pages(segments=DEFAULT_SEGMENTS, page_limit=DEFAULT_PAGE_LIMIT):
+    """
+    Yields item pages from a parallel segmented Scan of 'pharma_products'.
+    The queue holds at most two pages per segment, so memory stays bounded
+    no matter how large the table is.
+    """
+    pages = queue.Queue(maxsize=segments * 2)
+    errors = []
+    stop = threading.Event()
+    workers = [
+        threading.Thread(target=_scan_segment, args=(seg, segments, page_limit, pages, errors, stop),
+                         name=f"scan-seg-{seg}", daemon=True)
+        for seg in range(segments)
+    ]
+    for worker in workers:
+        worker.start()
+
+    remaining = segments
+    try:
+        while remaining:
+            page = pages.get()
+            if page is _DONE:
+                remaining -= 1
+                continue
+            yield page
+    finally:
+        stop.set()  # Releases workers if the consumer stopped early
+
+    if errors:
+        raise errors[0]
+
+
+# --- VECTORIZED RULES ---
+
+def _column(items, field):
+    return np.array([float(item[field]) if item.get(field) is not None else np.nan for item in items],
+                    dtype=np.float64)
+
+def evaluate_page(items):
+    """
+    Evaluates the trigger rules for a page of items in one vectorized pass.
+    Returns a list of (priority, product_id, trigger_reason, item), highest priority first.
+    """
+    if not items:
+        return []
+
+    stock = _column(items, 'stock_level')
+    current = _column(items, 'current_price')
+    competitor = _column(items, 'competitor_price')
+    cost = _column(items, 'cost_price')
+    floor_price = policy_engine.floor_prices(cost)
+
+    # NaN compares False, so items with missing fields never fire a rule
+    with np.errstate(invalid='ignore', divide='ignore'):
+        low_stock = stock < float(policy_engine.LOW_STOCK_THRESHOLD)
+        below_floor = ~low_stock & (current < floor_price)
+        price_disadvantage = ~low_stock & ~below_floor & (competitor < current)
+
+        severity = np.zeros(len(items))
+        severity[low_stock] = 1.0 - stock[low_stock] / float(policy_engine.LOW_STOCK_THRESHOLD)
+        severity[below_floor] = (floor_price[below_floor] - current[below_floor]) / floor_price[below_floor]
+        severity[price_disadvantage] = (current[price_disadvantage] - competitor[price_disadvantage]) / current[price_disadvantage]
+    np.clip(severity, 0.0, 1.0, out=severity)
+
+    jobs = []
+    for reason, mask in ((policy_engine.LOW_STOCK, low_stock),
+                         (policy_engine.PROFIT_PROTECTION, below_floor),
+                         (policy_engine.PRICE_DISADVANTAGE, price_disadvantage)):
+        for i in np.flatnonzero(mask):
+            jobs.append((PRIORITY_BAND[reason] + severity[i], items[i]['drug_id'], reason, items[i]))
+    jobs.sort(key=lambda job: job[0], reverse=True)
+    return jobs
+
+
+# --- SCANNER ---
+
+class CatalogScanner:
+    """
+    Streams the whole catalog and yields prioritized trigger jobs.
+    With incremental=True only items whose rule fields changed since the previous scan
+    are re-evaluated. One CRC32 per product is kept between scans and never evicted, so
+    every unchanged row is skipped however large the catalog is: about 120 bytes per
+    product (~120 MB for a million).
+    """
+
+    def __init__(self, segments=DEFAULT_SEGMENTS, page_limit=DEFAULT_PAGE_LIMIT):
+        self.segments = segments
+        self.page_limit = page_limit
+        self._fingerprints = {}  # drug_id -> crc32 of RULE_FIELDS
+        self.stats = {}
+
+    @staticmethod
+    def _fingerprint(item):
+        return zlib.crc32("|".join(str(item.get(field)) for field in RULE_FIELDS).encode())
+
+    def _remember(self, item):
+        """Stores the item's fingerprint. Returns True if it differs from the one kept."""
+        fp = self._fingerprint(item)
+        previous = self._fingerprints.get(item['drug_id'])
+        self._fingerprints[item['drug_id']] = fp
+        return previous != fp
+
+    def _changed_only(self, items):
+        return [item for item in items if self._remember(item)]
+
+    def scan(self, incremental=False):
+        """Yields batches of job dicts (one batch per page), each batch sorted by priority."""
+        self.stats = {"items_scanned": 0, "items_evaluated": 0, "triggers": 0, "elapsed_s": 0.0}
+        started = time.perf_counter()
+        for items in stream_pages(self.segments, self.page_limit):
+            self.stats["items_scanned"] += len(items)
+            if incremental:
+                items = self._changed_only(items)
+            else:
+                for item in items:
+                    self._remember(item)
+            self.stats["items_evaluated"] += len(items)
+
+            batch = [
+                {"product_id": product_id, "trigger_reason": reason,
+                 "priority": round(float(priority), 4), "product_snapshot": item}
+                for priority, product_id, reason, item in evaluate_page(items)
+            ]
+            self.stats["triggers"] += len(batch)
+            if batch:
+                yield batch
+        self.stats["elapsed_s"] = round(time.perf_counter() - started, 3)
+
+    def top_jobs(self, k, incremental=False):
+        """Returns the k most urgent jobs of the whole catalog using a bounded heap."""
+        heap = []
+        counter = 0  # Tie-breaker so dicts are never compared
+        for batch in self.scan(incremental=incremental):
+            for job in batch:
+                counter += 1
+                entry = (job["priority"], counter, job)
+                if len(heap) < k:
+                    heapq.heappush(heap, entry)
+                elif entry[0] > heap[0][0]:
+                    heapq.heapreplace(heap, entry)
+        return [job for _, _, job in sorted(heap, key=lambda e: (e[0], -e[1]), reverse=True)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan the catalog and emit prioritized agent trigger jobs.")
+    parser.add_argument("--segments", type=int, default=DEFAULT_SEGMENTS)
+    parser.add_argument("--page-limit", type=int, default=DEFAULT_PAGE_LIMIT)
+    parser.add_argument("--top", type=int, default=50, help="How many of the most urgent jobs to keep")
+    parser.add_argument("--dispatch", action="store_true", help="Run the jobs through catalog_runner")
+    parser.add_argument("--max-workers", type=int, default=None)
+    args = parser.parse_args()
+
+    scanner = CatalogScanner(segments=args.segments, page_limit=args.page_limit)
+    jobs = scanner.top_jobs(args.top)
+    print(f"🔎 [SCANNER] {json.dumps(scanner.stats)}")
+    for job in jobs:
+        print(f"   {job['priority']:.3f}  {job['trigger_reason']:<20} {job['product_id']}")
+
+    if args.dispatch and jobs:
+        import catalog_runner
+        kwargs = {"max_workers": args.max_workers} if args.max_workers else {}
+        summary = catalog_runner.run_catalog_jobs(jobs, **kwargs)
+        print(json.dumps({k: v for k, v in summary.items() if k != "results"}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import argparse
+import json
+import queue
+import threading
+import time
+
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+import aws_clients
+import policy_engine
+from trigger_coordinator import fingerprint
+
+# --- CONFIGURATION ---
+REGION = 'eu-west-1'
+TABLE_NAME = 'pharma_products'
+RULE_FIELDS = ('stock_level', 'current_price', 'competitor_price', 'cost_price')
+
+_deserializer = TypeDeserializer()
+_serializer = TypeSerializer()
+
+
+# --- HELPERS ---
+
+def deserialize_image(image):
+    """Converts a stream image ({'attr': {'N': '1'}}) into a plain item dict."""
+    return {k: _deserializer.deserialize(v) for k, v in (image or {}).items()}
+
+def serialize_image(item):
+    return {k: _serializer.serialize(v) for k, v in (item or {}).items()}
+
+def changed_fields(old, new):
+    """Attribute names whose value differs between two images."""
+    return {k for k in set(old) | set(new) if old.get(k) != new.get(k)}
+
+
+# --- CHANGE SOURCES ---
+
+class LocalChangeFeed:
+    """
+    In-process stand-in for a DynamoDB Stream, for tests and offline runs.
+    publish() takes plain item dicts and emits records in the Streams wire format.
+    """
+
+    def __init__(self, maxsize=10000):
+        self._records = queue.Queue(maxsize=maxsize)
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def publish(self, old_item, new_item):
+        if old_item is None:
+            event_name = "INSERT"
+        elif new_item is None:
+            event_name = "REMOVE"
+        else:
+            event_name = "MODIFY"
+        key_source = new_item or old_item
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        record = {
+            "eventName": event_name,
+            "dynamodb": {
+                "Keys": serialize_image({'drug_id': key_source['drug_id']}),
+                "SequenceNumber": str(sequence),
+                "StreamViewType": "NEW_AND_OLD_IMAGES",
+            },
+        }
+        if old_item is not None:
+            record["dynamodb"]["OldImage"] = serialize_image(old_item)
+        if new_item is not None:
+            record["dynamodb"]["NewImage"] = serialize_image(new_item)
+        self._records.put(record)
+
+    def poll(self, max_records=100, wait_seconds=0.5):
+        """Returns the next batch of records (blocks up to wait_seconds for the first one)."""
+        records = []
+        try:
+            records.append(self._records.get(timeout=wait_seconds))
+            while len(records) < max_records:
+                records.append(self._records.get_nowait())
+        except queue.Empty:
+            pass
+        return records
+
+
+class DynamoDBStreamSource:
+    """
+    Polls the table's DynamoDB Stream (StreamViewType NEW_AND_OLD_IMAGES) shard by shard.
+    Shards open at start-up are read from LATEST. Shards found by a later refresh (shard
+    rollover) are read from TRIM_HORIZON, so records written before they were discovered
+    are not skipped. The shard list is refreshed periodically, and right after a shard closes.
+    """
+
+    def __init__(self, table_name=TABLE_NAME, region=REGION, shard_refresh_seconds=60):
+        self.table_name = table_name
+        self._streams = aws_clients.client('dynamodbstreams', region)
+        self._dynamodb = aws_clients.client('dynamodb', region)
+        self._iterators = {}  # shard_id -> shard iterator
+        self._shard_refresh_seconds = shard_refresh_seconds
+        self._last_refresh = 0.0
+        self._started = False  # True once the first shard list has been read
+        self.stream_arn = None
+
+    def _refresh_shards(self):
+        if self.stream_arn is None:
+            table = self._dynamodb.describe_table(TableName=self.table_name)['Table']
+            self.stream_arn = table.get('LatestStreamArn')
+            if not self.stream_arn:
+                raise RuntimeError(f"Streams are not enabled on '{self.table_name}'")
+        description = self._streams.describe_stream(StreamArn=self.stream_arn)['StreamDescription']
+        # New shards after start-up are children of a rollover: read them from their first record
+        iterator_type = 'TRIM_HORIZON' if self._started else 'LATEST'
+        for shard in description['Shards']:
+            shard_id = shard['ShardId']
+            if shard_id not in self._iterators:
+                self._iterators[shard_id] = self._streams.get_shard_iterator(
+                    StreamArn=self.stream_arn, ShardId=shard_id, ShardIteratorType=iterator_type
+                )['ShardIterator']
+        self._started = True
+        self._last_refresh = time.monotonic()
+
+    def poll(self, max_records=100, wait_seconds=0.5):
+        if time.monotonic() - self._last_refresh > self._shard_refresh_seconds:
+            self._refresh_shards()
+        records = []
+        for shard_id, iterator in list(self._iterators.items()):
+            if iterator is None:
+                continue
+            response = self._streams.get_records(ShardIterator=iterator, Limit=max_records)
+            records.extend(response.get('Records', []))
+            # A closed shard returns no NextShardIterator once fully read
+            self._iterators[shard_id] = response.get('NextShardIterator')
+            if self._iterators[shard_id] is None:
+                self._last_refresh = 0.0  # Its children are open now: look them up on the next poll
+        if not records:
+            time.sleep(wait_seconds)
+        return records
+
+
+# --- PIPELINE ---
+
+class ChangeFeedPipeline:
+    """
+    Turns change records into agent jobs. Only the changed item is evaluated, and a job
+    is emitted only when an anomaly appears or its fingerprint changes, so reads and
+    agent runs scale with the write rate instead of catalog size x poll frequency.
+    """
+
+    def __init__(self, sink, coordinator=None):
+        self.sink = sink                # Callable receiving a list of job dicts
+        self.coordinator = coordinator  # Optional TriggerCoordinator to resolve cleared episodes
+        self.stats = {"records": 0, "irrelevant": 0, "jobs": 0, "resolved": 0}
+
+    def jobs_for_record(self, record):
+        self.stats["records"] += 1
+        images = record.get('dynamodb', {})
+        old = deserialize_image(images.get('OldImage'))
+        new = deserialize_image(images.get('NewImage'))
+
+        if not new or not (changed_fields(old, new) & set(RULE_FIELDS)):
+            self.stats["irrelevant"] += 1
+            return []
+
+        old_reason = policy_engine.detect_trigger(old) if old else None
+        new_reason = policy_engine.detect_trigger(new)
+
+        if old_reason and old_reason != new_reason and self.coordinator is not None:
+            self.coordinator.resolve(new['drug_id'], old_reason)
+            self.stats["resolved"] += 1
+
+        if new_reason is None:
+            return []
+        if new_reason == old_reason and fingerprint(new_reason, old) == fingerprint(new_reason, new):
+            # Same anomaly, nothing the agent would decide differently
+            return []
+        return [{"product_id": new['drug_id'], "trigger_reason": new_reason, "product_snapshot": new}]
+
+    def process(self, records):
+        jobs = []
+        for record in records:
+            jobs.extend(self.jobs_for_record(record))
+        if jobs:
+            self.stats["jobs"] += len(jobs)
+            self.sink(jobs)
+        return jobs
+
+    def run(self, source, stop_event=None, max_records=100):
+        """Consumes a change source until stop_event is set."""
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            self.process(source.poll(max_records=max_records))
+
+
+def _dispatch_to_agent(jobs):
+    import catalog_runner
+    summary = catalog_runner.run_catalog_jobs(jobs)
+    print(f"📡 [FEED] Dispatched {summary['total']} job(s): {summary['succeeded']} succeeded")
+    return summary
+
+
+def stream_handler(event, context):
+    """Lambda entry point for a DynamoDB Streams trigger on 'pharma_products'."""
+    pipeline = ChangeFeedPipeline(sink=_dispatch_to_agent)
+    jobs = pipeline.process(event.get('Records', []))
+    return {'statusCode': 200, 'body': json.dumps({"jobs": len(jobs), **pipeline.stats})}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consume the pharma_products change stream and trigger the agent.")
+    parser.add_argument("--table", default=TABLE_NAME)
+    args = parser.parse_args()
+
+    pipeline = ChangeFeedPipeline(sink=_dispatch_to_agent)
+    print(f"📡 [FEED] Listening to changes on '{args.table}'...")
+    try:
+        pipeline.run(DynamoDBStreamSource(table_name=args.table))
+    except KeyboardInterrupt:
+        print(f"📡 [FEED] Stopped. {json.dumps(pipeline.stats)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import json
+import os
+
+import policy_engine
+import tools
+
+# --- CONFIGURATION ---
+# Per-invocation budget for input + output tokens across all turns
+TOKEN_BUDGET = int(os.environ.get("AGENT_TOKEN_BUDGET", "20000"))
+# Output cap per model call (lowered further when the budget runs short)
+MAX_OUTPUT_TOKENS = int(os.environ.get("AGENT_MAX_OUTPUT_TOKENS", "1024"))
+# Tool results of the most recent N tool turns are resent verbatim; older ones are compacted
+KEEP_RECENT_TOOL_TURNS = int(os.environ.get("AGENT_KEEP_RECENT_TOOL_TURNS", "1"))
+CHARS_PER_TOKEN = 4  # Rough estimate, only used for budget checks before a call
+
+# Tools the model may use per trigger. Unknown triggers get every tool.
+# Actions are reported by the notification dispatcher, so no trigger needs the email tool.
+TRIGGER_TOOLS = {
+    policy_engine.LOW_STOCK: ("get_product_market_data", "create_restock_order"),
+    policy_engine.PRICE_DISADVANTAGE: ("get_product_market_data", "update_product_price"),
+    policy_engine.PROFIT_PROTECTION: ("get_product_market_data", "update_product_price"),
+}
+
+# What survives when an old tool result is compacted: outcomes and the rule inputs
+SUMMARY_FIELDS = ("status", "reason", "error", "message", "po_details",
+                  "drug_id", "stock_level", "current_price", "competitor_price", "cost_price")
+
+
+def estimate_tokens(payload):
+    return len(json.dumps(payload, default=str)) // CHARS_PER_TOKEN
+
+def tools_for(trigger_reason):
+    """Bedrock tool_config restricted to the tools the trigger's rules can use."""
+    return tools.registry.tool_config(TRIGGER_TOOLS.get(trigger_reason))
+
+
+class Conversation:
+    """
+    Message history of one agent invocation.
+    - Before each call, tool results older than KEEP_RECENT_TOOL_TURNS are reduced to SUMMARY_FIELDS
+      (toolUse/toolResult pairs stay intact, as Bedrock requires).
+    - Token usage is tracked against a per-invocation budget.
+    """
+
+    def __init__(self, system_prompt, trigger_reason, budget=TOKEN_BUDGET):
+        self.system = [{"text": system_prompt}]
+        self.tool_config = tools_for(trigger_reason)
+        self.budget = budget
+        self.messages = []
+        self.tokens_used = 0
+        self.stats = {"compacted_results": 0, "chars_saved": 0}
+        self._tool_turns = []        # indexes of user messages carrying tool results
+        self._fixed_tokens = estimate_tokens(self.system) + estimate_tokens(self.tool_config)
+
+    # --- HISTORY ---
+
+    def add_user_text(self, text):
+        self.messages.append({"role": "user", "content": [{"text": text}]})
+
+    def add_assistant(self, message):
+        self.messages.append(message)
+
+    def add_tool_results(self, results):
+        self._tool_turns.append(len(self.messages))
+        self.messages.append({"role": "user", "content": results})
+
+    def compact(self):
+        """Reduces tool results outside the most recent tool turns to their summary fields."""
+        old_turns = self._tool_turns[:-KEEP_RECENT_TOOL_TURNS] if KEEP_RECENT_TOOL_TURNS else self._tool_turns
+        for index in old_turns:
+            for block in self.messages[index]['content']:
+                for content in block['toolResult']['content']:
+                    data = content.get('json')
+                    if not isinstance(data, dict) or data.get('compacted'):
+                        continue
+                    summary = {k: data[k] for k in SUMMARY_FIELDS if k in data}
+                    summary['compacted'] = True
+                    self.stats["compacted_results"] += 1
+                    self.stats["chars_saved"] += max(len(json.dumps(data, default=str)) - len(json.dumps(summary, default=str)), 0)
+                    content['json'] = summary
+
+    # --- BUDGET ---
+
+    def record_usage(self, usage):
+        self.tokens_used += usage.get('totalTokens', 0)
+
+    def remaining(self):
+        return self.budget - self.tokens_used
+
+    def can_continue(self, min_output_tokens=128):
+        """True while the next call's estimated input plus a minimal answer still fits the budget."""
+        next_input = self._fixed_tokens + estimate_tokens(self.messages)
+        return next_input + min_output_tokens <= self.remaining()
+
+    def request(self):
+        """Keyword arguments for bedrock.converse (compacts the history first)."""
+        self.compact()
+        next_input = self._fixed_tokens + estimate_tokens(self.messages)
+        max_tokens = max(min(MAX_OUTPUT_TOKENS, self.remaining() - next_input), 1)
+        return {
+            "messages": self.messages,
+            "system": self.system,
+            "toolConfig": {"tools": self.tool_config},
+            "inferenceConfig": {"maxTokens": max_tokens},
+        }
@@ -24,6 +24,11 @@ def create_table_1():
             ProvisionedThroughput={
                 'ReadCapacityUnits': 1,
                 'WriteCapacityUnits': 1
+            },
+            # Değişiklik akışı (change_feed.py) eski ve yeni kaydı birlikte okur
+            StreamSpecification={
+                'StreamEnabled': True,
+                'StreamViewType': 'NEW_AND_OLD_IMAGES'
             }
         )
         
@@ -74,6 +79,45 @@ def create_table_2():
 
 
 
+ACTIONS_TABLE_NAME = 'supply_chain_actions'
+def create_table_3():
+    # Ajanın aldığı aksiyonların (PO / fiyat değişikliği) kaydı.
+    # action_id = idempotency key -> aynı tetik için ikinci sipariş koşullu yazımda reddedilir.
+    dynamodb = boto3.resource('dynamodb', region_name='eu-west-1')
+
+    existing_tables = [t.name for t in dynamodb.tables.all()]
+
+    if ACTIONS_TABLE_NAME not in existing_tables:
+        print(f"🔨 Tablo inşa ediliyor: {ACTIONS_TABLE_NAME}...")
+
+        table = dynamodb.create_table(
+            TableName=ACTIONS_TABLE_NAME,
+            KeySchema=[
+                {'AttributeName': 'action_id', 'KeyType': 'HASH'}  # Partition Key (Idempotency Key)
+            ],
+            AttributeDefinitions=[
+                {'AttributeName': 'action_id', 'AttributeType': 'S'}
+            ],
+            ProvisionedThroughput={'ReadCapacityUnits': 1, 'WriteCapacityUnits': 1}
+        )
+
+        table.wait_until_exists()
+        print("✅ Tablo başarıyla oluşturuldu ve kullanıma hazır!")
+    else:
+        print(f"ℹ️  Bilgi: {ACTIONS_TABLE_NAME} tablosu zaten var, tekrar oluşturulmadı.")
+
+
+NOTIFY_QUEUE_NAME = 'supply_chain_notifications'
+def create_notification_queue():
+    # Bildirim olaylarının kalıcı kuyruğu: Lambda olayı buraya bırakır,
+    # özet e-postaları tek bir gönderici (notifications.digest_handler) yollar.
+    sqs = boto3.client('sqs', region_name='eu-west-1')
+    queue_url = sqs.create_queue(QueueName=NOTIFY_QUEUE_NAME)['QueueUrl']  # Varsa mevcut kuyruğu döner
+    print(f"✅ Kuyruk hazır: {queue_url} (NOTIFY_QUEUE_URL olarak ayarlayın)")
+
+
 if __name__ == "__main__":
     create_table_1()
-    create_table_2()
\ No newline at end of file
+    create_table_2()
+    create_table_3()
+    create_notification_queue()
\ No newline at end of file
@@ -14,7 +14,11 @@ def seed_data():
             'current_price': Decimal(120), 
             'competitor_price': Decimal(130), 
             'cost_price': Decimal(60), 
-            'category': 'Supplements'
+            'category': 'Supplements',
+            # Toplu sıfırlama (bulk_loader.py --reset) bu değerlere döner
+            'baseline_stock_level': Decimal(2000),
+            'baseline_current_price': Decimal(120),
+            'baseline_competitor_price': Decimal(130)
         }
     )
     print("✅ Ürün başarıyla eklendi/sıfırlandı!")
@@ -1,10 +1,9 @@
 import streamlit as st
-import boto3
 import time
 import json
 import random
 import os
-from datetime import datetime
+from queue import Queue, Empty
 from decimal import Decimal
 
 
@@ -16,19 +15,61 @@ if "aws" in st.secrets:
 
 # IMPORT BRAIN (Local Lambda Function)
 import lambda_function as agent_brain
+import aws_clients
+import job_queue
+import rate_limiter
+import streaming
+import tools
+import product_cache
+from log_store import LogStore, SEVERITY_NAMES
+from trigger_coordinator import TriggerCoordinator, EXECUTED
+from sales_ledger import SalesLedger
+from product_cache import shared_cache
+from decision_cache import shared_decisions
+import notifications
 
 
 # --- AWS CONFIGURATION ---
 REGION = 'eu-west-1'
-dynamodb = boto3.resource('dynamodb', region_name=REGION)
-product_table = dynamodb.Table('pharma_products')
-PRODUCT_ID = 'OTC_VIT_C_ZINC'
+# Shares the agent's lazily built DynamoDB resource instead of creating a second one
+product_table = aws_clients.table('pharma_products', REGION)
+# Manual injections share the agent's write budget for the table
+product_writes = rate_limiter.table_limiter('pharma_products', rate_limiter.WRITE)
+PRODUCT_ID = os.environ.get('PRODUCT_ID', 'OTC_VIT_C_ZINC')
+# Metrics are redrawn several times per tick; agent/dashboard writes go through the
+# shared cache, so a cached read stays fresh without burning the table's 1 RCU.
+READ_CONSISTENCY = os.environ.get('DASHBOARD_READ_CONSISTENCY', product_cache.CACHED)
 
 # --- SESSION STATE INITIALIZATION ---
-if 'logs' not in st.session_state:
-    st.session_state['logs'] = []
+if 'log_store' not in st.session_state:
+    st.session_state['log_store'] = LogStore()
+log_store = st.session_state['log_store']
+LOG_PAGE_SIZE = int(os.environ.get('DASHBOARD_LOG_PAGE_SIZE', '200'))
 if 'run_simulation' not in st.session_state:
     st.session_state['run_simulation'] = False
+if 'trigger_coordinator' not in st.session_state:
+    st.session_state['trigger_coordinator'] = TriggerCoordinator()
+coordinator = st.session_state['trigger_coordinator']
+if 'sales_ledger' not in st.session_state:
+    st.session_state['sales_ledger'] = SalesLedger().start()
+sales_ledger = st.session_state['sales_ledger']
+
+def _agent_job_handler(agent_events):
+    """Worker-side job: runs the agent and forwards its stream events to the script thread."""
+    def handle(event):
+        return agent_brain.lambda_handler(event, {}, on_event=lambda ev: agent_events.put((event, ev)))
+    return handle
+
+# Agent runs go through a prioritized queue drained by background workers,
+# so a slow agent never blocks the simulation loop.
+if 'agent_workers' not in st.session_state:
+    st.session_state['agent_events'] = Queue()
+    st.session_state['agent_thinking'] = {}
+    st.session_state['agent_queue'] = job_queue.JobQueue(os.environ.get('AGENT_QUEUE_PATH', ':memory:'))
+    st.session_state['agent_workers'] = job_queue.WorkerPool(
+        st.session_state['agent_queue'], _agent_job_handler(st.session_state['agent_events'])).start()
+agent_queue = st.session_state['agent_queue']
+agent_workers = st.session_state['agent_workers']
 
 # --- UI SETUP ---
 st.set_page_config(page_title="Enterprise AI System", layout="wide", page_icon="⚡")
@@ -39,55 +80,127 @@ col_main, col_logs = st.columns([2, 1])
 # LOG PANEL (Global Access)
 with col_logs:
     st.subheader("📜 System Logs & Notifications")
-    log_placeholder = st.empty()
+    f_level, f_page = st.columns(2)
+    min_severity = {name: level for level, name in SEVERITY_NAMES.items()}[
+        f_level.selectbox("Severity", list(SEVERITY_NAMES.values()), index=0)]
+    log_page = int(f_page.number_input("Page (0 = newest)", min_value=0, value=0, step=1))
+    log_placeholder = st.container(height=750).empty()
+    log_query = st.text_input("🔎 Search full history")
+    if log_query:
+        matches = log_store.search(log_query, min_severity=min_severity)
+        with st.expander(f"{len(matches)} match(es) for '{log_query}'", expanded=True):
+            st.code("\n".join(record.format() for record in matches) or "No matches.", language=None)
 
 # --- HELPER FUNCTIONS ---
 
+_rendered = {"seq": None}  # Last log record drawn in this script run
+
 def render_logs():
-    """Refreshes the log panel immediately."""
-    log_text = "\n".join(st.session_state['logs'])
-    log_placeholder.text_area("Console Output", value=log_text, height=750, key=f"log_{time.time()}")
+    """Refreshes the log panel: one bounded page, and only when something new was logged."""
+    if _rendered["seq"] == log_store.last_seq:
+        return
+    records = log_store.page(min_severity, page=log_page, page_size=LOG_PAGE_SIZE)
+    log_placeholder.code("\n".join(record.format() for record in records) or "No log records.", language=None)
+    _rendered["seq"] = log_store.last_seq
 
 def log_event(message, type="INFO"):
     """Logs events to both terminal and UI."""
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    formatted_msg = f"[{timestamp}] [{type}] {message}"
-    print(formatted_msg)
-    st.session_state['logs'].append(formatted_msg)
+    record = log_store.append(message, type)
+    print(record.format())
     render_logs()
 
 def get_product_state():
-    """Fetches real-time data with Strong Consistency."""
+    """
+    Fetches real-time data through the shared product cache. Sales the ledger has not
+    folded into the table yet are applied to the stock shown (the cached item is not modified).
+    """
     try:
-        response = product_table.get_item(Key={'drug_id': PRODUCT_ID}, ConsistentRead=True)
-        return response.get('Item', {})
+        data = shared_cache.get_item(product_table, PRODUCT_ID, consistency=READ_CONSISTENCY) or {}
+        delta = sales_ledger.pending_stock_delta(PRODUCT_ID)
+        if data and delta and data.get('stock_level') is not None:
+            data = dict(data, stock_level=data['stock_level'] + delta)
+        return data
     except Exception as e:
         log_event(f"Db Error: {e}", "ERROR")
         return {}
 
-def trigger_ai_agent(reason):
-    """Triggers the AI Brain."""
-    log_event(f"🤖 AI AGENT TRIGGERED! Reason: {reason}", "AI-ACTION")
-    
-    with st.spinner('AI Agent is analyzing market & profitability...'):
-        result = agent_brain.lambda_handler({"trigger_reason": reason}, {})
-        
-        if result['statusCode'] == 200:
+def trigger_ai_agent(reason, snapshot=None, episode_id=None):
+    """Queues an AI Brain run. 'snapshot' is the product state we already read this tick. False if the queue is full."""
+    event = {"trigger_reason": reason, "product_id": PRODUCT_ID}
+    if episode_id:
+        event["episode_id"] = episode_id
+    if snapshot:
+        event["product_snapshot"] = tools.to_native(snapshot)
+
+    try:
+        # Never block the simulation loop: a full queue drops the trigger, the next tick re-fires it
+        agent_queue.send_message(event, priority=job_queue.priority_for(reason), timeout=0)
+    except job_queue.QueueFull as e:
+        log_event(f"🚦 BACKPRESSURE: {e}. Trigger '{reason}' deferred.", "WARNING")
+        return False
+    log_event(f"🤖 AI AGENT TRIGGERED! Reason: {reason} (queued)", "AI-ACTION")
+    return True
+
+def drain_agent_activity():
+    """Logs stream events and results of the queued agent runs. Returns how many runs finished."""
+    thinking = st.session_state['agent_thinking']
+    events = st.session_state['agent_events']
+    while True:
+        try:
+            job, ev = events.get_nowait()
+        except Empty:
+            break
+        key = job.get("episode_id")
+        if ev["type"] == streaming.TEXT:
+            thinking[key] = thinking.get(key, "") + ev["text"]
+        elif ev["type"] == streaming.TOOL_DISPATCHED:
+            log_event(f"🔧 Tool started: {ev['name']} {json.dumps(ev['input'])}", "AI-TOOL")
+        elif ev["type"] == streaming.TOOL_INVALID:
+            log_event(f"⚠️ Tool skipped: {ev['name']} ({ev['error']})", "AI-TOOL")
+        elif ev["type"] == streaming.TOOL_RESULT:
+            outcome = ev["result"].get("status") or ev["result"].get("error") or "ok"
+            log_event(f"📦 Tool finished: {ev['name']} -> {outcome}", "AI-TOOL")
+        elif ev["type"] == streaming.TURN_END and thinking.get(key):
+            log_event(f"💭 {thinking.pop(key).strip()}", "AI-THINK")
+
+    finished = agent_workers.drain()
+    for job in finished:
+        event, result = job["body"], job["result"]
+        if job["status"] == job_queue.LEASE_LOST:
+            # Another receive of the same job reports it and closes the trigger
+            log_event(f"⚠️ Agent run for {event['trigger_reason']} outlived its queue lease; result discarded", "AI-FAIL")
+            continue
+        succeeded = job["status"] == job_queue.SUCCEEDED
+        coordinator.complete(event["product_id"], event["trigger_reason"], succeeded)
+        if succeeded:
             report = json.loads(result['body'])
-            log_event(f"✅ ACTION REPORT: {report}", "AI-SUCCESS")
-            return True
+            path = "⚡ FAST-PATH" if result.get('path') == "fast_path" else "🧠 LLM"
+            usage = result.get('metrics', {})
+            log_event(f"✅ ACTION REPORT [{path} | {usage.get('turns', 0)} turns, "
+                      f"{usage.get('total_tokens', 0)} tokens, queued {job['queue_wait_ms']:.0f} ms]: {report}", "AI-SUCCESS")
         else:
-            log_event(f"❌ EXECUTION FAILED: {result['body']}", "AI-FAIL")
-            return False
+            log_event(f"❌ EXECUTION FAILED after {job['attempts']} attempt(s), dead-lettered: {job['error']}", "AI-FAIL")
+    return len(finished)
 
-def update_stock(amount):
-    """Simulates sales transaction."""
+def escalate_anomaly(reason, alert_message, snapshot):
+    """Routes a detected anomaly through the trigger coordinator. Returns True if an agent run was queued."""
+    outcome, episode_id = coordinator.admit(PRODUCT_ID, reason, snapshot)
+    if outcome != EXECUTED:
+        return False
+    # The agent's guards read the table: fold pending sales first so it sees the stock we saw
+    sales_ledger.fold_stock()
+    log_event(alert_message, "ALERT")
+    if not trigger_ai_agent(reason, snapshot, episode_id):
+        coordinator.complete(PRODUCT_ID, reason, success=False)
+        return False
+    return True
+
+def update_stock(amount, unit_price=None):
+    """Simulates sales transaction. 'amount' is negative for units sold."""
     try:
-        product_table.update_item(
-            Key={'drug_id': PRODUCT_ID},
-            UpdateExpression="set stock_level = stock_level + :val",
-            ExpressionAttributeValues={':val': Decimal(amount)}
-        )
+        # Buffered: the ledger's size/age thresholds and background flusher do the writes,
+        # and get_product_state() shows the pending stock change on top of the last read.
+        sales_ledger.record_sale(PRODUCT_ID, -amount, unit_price=unit_price)
         return True
     except Exception as e:
         log_event(f"Update Error: {e}", "ERROR")
@@ -122,6 +235,19 @@ with col_main:
                 # 4. Stock Level
                 stock = data.get('stock_level')
                 c4.metric("Stock", f"{stock}", delta="-LOW" if stock < 1500 else "Safe")
+
+                cache_stats = shared_cache.stats()
+                trigger_stats = coordinator.stats()
+                queue_depth = agent_queue.depth()
+                notify_stats = notifications.shared_dispatcher.snapshot()
+                st.caption(f"Product cache: {cache_stats['hit_rate']:.0%} hit rate "
+                           f"({cache_stats['hits']} hits / {cache_stats['misses']} misses, "
+                           f"{cache_stats['db_reads']} DB reads) · Triggers: "
+                           f"{trigger_stats['executed']} executed / {trigger_stats['suppressed']} suppressed · "
+                           f"Agent queue: {queue_depth['waiting']} waiting / {queue_depth['in_flight']} running / "
+                           f"{queue_depth['dead_letters']} dead-lettered · "
+                           f"Decision cache: {shared_decisions.stats()['hit_rate']:.0%} hit rate · "
+                           f"Notifications: {notify_stats['pending']} pending / {notify_stats['digests_sent']} digest(s) sent")
                 return data
         return {}
 
@@ -154,7 +280,8 @@ with col_main:
                 status_text.warning("Stopped.")
                 break
             
-            # 1. Refresh Data
+            # 1. Refresh Data (after logging what the background agent finished)
+            drain_agent_activity()
             data = update_metrics_display()
             my_price = float(data.get('current_price', 0))
             comp_price = float(data.get('competitor_price', 0))
@@ -173,22 +300,24 @@ with col_main:
             else:
                 # Price is competitive -> Sell!
                 sale_amount = random.randint(50, 150) * -1
-                update_stock(sale_amount)
+                update_stock(sale_amount, unit_price=my_price)
                 log_event(f"💰 Transaction: Sold {abs(sale_amount)} units.", "SALES")
             
             # 3. Guard Rails (Triggers)
+            # The coordinator drops repeats of an anomaly the agent is already handling
+            # (in flight, cooling down, or unchanged since the last successful run).
+            if stock >= 1500:
+                coordinator.resolve(PRODUCT_ID, "Low Stock")
+            if comp_price >= my_price:
+                coordinator.resolve(PRODUCT_ID, "Price Disadvantage")
             
-            # Crisis A: Low Stock
+            # Crisis A: Low Stock (queued ahead of price work)
             if stock < 1500:
-                log_event(f"⚠️ Anomaly: Low Stock ({stock})", "ALERT")
-                trigger_ai_agent("Low Stock")
-                update_metrics_display() 
+                escalate_anomaly("Low Stock", f"⚠️ Anomaly: Low Stock ({stock})", data)
             
             # Crisis B: Price Disadvantage
             elif comp_price < my_price:
-                log_event(f"⚠️ Anomaly: Price Disadvantage Detected", "ALERT")
-                trigger_ai_agent("Price Disadvantage")
-                update_metrics_display() 
+                escalate_anomaly("Price Disadvantage", f"⚠️ Anomaly: Price Disadvantage Detected", data)
 
             time.sleep(1.5)
 
@@ -200,29 +329,37 @@ with col_main:
     
     with col_m1:
         if st.button("📦 Simulate: Stockout", use_container_width=True):
-            product_table.update_item(Key={'drug_id': PRODUCT_ID}, UpdateExpression="set stock_level=:s", ExpressionAttributeValues={':s': Decimal(50)})
+            sales_ledger.fold_stock()  # Pending sales must not land on top of the injected level
+            rate_limiter.call(product_writes, product_table.update_item, Key={'drug_id': PRODUCT_ID}, UpdateExpression="set stock_level=:s", ExpressionAttributeValues={':s': Decimal(50)})
+            shared_cache.invalidate(PRODUCT_ID)
             log_event("🚨 INJECTED: Critical Stockout (50 Units)", "CRISIS")
             st.rerun()
 
     with col_m2:
         # DROP COMPETITOR BY 20 EACH CLICK
         if st.button("📉 Simulate: Drop Competitor (-20 TL)", use_container_width=True):
-            product_table.update_item(
+            rate_limiter.call(
+                product_writes, product_table.update_item,
                 Key={'drug_id': PRODUCT_ID}, 
                 UpdateExpression="set competitor_price = competitor_price - :val", 
                 ExpressionAttributeValues={':val': Decimal(20)}
             )
+            shared_cache.invalidate(PRODUCT_ID)
             log_event("📉 INJECTED: Competitor dropped price by 20 TL", "CRISIS")
             st.rerun() # Instant Refresh
             
     with col_m3:
         if st.button("🔄 Factory Reset", use_container_width=True):
-            product_table.update_item(
+            sales_ledger.fold_stock()
+            rate_limiter.call(
+                product_writes, product_table.update_item,
                 Key={'drug_id': PRODUCT_ID},
                 UpdateExpression="set stock_level=:s, current_price=:p, competitor_price=:cp",
                 ExpressionAttributeValues={':s': Decimal(3000), ':p': Decimal(120), ':cp': Decimal(130)}
             )
-            st.session_state['logs'] = []
+            shared_cache.invalidate(PRODUCT_ID)
+            log_store.clear()
             st.rerun()
 
+drain_agent_activity()
 render_logs()
\ No newline at end of file
@@ -0,0 +1,232 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal, ROUND_FLOOR
+
+import policy_engine
+import tools
+
+# --- CONFIGURATION ---
+DEFAULT_TTL_SECONDS = float(os.environ.get("DECISION_CACHE_TTL", "900"))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("DECISION_CACHE_SIZE", "1024"))
+DEFAULT_PATH = os.environ.get("DECISION_CACHE_PATH")  # SQLite file; unset = memory only
+PRICE_QUANTUM = Decimal(os.environ.get("DECISION_PRICE_QUANTUM", "0.01"))
+STOCK_QUANTUM = int(os.environ.get("DECISION_STOCK_QUANTUM", "100"))
+
+# State that decides each trigger; anything else does not change the plan
+STATE_FIELDS = {
+    policy_engine.LOW_STOCK: ("stock_level",),
+    policy_engine.PRICE_DISADVANTAGE: ("current_price", "competitor_price", "cost_price"),
+    policy_engine.PROFIT_PROTECTION: ("current_price", "cost_price"),
+}
+DEFAULT_STATE_FIELDS = ("stock_level", "current_price", "competitor_price", "cost_price")
+
+# Tools that only read; they are not part of a plan
+READ_ONLY_TOOLS = ("get_product_market_data",)
+# Tool outcomes that make a run unfit for caching, and a replay a failure (stale or duplicate guard)
+UNCACHEABLE_STATUSES = ("skipped",)
+
+SCHEMA = "CREATE TABLE IF NOT EXISTS decisions (key TEXT PRIMARY KEY, plan TEXT NOT NULL, created_at REAL NOT NULL)"
+
+
+def _quantize(field, value):
+    """Bucket index of a state field (so 120, 120.0 and Decimal('120.00') share a key)."""
+    value = policy_engine._to_decimal(value)
+    if value is None:
+        return "-"
+    quantum = STOCK_QUANTUM if field == "stock_level" else PRICE_QUANTUM
+    return str(int((value / quantum).to_integral_value(rounding=ROUND_FLOOR)))
+
+def state_key(product_id, trigger_reason, product):
+    """(product, trigger, quantized state) -> cache key."""
+    fields = STATE_FIELDS.get(trigger_reason, DEFAULT_STATE_FIELDS)
+    state = ",".join(f"{field}={_quantize(field, product.get(field))}" for field in fields)
+    return f"{product_id}|{trigger_reason}|{state}"
+
+
+# --- PLANS ---
+
+def _refused(result):
+    """True if a tool call errored or its guard refused the action."""
+    return not isinstance(result, dict) or "error" in result or result.get("status") in UNCACHEABLE_STATUSES
+
+def plan_from_run(product, tool_calls, summary):
+    """
+    Action plan of a finished LLM run, or None if it must not be reused.
+    tool_calls: [(tool_name, inputs, result)] in execution order.
+    """
+    steps = []
+    for name, inputs, result in tool_calls:
+        if name in READ_ONLY_TOOLS:
+            continue
+        if _refused(result):
+            return None
+        if name == "update_product_price" and not _above_floor(inputs.get("new_price"), product):
+            return None
+        steps.append({"tool": name, "input": {k: v for k, v in inputs.items() if k != "episode_id"}})
+    return {"steps": steps, "summary": summary}
+
+def _above_floor(price, product):
+    cost = policy_engine._to_decimal(product.get('cost_price'))
+    price = policy_engine._to_decimal(price)
+    if cost is None or cost <= 0:
+        return True  # No cost on record: the tool's own checks apply
+    return price is not None and price >= policy_engine.floor_price_for(cost)
+
+def _bind(step, product):
+    """Adapts a cached step to the current snapshot. Returns the tool inputs, or None if it fails the rules."""
+    inputs = dict(step["input"])
+    if step["tool"] == "update_product_price":
+        if not _above_floor(inputs.get("new_price"), product):
+            return None
+        if product.get('competitor_price') is not None:
+            # The price guard checks the market we are looking at now
+            inputs["expected_competitor_price"] = float(product['competitor_price'])
+    elif step["tool"] == "create_restock_order":
+        stock = policy_engine._to_decimal(product.get('stock_level'))
+        if stock is not None:
+            # The stock bucket spans STOCK_QUANTUM units: still lift stock back over the threshold
+            inputs["quantity"] = max(int(inputs["quantity"]), int(policy_engine.LOW_STOCK_THRESHOLD - stock) + 1)
+    return inputs
+
+def replay(plan, product, episode_id=None):
+    """Runs a cached plan against the tools. Returns (success, summary)."""
+    bound = [(step["tool"], _bind(step, product)) for step in plan["steps"]]
+    if any(inputs is None for _, inputs in bound):
+        return False, "Cached plan no longer satisfies the pricing rules"
+    for name, inputs in bound:
+        result = tools.execute_tool_router(name, inputs, episode_id=episode_id)
+        if _refused(result):
+            return False, f"{name} failed on replay: {result.get('error') or result.get('reason') if isinstance(result, dict) else result}"
+    return True, plan["summary"]
+
+
+# --- CACHE ---
+
+class DecisionCache:
+    """
+    Thread-safe LRU + TTL map of state_key -> action plan, optionally backed by SQLite
+    (write-through; read-through on a memory miss) so plans survive restarts.
+    """
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES, path=DEFAULT_PATH):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (created_at, plan)
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute(SCHEMA)
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.replay_failures = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute("SELECT created_at, plan FROM decisions WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    entry = (row[0], json.loads(row[1]))
+                    self._remember(key, entry)
+            if entry is not None and now - entry[0] > self.ttl_seconds:
+                self._drop(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, plan):
+        entry = (time.time(), plan)
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO decisions (key, plan, created_at) VALUES (?, ?, ?)",
+                                 (key, json.dumps(plan, cls=tools.DecimalEncoder), entry[0]))
+            self.stores += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM decisions")
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM decisions WHERE key = ?", (key,))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "stores": self.stores,
+                "replay_failures": self.replay_failures,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+            }
+
+    # --- AGENT HOOKS ---
+
+    def run_cached(self, product_id, trigger_reason, product, episode_id=None):
+        """
+        Replays the plan cached for this state. Returns a lambda-style response dict,
+        or None when there is no usable plan and the LLM loop must run.
+        """
+        key = state_key(product_id, trigger_reason, product)
+        plan = self.get(key)
+        if plan is None:
+            return None
+        print(f"   🗂️ [MEMO] Known state for '{trigger_reason}' -> replaying {len(plan['steps'])} cached step(s)")
+        success, summary = replay(plan, product, episode_id=episode_id)
+        if not success:
+            print(f"   ↪️ [MEMO] {summary}. Dropping the plan.")
+            with self._lock:
+                self.replay_failures += 1
+            self.invalidate(key)
+            return None
+        return {
+            'statusCode': 200,
+            'body': json.dumps(summary),
+            'path': "decision_cache",
+            'metrics': {"turns": 0, "input_tokens": 0, "output_tokens": 0, "total_tokens": 0},
+        }
+
+    def remember(self, product_id, trigger_reason, product, tool_calls, summary):
+        """Caches the plan of a successful LLM run. Returns True if it was cacheable."""
+        plan = plan_from_run(product, tool_calls, summary)
+        if plan is None:
+            return False
+        self.put(state_key(product_id, trigger_reason, product), plan)
+        return True
+
+
+# Process-wide instance used by lambda_function.py
+shared_decisions = DecisionCache()
@@ -0,0 +1,141 @@
+import math
+import os
+import threading
+import time
+
+# --- CONFIGURATION ---
+# Velocity is tracked in units per second; the planning parameters below turn it into
+# reorder points and order quantities. All values can be tuned per deployment.
+EWMA_HALF_LIFE_SECONDS = float(os.environ.get("DEMAND_HALF_LIFE_SECONDS", "900"))
+BUCKET_SECONDS = float(os.environ.get("DEMAND_BUCKET_SECONDS", "60"))
+WINDOW_BUCKETS = int(os.environ.get("DEMAND_WINDOW_BUCKETS", "60"))
+LEAD_TIME_SECONDS = float(os.environ.get("RESTOCK_LEAD_TIME_SECONDS", "3600"))
+SERVICE_LEVEL_Z = float(os.environ.get("RESTOCK_SERVICE_LEVEL_Z", "1.65"))      # ~95% cycle service level
+ORDER_COST = float(os.environ.get("RESTOCK_ORDER_COST", "50"))                   # Fixed cost per PO (TL)
+HOLDING_COST_RATE = float(os.environ.get("RESTOCK_HOLDING_COST_RATE", "0.25"))   # Per unit per year, fraction of cost_price
+MIN_ORDER_QUANTITY = int(os.environ.get("RESTOCK_MIN_QUANTITY", "100"))
+MAX_ORDER_QUANTITY = int(os.environ.get("RESTOCK_MAX_QUANTITY", "50000"))
+MIN_OBSERVATIONS = 5
+SECONDS_PER_YEAR = 365 * 24 * 3600
+
+_DECAY_RATE = math.log(2) / EWMA_HALF_LIFE_SECONDS
+
+
+class SkuDemand:
+    """
+    Streaming demand state of one SKU. Every update is O(1):
+    - an exponentially decayed unit count gives the EWMA sales velocity,
+    - a fixed ring of time buckets with running sum / sum of squares gives the
+      rolling mean and variance used for safety stock.
+    """
+    __slots__ = ("decayed_units", "last_ts", "observations", "total_units",
+                 "buckets", "bucket_index", "bucket_start", "window_sum", "window_sq_sum")
+
+    def __init__(self, now):
+        self.decayed_units = 0.0
+        self.last_ts = now
+        self.observations = 0
+        self.total_units = 0.0
+        self.buckets = [0.0] * WINDOW_BUCKETS
+        self.bucket_index = 0
+        self.bucket_start = now
+        self.window_sum = 0.0
+        self.window_sq_sum = 0.0
+
+    def _advance(self, now):
+        """Rolls the bucket ring forward to 'now' (at most WINDOW_BUCKETS steps)."""
+        steps = int((now - self.bucket_start) // BUCKET_SECONDS)
+        if steps <= 0:
+            return
+        for _ in range(min(steps, WINDOW_BUCKETS)):
+            self.bucket_index = (self.bucket_index + 1) % WINDOW_BUCKETS
+            old = self.buckets[self.bucket_index]
+            self.window_sum -= old
+            self.window_sq_sum -= old * old
+            self.buckets[self.bucket_index] = 0.0
+        self.bucket_start += steps * BUCKET_SECONDS
+
+    def observe(self, units, now):
+        self.decayed_units = self.decayed_units * math.exp(-_DECAY_RATE * max(now - self.last_ts, 0.0)) + units
+        self.last_ts = now
+        self.observations += 1
+        self.total_units += units
+
+        self._advance(now)
+        old = self.buckets[self.bucket_index]
+        new = old + units
+        self.buckets[self.bucket_index] = new
+        self.window_sum += units
+        self.window_sq_sum += new * new - old * old
+
+    def velocity(self, now):
+        """EWMA sales velocity in units per second."""
+        decayed = self.decayed_units * math.exp(-_DECAY_RATE * max(now - self.last_ts, 0.0))
+        return decayed * _DECAY_RATE
+
+    def bucket_stats(self, now):
+        """Rolling mean and standard deviation of units per bucket."""
+        self._advance(now)
+        mean = self.window_sum / WINDOW_BUCKETS
+        variance = max(self.window_sq_sum / WINDOW_BUCKETS - mean * mean, 0.0)
+        return mean, math.sqrt(variance)
+
+
+class DemandTracker:
+    """Per-SKU demand velocity and reorder recommendations, shared across the process."""
+
+    def __init__(self):
+        self._skus = {}
+        self._lock = threading.Lock()
+
+    def observe(self, product_id, units, now=None):
+        """Records units sold for a product. Constant time."""
+        now = time.time() if now is None else now
+        with self._lock:
+            sku = self._skus.get(product_id)
+            if sku is None:
+                sku = self._skus[product_id] = SkuDemand(now)
+            sku.observe(float(units), now)
+
+    def metrics(self, product_id, stock_level=None, cost_price=None, now=None):
+        """
+        Returns demand metrics and a recommended restock quantity, or None while there is
+        not enough sales history to trust them.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            sku = self._skus.get(product_id)
+            if sku is None or sku.observations < MIN_OBSERVATIONS:
+                return None
+            velocity = sku.velocity(now)
+            bucket_mean, bucket_std = sku.bucket_stats(now)
+
+        lead_buckets = LEAD_TIME_SECONDS / BUCKET_SECONDS
+        lead_time_demand = velocity * LEAD_TIME_SECONDS
+        safety_stock = SERVICE_LEVEL_Z * bucket_std * math.sqrt(lead_buckets)
+        reorder_point = lead_time_demand + safety_stock
+
+        result = {
+            "velocity_per_hour": round(velocity * 3600, 2),
+            "window_units_per_bucket": round(bucket_mean, 2),
+            "window_std_per_bucket": round(bucket_std, 2),
+            "lead_time_demand": round(lead_time_demand),
+            "safety_stock": round(safety_stock),
+            "reorder_point": round(reorder_point),
+        }
+
+        if cost_price is not None and float(cost_price) > 0 and velocity > 0:
+            annual_demand = velocity * SECONDS_PER_YEAR
+            holding_cost = HOLDING_COST_RATE * float(cost_price)
+            result["economic_order_quantity"] = round(math.sqrt(2 * annual_demand * ORDER_COST / holding_cost))
+
+        if stock_level is not None:
+            # Order at least the EOQ, and always enough to clear the reorder point
+            shortfall = reorder_point - float(stock_level)
+            quantity = max(result.get("economic_order_quantity", 0), math.ceil(shortfall))
+            result["recommended_order_quantity"] = int(min(max(quantity, MIN_ORDER_QUANTITY), MAX_ORDER_QUANTITY))
+        return result
+
+
+# Process-wide instance fed by sales_ledger.py and read by tools.py / policy_engine.py
+tracker = DemandTracker()
@@ -0,0 +1,359 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+
+import policy_engine
+
+# --- CONFIGURATION ---
+DEFAULT_MAX_DEPTH = int(os.environ.get("AGENT_QUEUE_MAX_DEPTH", "100"))
+DEFAULT_VISIBILITY_TIMEOUT = float(os.environ.get("AGENT_QUEUE_VISIBILITY_TIMEOUT", "120"))
+DEFAULT_MAX_RECEIVES = int(os.environ.get("AGENT_QUEUE_MAX_RECEIVES", "3"))  # Then the job goes to the dead-letter store
+DEFAULT_WORKERS = int(os.environ.get("AGENT_QUEUE_WORKERS", "2"))
+RETRY_BASE_SECONDS = float(os.environ.get("AGENT_QUEUE_RETRY_BASE", "2"))
+
+# --- PRIORITY CLASSES (lower is served first) ---
+PRIORITY_STOCKOUT = 0
+PRIORITY_PRICE = 1
+PRIORITY_DEFAULT = 2
+
+TRIGGER_PRIORITY = {
+    policy_engine.LOW_STOCK: PRIORITY_STOCKOUT,
+    policy_engine.PRICE_DISADVANTAGE: PRIORITY_PRICE,
+    policy_engine.PROFIT_PROTECTION: PRIORITY_PRICE,
+}
+
+# --- RESULT STATUSES (WorkerPool.results) ---
+SUCCEEDED = "succeeded"
+DEAD_LETTERED = "dead_lettered"
+LEASE_LOST = "lease_lost"  # Outcome came after the visibility timeout; another receive owns the job now
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    message_id     TEXT PRIMARY KEY,
+    priority       INTEGER NOT NULL,
+    body           TEXT NOT NULL,
+    enqueued_at    REAL NOT NULL,
+    visible_at     REAL NOT NULL,
+    receive_count  INTEGER NOT NULL DEFAULT 0,
+    first_received REAL,
+    receipt_handle TEXT,
+    last_error     TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_ready ON messages (priority, visible_at, enqueued_at);
+CREATE TABLE IF NOT EXISTS dead_letters (
+    message_id    TEXT PRIMARY KEY,
+    priority      INTEGER NOT NULL,
+    body          TEXT NOT NULL,
+    enqueued_at   REAL NOT NULL,
+    failed_at     REAL NOT NULL,
+    receive_count INTEGER NOT NULL,
+    last_error    TEXT
+);
+"""
+
+
+def priority_for(trigger_reason):
+    return TRIGGER_PRIORITY.get(trigger_reason, PRIORITY_DEFAULT)
+
+
+class QueueFull(Exception):
+    """The queue is at max_depth and the producer's wait ran out."""
+
+
+class Message:
+    """One received job. receipt_handle is only valid until the visibility timeout expires."""
+    __slots__ = ("message_id", "receipt_handle", "body", "priority", "receive_count", "enqueued_at", "first_received")
+
+    def __init__(self, message_id, receipt_handle, body, priority, receive_count, enqueued_at, first_received):
+        self.message_id = message_id
+        self.receipt_handle = receipt_handle
+        self.body = body
+        self.priority = priority
+        self.receive_count = receive_count
+        self.enqueued_at = enqueued_at
+        self.first_received = first_received
+
+    @property
+    def queue_wait_ms(self):
+        return round((self.first_received - self.enqueued_at) * 1000, 1)
+
+
+class JobQueue:
+    """
+    Local agent job queue with an SQS-style interface (send_message / receive_message /
+    delete_message / change_message_visibility), stored in SQLite (":memory:" by default,
+    a file path to survive restarts).
+    - Messages are served by priority class, then FIFO.
+    - A received message is hidden for visibility_timeout; unless it is deleted it comes back.
+    - A message received max_receives times without being deleted moves to the dead-letter store.
+    - Depth (waiting + in flight) is bounded by max_depth: producers wait or get QueueFull.
+    """
+
+    def __init__(self, path=":memory:", max_depth=DEFAULT_MAX_DEPTH,
+                 visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT, max_receives=DEFAULT_MAX_RECEIVES):
+        self.max_depth = max_depth
+        self.visibility_timeout = visibility_timeout
+        self.max_receives = max_receives
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.executescript(SCHEMA)
+        self._cond = threading.Condition()
+        self._expired = deque(maxlen=1000)  # Dead-lettered by _claim, not yet reported (see take_expired)
+        self.stats = {"sent": 0, "received": 0, "deleted": 0, "retried": 0,
+                      "dead_lettered": 0, "rejected": 0, "producer_wait_ms": 0.0}
+
+    # --- PRODUCERS ---
+
+    def send_message(self, body, priority=PRIORITY_DEFAULT, delay_seconds=0, timeout=None):
+        """
+        Enqueues a JSON-serializable job and returns its message_id. When the queue is full,
+        waits up to 'timeout' seconds for room (None = forever, 0 = fail at once) and then
+        raises QueueFull.
+        """
+        payload = json.dumps(body, default=str)
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        with self._cond:
+            while self._depth() >= self.max_depth:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self.stats["rejected"] += 1
+                    raise QueueFull(f"Agent job queue is full ({self.max_depth} jobs)")
+                self._cond.wait(remaining)
+            self.stats["producer_wait_ms"] += round((time.monotonic() - started) * 1000, 3)
+
+            message_id = uuid.uuid4().hex
+            now = time.time()
+            self._db.execute("INSERT INTO messages (message_id, priority, body, enqueued_at, visible_at) "
+                             "VALUES (?, ?, ?, ?, ?)", (message_id, priority, payload, now, now + delay_seconds))
+            self.stats["sent"] += 1
+            self._cond.notify_all()
+        return message_id
+
+    # --- CONSUMERS ---
+
+    def receive_message(self, max_messages=1, visibility_timeout=None, wait_seconds=0):
+        """
+        Returns up to max_messages visible Messages, highest priority first. Long-polls for
+        up to wait_seconds when nothing is ready.
+        """
+        visibility_timeout = self.visibility_timeout if visibility_timeout is None else visibility_timeout
+        deadline = time.monotonic() + wait_seconds
+        with self._cond:
+            while True:
+                messages = self._claim(max_messages, visibility_timeout)
+                remaining = deadline - time.monotonic()
+                if messages or remaining <= 0:
+                    return messages
+                # Wake up for new messages, or when the next hidden one becomes visible again
+                next_visible = self._db.execute("SELECT MIN(visible_at) FROM messages").fetchone()[0]
+                if next_visible is not None:
+                    remaining = min(remaining, max(next_visible - time.time(), 0.01))
+                self._cond.wait(remaining)
+
+    def _claim(self, max_messages, visibility_timeout):
+        now = time.time()
+        rows = self._db.execute(
+            "SELECT message_id, priority, body, enqueued_at, receive_count, first_received, last_error FROM messages "
+            "WHERE visible_at <= ? ORDER BY priority, enqueued_at LIMIT ?", (now, max_messages)).fetchall()
+        messages = []
+        for message_id, priority, body, enqueued_at, receive_count, first_received, last_error in rows:
+            if receive_count >= self.max_receives:
+                # Never deleted after max_receives attempts (e.g. the worker died)
+                error = last_error or "Visibility timeout expired"
+                self._move_to_dead_letters(message_id, error)
+                self._expired.append({"message_id": message_id, "body": json.loads(body), "attempts": receive_count,
+                                      "error": error, "enqueued_at": enqueued_at})
+                continue
+            handle = uuid.uuid4().hex
+            first_received = first_received or now
+            self._db.execute("UPDATE messages SET receive_count = receive_count + 1, receipt_handle = ?, "
+                             "visible_at = ?, first_received = ? WHERE message_id = ?",
+                             (handle, now + visibility_timeout, first_received, message_id))
+            messages.append(Message(message_id, handle, json.loads(body), priority,
+                                    receive_count + 1, enqueued_at, first_received))
+        self.stats["received"] += len(messages)
+        return messages
+
+    def delete_message(self, receipt_handle):
+        """Acknowledges a processed message. False if the handle is stale (the message came back)."""
+        with self._cond:
+            deleted = self._db.execute("DELETE FROM messages WHERE receipt_handle = ?", (receipt_handle,)).rowcount
+            if deleted:
+                self.stats["deleted"] += 1
+                self._cond.notify_all()  # Room for waiting producers
+            return bool(deleted)
+
+    def change_message_visibility(self, receipt_handle, visibility_timeout, error=None):
+        """
+        Hides an in-flight message for visibility_timeout more seconds (0 = release it now,
+        i.e. retry). 'error' is kept for the dead-letter record.
+        """
+        with self._cond:
+            updated = self._db.execute(
+                "UPDATE messages SET visible_at = ?, last_error = COALESCE(?, last_error) WHERE receipt_handle = ?",
+                (time.time() + visibility_timeout, error, receipt_handle)).rowcount
+            if updated and error is not None:
+                self.stats["retried"] += 1
+            self._cond.notify_all()
+            return bool(updated)
+
+    def dead_letter(self, receipt_handle, error):
+        """Moves an in-flight message to the dead-letter store right away (retries exhausted)."""
+        with self._cond:
+            row = self._db.execute("SELECT message_id FROM messages WHERE receipt_handle = ?", (receipt_handle,)).fetchone()
+            if row is None:
+                return False
+            self._move_to_dead_letters(row[0], error)
+            return True
+
+    def _move_to_dead_letters(self, message_id, error):
+        self._db.execute("INSERT OR REPLACE INTO dead_letters "
+                         "SELECT message_id, priority, body, enqueued_at, ?, receive_count, ? FROM messages "
+                         "WHERE message_id = ?", (time.time(), error, message_id))
+        self._db.execute("DELETE FROM messages WHERE message_id = ?", (message_id,))
+        self.stats["dead_lettered"] += 1
+        self._cond.notify_all()  # Room for waiting producers
+
+    def take_expired(self):
+        """
+        Messages dead-lettered because their last receive expired (no consumer reported an outcome).
+        Each is returned once, so the owner of the job can still close it (see WorkerPool).
+        """
+        with self._cond:
+            expired = list(self._expired)
+            self._expired.clear()
+        return expired
+
+    # --- DEAD LETTERS & INSPECTION ---
+
+    def dead_letters(self, limit=100):
+        with self._cond:
+            rows = self._db.execute("SELECT message_id, priority, body, failed_at, receive_count, last_error "
+                                    "FROM dead_letters ORDER BY failed_at DESC LIMIT ?", (limit,)).fetchall()
+        return [{"message_id": message_id, "priority": priority, "body": json.loads(body), "failed_at": failed_at,
+                 "receive_count": receive_count, "last_error": last_error}
+                for message_id, priority, body, failed_at, receive_count, last_error in rows]
+
+    def redrive_dead_letters(self):
+        """Puts every dead-lettered job back on the queue with a fresh receive count. Returns the count."""
+        with self._cond:
+            now = time.time()
+            moved = self._db.execute("INSERT INTO messages (message_id, priority, body, enqueued_at, visible_at) "
+                                     "SELECT message_id, priority, body, ?, ? FROM dead_letters", (now, now)).rowcount
+            self._db.execute("DELETE FROM dead_letters")
+            self._cond.notify_all()
+            return moved
+
+    def _depth(self):
+        return self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def depth(self):
+        """Waiting, in-flight (or backing off before a retry) and dead-lettered message counts."""
+        with self._cond:
+            now = time.time()
+            in_flight = self._db.execute("SELECT COUNT(*) FROM messages WHERE receive_count > 0 AND visible_at > ?",
+                                         (now,)).fetchone()[0]
+            total = self._depth()
+            dead = self._db.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+        return {"waiting": total - in_flight, "in_flight": in_flight, "dead_letters": dead, "max_depth": self.max_depth}
+
+
+class WorkerPool:
+    """
+    Drains a JobQueue with a fixed number of worker threads.
+    handler(body) runs one job; it fails by raising or when is_success(result) is false.
+    Failed jobs are retried with exponential backoff until the queue's max_receives,
+    then dead-lettered. Finished jobs (succeeded or dead-lettered, including jobs whose
+    last attempt expired without an outcome) are put on 'results' for the producer to
+    drain (see drain()). A worker whose receipt handle went stale (the visibility timeout
+    ran out mid-job) reports LEASE_LOST: the redelivery or expiry reports the job's outcome.
+    """
+
+    def __init__(self, job_queue, handler, workers=DEFAULT_WORKERS, is_success=None,
+                 retry_base_seconds=RETRY_BASE_SECONDS, poll_seconds=1.0):
+        self.job_queue = job_queue
+        self.handler = handler
+        self.workers = workers
+        self.is_success = is_success or (lambda result: isinstance(result, dict) and result.get('statusCode') == 200)
+        self.retry_base_seconds = retry_base_seconds
+        self.poll_seconds = poll_seconds
+        self.results = queue.Queue()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        if not self._threads:
+            self._stop.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"agent-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        """Stops after the jobs in progress; unfinished jobs stay on the queue."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def drain(self):
+        """Finished jobs since the last call (non-blocking)."""
+        finished = []
+        while True:
+            try:
+                finished.append(self.results.get_nowait())
+            except queue.Empty:
+                return finished
+
+    def _run(self):
+        while not self._stop.is_set():
+            for message in self.job_queue.receive_message(wait_seconds=self.poll_seconds):
+                self._process(message)
+            self._report_expired()
+
+    def _report_expired(self):
+        for job in self.job_queue.take_expired():
+            print(f"   ☠️ [QUEUE] Job {job['message_id']} dead-lettered after {job['attempts']} expired attempt(s)")
+            self.results.put({"message_id": job["message_id"], "body": job["body"], "result": None,
+                              "attempts": job["attempts"], "queue_wait_ms": round((time.time() - job["enqueued_at"]) * 1000, 1),
+                              "duration_ms": 0.0, "status": DEAD_LETTERED, "error": job["error"]})
+
+    def _process(self, message):
+        started = time.perf_counter()
+        try:
+            result = self.handler(message.body)
+            error = None if self.is_success(result) else f"Job failed: {result.get('body') if isinstance(result, dict) else result}"
+        except Exception as e:
+            result, error = None, f"Job crashed: {e}"
+
+        report = {"message_id": message.message_id, "body": message.body, "result": result,
+                  "attempts": message.receive_count, "queue_wait_ms": message.queue_wait_ms,
+                  "duration_ms": round((time.perf_counter() - started) * 1000, 1)}
+        if error is None:
+            if self.job_queue.delete_message(message.receipt_handle):
+                self.results.put(dict(report, status=SUCCEEDED))
+            else:
+                self._lease_lost(message, report, error)
+        elif message.receive_count >= self.job_queue.max_receives:
+            if self.job_queue.dead_letter(message.receipt_handle, error):
+                print(f"   ☠️ [QUEUE] Job {message.message_id} dead-lettered after {message.receive_count} attempt(s): {error}")
+                self.results.put(dict(report, status=DEAD_LETTERED, error=error))
+            else:
+                self._lease_lost(message, report, error)
+        else:
+            delay = self.retry_base_seconds * 2 ** (message.receive_count - 1)
+            if self.job_queue.change_message_visibility(message.receipt_handle, delay, error=error):
+                print(f"   🔁 [QUEUE] Job {message.message_id} failed (attempt {message.receive_count}), retrying in {delay:.1f}s")
+            else:
+                self._lease_lost(message, report, error)
+
+    def _lease_lost(self, message, report, error):
+        print(f"   ⚠️ [QUEUE] Job {message.message_id} outlived its visibility timeout (attempt {message.receive_count}); "
+              f"its outcome is left to the next receive")
+        self.results.put(dict(report, status=LEASE_LOST, error=error))
@@ -1,21 +1,40 @@
-import boto3
 import json
+import queue
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 import tools  # Imports the tool definitions and mock functions
+import aws_clients
+import conversation
+import decision_cache
+import policy_engine  # Deterministic rules for triggers that don't need the LLM
+import rate_limiter
+import streaming
+import tracing
 
 # --- AWS BEDROCK CONFIGURATION ---
-# Initialize the Bedrock Runtime client to interact with the LLM.
+# The Bedrock Runtime client is created on first use and reused across warm invocations,
+# so fast-path invocations never pay for it.
 # Ensure your AWS credentials (AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY) are configured.
-bedrock = boto3.client('bedrock-runtime', region_name='us-east-1')
+BEDROCK_REGION = 'us-east-1'
+
+def get_bedrock():
+    return aws_clients.client('bedrock-runtime', BEDROCK_REGION)
 
 # Model ID for Amazon Nova Micro (Efficient & Low Latency)
 MODEL_ID = "amazon.nova-micro-v1:0" 
 
+DEFAULT_PRODUCT_ID = 'OTC_VIT_C_ZINC'
+
+# Shared pool for running independent tool calls of a single turn concurrently.
+TOOL_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="agent-tool")
+
 # --- SYSTEM PROMPT (THE AGENT'S BRAIN) ---
 # This prompt defines the persona, specific rules, and financial logic.
 SYSTEM_PROMPT = """
 You are an Autonomous Enterprise Supply Chain Assistant.
 Your goal is to optimize sales volume while strictly protecting PROFITABILITY.
-Your boss is Mr. Ahmet. You must keep him informed via email for every action taken.
+Your boss is Mr. Ahmet. Every action you take is reported to him automatically, so you never need to email him.
 
 *** EXECUTION PROTOCOL & RULES ***
 
@@ -26,7 +45,7 @@ You MUST ONLY take actions related to the specific trigger. Do not mix scenarios
    - Check the current 'stock_level'.
    - IF stock < 1500:
      - ACTION: Call 'create_restock_order' immediately.
-     - NOTIFICATION: Send an email to Mr. Ahmet with the PO Number.
+     - QUANTITY: If 'demand_metrics.recommended_order_quantity' is present, order exactly that amount. Otherwise order 2000 units.
    - STRICT GUARDRAIL: DO NOT change the product price during a stockout anomaly. Leave the price exactly as it is. Do not execute price analysis.
 
 2. **IF TRIGGERED BY "Price Disadvantage":**
@@ -37,111 +56,355 @@ You MUST ONLY take actions related to the specific trigger. Do not mix scenarios
    - SCENARIO 2A: Profitable Competition
      - IF Target Price >= Floor Price:
      - ACTION: Update price to Target Price immediately.
-     - EMAIL: "Mr. Ahmet, I undercut the competitor to [Target Price]. We remain profitable."
+     - SUMMARY: "I undercut the competitor to [Target Price]. We remain profitable."
      
    - SCENARIO 2B: Profit Protection (Guardrail)
      - IF Target Price < Floor Price:
      - ACTION: Set price to Floor Price. NEVER go below this limit.
-     - EMAIL: "Mr. Ahmet, the competitor's price is predatory. I held our price at the Floor Price ([Floor Price]) to protect margins."
+     - SUMMARY: "The competitor's price is predatory. I held our price at the Floor Price ([Floor Price]) to protect margins."
+
+3. **IF TRIGGERED BY "Profit Protection":**
+   - Our 'current_price' is below Floor Price ('cost_price' * 1.10).
+   - ACTION: Update price to Floor Price. Do NOT touch stock.
 
-3. **MANDATORY REPORTING**:
-   - Send an email using 'send_notification_email' summarizing ONLY the actions you took for the specific trigger.
+4. **REPORTING**:
+   - Do NOT send emails. When you are done, reply with a one-line summary of ONLY the actions you took for the specific trigger.
+
+5. **SAFE EXECUTION**:
+   - When calling 'update_product_price', pass the 'competitor_price' you based the decision on as 'expected_competitor_price'.
+   - If a tool returns status "skipped", the action was already done or the data changed. Do NOT retry it; mention it in your summary.
 """
 
-def lambda_handler(event, context):
+def _run_tool(tool_use, episode_id=None):
+    """Executes one toolUse block and wraps the output as a toolResult block."""
+    tool_name = tool_use['name']
+
+    # Execute the corresponding Python function from tools.py
+    result_data = tools.execute_tool_router(tool_name, tool_use['input'], episode_id=episode_id)
+
+    return {
+        "toolResult": {
+            "toolUseId": tool_use['toolUseId'],
+            "content": [{"json": result_data}]
+        }
+    }
+
+def execute_tool_requests(tool_uses, episode_id=None):
+    """
+    Executes all toolUse blocks of one turn.
+    Parallel-safe tools are dispatched concurrently; serial tools run in request order
+    on the calling thread. Results are returned in the order the model requested them.
+    """
+    if len(tool_uses) == 1:
+        return [_run_tool(tool_uses[0], episode_id)]
+
+    futures = {
+        i: TOOL_EXECUTOR.submit(tracing.bind(_run_tool), tool_use, episode_id)
+        for i, tool_use in enumerate(tool_uses)
+        if tools.is_parallel_safe(tool_use['name'])
+    }
+    results = [None] * len(tool_uses)
+    for i, tool_use in enumerate(tool_uses):
+        if i not in futures:
+            results[i] = _run_tool(tool_use, episode_id)
+    for i, future in futures.items():
+        results[i] = future.result()
+    return results
+
+# --- STREAMING (converse_stream) ---
+
+def _emitter(on_event):
+    """Wraps the caller's callback so a failing consumer never breaks the agent."""
+    if on_event is None:
+        return lambda event: None
+    def emit(event):
+        try:
+            on_event(event)
+        except Exception as e:
+            print(f"   ⚠️ [BRAIN] Stream consumer failed: {e}")
+    return emit
+
+def _dispatch_streamed_tool(tool_use, episode_id, serial_tail):
+    """
+    Starts a streamed tool on the executor. A serial tool waits for the previous
+    serial tool of the same message, so their request order is kept.
+    """
+    run = tracing.bind(_run_tool)
+    if tools.is_parallel_safe(tool_use['name']):
+        return TOOL_EXECUTOR.submit(run, tool_use, episode_id)
+
+    def run_after_previous():
+        if serial_tail is not None:
+            serial_tail.exception()  # Only waits; a failure is reported by that tool's own future
+        return run(tool_use, episode_id)
+    return TOOL_EXECUTOR.submit(run_after_previous)
+
+def _completed(result):
+    future = Future()
+    future.set_result(result)
+    return future
+
+def _stream_turn(history, episode_id, emit):
+    """
+    One model call through converse_stream. Returns (response, pending): response has the
+    converse() shape, pending lists (toolUse, future) in the order the model requested them.
+    Read-only tools start as soon as their block is complete; tools with side effects wait
+    until the message has ended with stopReason tool_use, so a cut-off message changes nothing.
+    """
+    assembler = streaming.MessageAssembler()
+    pending = []
+    held = []  # Indexes into pending of side-effect tools not started yet
+    serial_tail = None
+    response = rate_limiter.call(rate_limiter.model_limiter(MODEL_ID), get_bedrock().converse_stream,
+                                 modelId=MODEL_ID, **history.request())
+    for chunk in response['stream']:
+        event = assembler.feed(chunk)
+        if event is None:
+            continue
+        kind, payload = event
+        if kind == streaming.TEXT:
+            emit({"type": streaming.TEXT, "text": payload})
+        elif kind == streaming.TOOL_START:
+            emit({"type": streaming.TOOL_START, "name": payload['name'], "tool_use_id": payload['toolUseId']})
+        elif kind == streaming.TOOL_DISPATCHED:
+            if not tools.is_read_only(payload['name']):
+                held.append(len(pending))
+                pending.append((payload, None))
+                continue
+            future = _dispatch_streamed_tool(payload, episode_id, serial_tail)
+            if not tools.is_parallel_safe(payload['name']):
+                serial_tail = future
+            pending.append((payload, future))
+            emit({"type": streaming.TOOL_DISPATCHED, "name": payload['name'],
+                  "tool_use_id": payload['toolUseId'], "input": payload['input']})
+        elif kind == streaming.TOOL_INVALID:
+            tool_use, error = payload
+            print(f"   ⚠️ [BRAIN] {tool_use['name']} not run: {error}")
+            pending.append((tool_use, _completed(
+                {"toolResult": {"toolUseId": tool_use['toolUseId'], "content": [{"json": {"error": error}}]}})))
+            emit({"type": streaming.TOOL_INVALID, "name": tool_use['name'],
+                  "tool_use_id": tool_use['toolUseId'], "error": error})
+
+    if assembler.stop_reason != "tool_use":
+        # Not a complete tool request (e.g. max_tokens): nothing with side effects runs
+        return assembler.response(), [(tool_use, future) for tool_use, future in pending if future is not None]
+    for i in held:
+        tool_use = pending[i][0]
+        future = _dispatch_streamed_tool(tool_use, episode_id, serial_tail)
+        if not tools.is_parallel_safe(tool_use['name']):
+            serial_tail = future
+        pending[i] = (tool_use, future)
+        emit({"type": streaming.TOOL_DISPATCHED, "name": tool_use['name'],
+              "tool_use_id": tool_use['toolUseId'], "input": tool_use['input']})
+    return assembler.response(), pending
+
+def stream_agent(event):
+    """
+    Generator API: runs the agent on a worker thread and yields its stream events
+    (see streaming.py) as they happen. The last event is always streaming.RESULT.
+    """
+    events = queue.Queue()
+
+    def run():
+        try:
+            lambda_handler(event, {}, on_event=events.put)
+        except Exception as e:
+            events.put({"type": streaming.RESULT, "result": {
+                'statusCode': 500, 'body': json.dumps(f"Internal Error: {str(e)}"), 'path': None, 'metrics': {}}})
+
+    threading.Thread(target=run, name="agent-stream", daemon=True).start()
+    while True:
+        item = events.get()
+        yield item
+        if item["type"] == streaming.RESULT:
+            return
+
+def _load_snapshot(event, product_id):
+    """Uses the caller's pre-fetched product snapshot, or fetches it with a batched read."""
+    snapshot = event.get("product_snapshot")
+    if snapshot is None:
+        try:
+            snapshot = tools.batch_get_products([product_id]).get(product_id)
+        except Exception as e:
+            print(f"   ⚠️ [BRAIN] Snapshot pre-fetch failed: {e}")
+            return None
+    if snapshot is None:
+        return None
+    # Normalize DynamoDB Decimals into plain JSON types (single pass, no encode/decode)
+    return tools.ProductRecord.from_item(tools.attach_demand_metrics(dict(snapshot))).to_dict()
+
+def lambda_handler(event, context, on_event=None):
     """
     Main entry point for the Lambda function.
     It orchestrates the conversation with AWS Bedrock and handles Tool Execution (ReAct Pattern).
+
+    Rule-decidable triggers are handled by the policy engine without calling Bedrock.
+    Set event["use_fast_path"] = False to force the LLM loop.
+    The response carries a 'path' key ("fast_path" or "llm") showing which route was taken,
+    and 'metrics' with the Bedrock turns and tokens used.
+
+    An LLM run whose product, trigger and (quantized) market state were seen before replays
+    the validated plan of that earlier run instead (path "decision_cache", see decision_cache.py).
+    Set event["use_decision_cache"] = False to skip it.
+
+    event["product_snapshot"] may carry the product record the caller already holds;
+    it is injected into the first prompt so the model can act on its first turn.
+
+    event["episode_id"] identifies the anomaly episode. Repeated runs for the same
+    episode cannot place a second restock order or re-apply the same price change.
+
+    With on_event (a callback) or event["stream"] = True the model is called through
+    converse_stream: read-only tools start as soon as their block has streamed in, tools with
+    side effects once the message has ended with tool_use, and text / tool events are passed
+    to on_event while the turn is still running (see stream_agent).
     """
+    emit = _emitter(on_event)
+    with tracing.span(tracing.INVOCATION, "lambda_handler",
+                      product_id=event.get("product_id", DEFAULT_PRODUCT_ID),
+                      trigger_reason=event.get("trigger_reason")) as invocation:
+        result = _run_agent(event, emit, stream=on_event is not None or bool(event.get("stream")))
+        invocation.set(path=result.get('path'), status_code=result.get('statusCode'), **result.get('metrics', {}))
+    emit({"type": streaming.RESULT, "result": result})
+    return result
+
+def _run_agent(event, emit, stream=False):
+    """Fast path or ReAct loop for a single trigger (see lambda_handler)."""
     print("🧠 [BRAIN] Agent Activated. Analyzing Market Conditions...")
     
     # Simulating a trigger from the Dashboard/User
     # In a real scenario, this 'text' could come from the 'event' object.
     trigger_reason = event.get("trigger_reason", "Genel Kontrol")
+    product_id = event.get("product_id", DEFAULT_PRODUCT_ID)
+    snapshot = _load_snapshot(event, product_id)
+    episode_id = event.get("episode_id") or uuid.uuid4().hex
+
+    # --- FAST PATH (No LLM) ---
+    if event.get("use_fast_path", True):
+        fast_result = policy_engine.run_fast_path(product_id, trigger_reason, product=snapshot,
+                                                  episode_id=episode_id)
+        if fast_result is not None:
+            return fast_result
+        print("   ↪️ [BRAIN] Trigger not rule-decidable. Falling back to LLM reasoning...")
+
+    # --- DECISION CACHE (same product, trigger and market state as an earlier LLM run) ---
+    use_decision_cache = snapshot is not None and event.get("use_decision_cache", True)
+    if use_decision_cache:
+        cached_result = decision_cache.shared_decisions.run_cached(product_id, trigger_reason, snapshot,
+                                                                   episode_id=episode_id)
+        if cached_result is not None:
+            return cached_result
+
+    # Pre-fetched state saves the model a get_product_market_data round-trip
+    if snapshot is not None:
+        snapshot_context = f"""
+    CURRENT PRODUCT DATA (already fetched, do NOT call 'get_product_market_data' again):
+    {json.dumps(snapshot)}
+    """
+    else:
+        snapshot_context = ""
     
     user_input = f"""
-    Analyze product: 'OTC_VIT_C_ZINC'.
-    
+    Analyze product: '{product_id}'.
+    {snapshot_context}
     CRITICAL TRIGGER REASON: '{trigger_reason}'
     
-    INSTRUCTION: You MUST ONLY execute the rules defined in the SYSTEM PROMPT for this specific trigger reason. Do not perform general analysis. Execute necessary actions and send the notification email.
+    INSTRUCTION: You MUST ONLY execute the rules defined in the SYSTEM PROMPT for this specific trigger reason. Do not perform general analysis. Execute the necessary actions, then reply with a one-line summary.
     """
     
-    # Initialize conversation history
-    messages = [{"role": "user", "content": [{"text": user_input}]}]
-
-
-    
-
+    # Initialize conversation history (compacted between turns, only the trigger's tools exposed)
+    history = conversation.Conversation(SYSTEM_PROMPT, trigger_reason)
+    history.add_user_text(user_input)
     
     turn_count = 0
     max_turns = 10  # Prevent infinite loops
+    metrics = {"turns": 0, "input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+    executed_tools = []  # (name, input, result) of this run, for the decision cache
     
     # --- AGENT LOOP (Reasoning + Acting) ---
     while turn_count < max_turns:
         turn_count += 1
+        if not history.can_continue():
+            print(f"   🪙 [BRAIN] Token budget exhausted ({history.tokens_used}/{history.budget}). Stopping.")
+            metrics.update(history.stats)
+            return {'statusCode': 200, 'body': json.dumps("Token budget exhausted"), 'path': "llm", 'metrics': metrics}
         try:
-            # 1. INVOKE MODEL (THINK)
-            response = bedrock.converse(
-                modelId=MODEL_ID,
-                messages=messages,
-                system=[{"text": SYSTEM_PROMPT}],
-                toolConfig={"tools": tools.tool_config} # Inject available tools
-            )
+            with tracing.span(tracing.TURN, f"turn_{turn_count}", turn=turn_count):
+                # 1. INVOKE MODEL (THINK)
+                with tracing.span(tracing.MODEL_CALL, MODEL_ID, stream=stream) as model_call:
+                    if stream:
+                        response, pending_tools = _stream_turn(history, episode_id, emit)
+                    else:
+                        response = rate_limiter.call(rate_limiter.model_limiter(MODEL_ID), get_bedrock().converse,
+                                                     modelId=MODEL_ID, **history.request())
+                        pending_tools = None
+                    usage = response.get('usage', {})
+                    model_call.set(stop_reason=response.get('stopReason'),
+                                   input_tokens=usage.get('inputTokens', 0),
+                                   output_tokens=usage.get('outputTokens', 0),
+                                   service_latency_ms=response.get('metrics', {}).get('latencyMs'))
             
-            # Parse response
-            stop_reason = response['stopReason']
-            message_content = response['output']['message']
+                # Track Bedrock usage for this invocation
+                metrics["turns"] += 1
+                metrics["input_tokens"] += usage.get('inputTokens', 0)
+                metrics["output_tokens"] += usage.get('outputTokens', 0)
+                metrics["total_tokens"] += usage.get('totalTokens', 0)
+                history.record_usage(usage)
+                emit({"type": streaming.TURN_END, "turn": turn_count,
+                      "stop_reason": response['stopReason'], "usage": usage})
+
+                # Parse response
+                stop_reason = response['stopReason']
+                message_content = response['output']['message']
             
-            # Add model's response to history
-            messages.append(message_content)
+                # Add model's response to history
+                history.add_assistant(message_content)
 
-            # 2. EXECUTE TOOLS (ACT)
-            if stop_reason == "tool_use":
-                tool_requests = message_content['content']
-                tool_results = []
+                # 2. EXECUTE TOOLS (ACT)
+                if stop_reason == "tool_use":
+                    tool_requests = message_content['content']
+                    tool_uses = [content['toolUse'] for content in tool_requests if 'toolUse' in content]
                 
-                print(f"   🤖 [AGENT] Model requested {len(tool_requests)} tool(s)...")
-
-                for content in tool_requests:
-                    if 'toolUse' in content:
-                        tool_use = content['toolUse']
-                        tool_id = tool_use['toolUseId']
-                        tool_name = tool_use['name']
-                        tool_inputs = tool_use['input']
-                        
-                        # Execute the corresponding Python function from tools.py
-                        result_data = tools.execute_tool_router(tool_name, tool_inputs)
-                        
-                        # Log specific actions for debugging
-                        if tool_name == "send_notification_email":
-                             print(f"   📧 [AGENT] Email Notification Dispatched.")
-
-                        # Prepare result for the model
-                        tool_results.append({
-                            "toolResult": {
-                                "toolUseId": tool_id,
-                                "content": [{"json": result_data}]
-                            }
-                        })
+                    print(f"   🤖 [AGENT] Model requested {len(tool_uses)} tool(s)...")
+
+                    # Independent tools run concurrently; results come back in request order.
+                    # When streaming, they were already started while the message arrived.
+                    if pending_tools is not None:
+                        tool_results = [future.result() for _, future in pending_tools]
+                    else:
+                        tool_results = execute_tool_requests(tool_uses, episode_id)
+                    for tool_use, block in zip(tool_uses, tool_results):
+                        result = block['toolResult']['content'][0]['json']
+                        executed_tools.append((tool_use['name'], tool_use['input'], result))
+                        emit({"type": streaming.TOOL_RESULT, "name": tool_use['name'], "tool_use_id": tool_use['toolUseId'],
+                              "result": result})
                 
-                # Send tool results back to the model so it can formulate the final answer
-                messages.append({"role": "user", "content": tool_results})
+                    # Send tool results back to the model so it can formulate the final answer
+                    history.add_tool_results(tool_results)
             
-            # 3. FINAL ANSWER
-            elif stop_reason == "end_turn":
-                # The model has finished its task
-                final_res = message_content['content'][0]['text']
-                return {
-                    'statusCode': 200, 
-                    'body': json.dumps(final_res)
-                }
+                # 3. FINAL ANSWER
+                elif stop_reason == "end_turn":
+                    # The model has finished its task
+                    final_res = message_content['content'][0]['text']
+                    metrics.update(history.stats)
+                    if use_decision_cache:
+                        decision_cache.shared_decisions.remember(product_id, trigger_reason, snapshot,
+                                                                 executed_tools, final_res)
+                    return {
+                        'statusCode': 200, 
+                        'body': json.dumps(final_res),
+                        'path': "llm",
+                        'metrics': metrics
+                    }
                 
         except Exception as e:
             print(f"❌ [ERROR] Agent crashed: {str(e)}")
+            metrics.update(history.stats)
             return {
                 'statusCode': 500, 
-                'body': json.dumps(f"Internal Error: {str(e)}")
+                'body': json.dumps(f"Internal Error: {str(e)}"),
+                'path': "llm",
+                'metrics': metrics
             }
 
-    return {'statusCode': 200, 'body': "Max turns reached"}
\ No newline at end of file
+    metrics.update(history.stats)
+    return {'statusCode': 200, 'body': json.dumps("Max turns reached"), 'path': "llm", 'metrics': metrics}
\ No newline at end of file
@@ -0,0 +1,141 @@
+import collections
+import os
+import re
+import tempfile
+import threading
+import time
+
+# --- CONFIGURATION ---
+DEFAULT_CAPACITY = int(os.environ.get("DASHBOARD_LOG_CAPACITY", "2000"))  # Records kept in memory
+
+# --- SEVERITY ---
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+SEVERITY_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+# Dashboard log types -> severity. Unknown types count as INFO.
+TYPE_SEVERITY = {
+    "AI-THINK": DEBUG, "AI-TOOL": DEBUG, "SALES": DEBUG,
+    "INFO": INFO, "SYSTEM": INFO, "AI-ACTION": INFO, "AI-SUCCESS": INFO, "HOLD": INFO,
+    "WARNING": WARNING, "ALERT": WARNING, "CRISIS": WARNING,
+    "ERROR": ERROR, "AI-FAIL": ERROR,
+}
+
+# Spill-file escaping, so every record stays on one line
+_ESCAPES = {"\\": "\\\\", "\n": "\\n", "\t": "\\t"}
+_UNESCAPES = {"n": "\n", "t": "\t"}
+
+
+def severity_of(log_type):
+    return TYPE_SEVERITY.get(log_type, INFO)
+
+def _escape(text):
+    return "".join(_ESCAPES.get(char, char) for char in text)
+
+def _unescape(text):
+    return re.sub(r"\\(.)", lambda m: _UNESCAPES.get(m.group(1), m.group(1)), text)
+
+
+class LogRecord:
+    __slots__ = ("seq", "timestamp", "log_type", "severity", "message", "_line")
+
+    def __init__(self, seq, timestamp, log_type, message):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.log_type = log_type
+        self.severity = severity_of(log_type)
+        self.message = message
+        self._line = None
+
+    def format(self):
+        if self._line is None:  # Formatted once; pages are redrawn many times
+            self._line = f"[{time.strftime('%H:%M:%S', time.localtime(self.timestamp))}] [{self.log_type}] {self.message}"
+        return self._line
+
+
+class LogStore:
+    """
+    Bounded log for long-running dashboards.
+    - The newest 'capacity' records live in a ring buffer; appends and page reads never touch older ones.
+    - Every record is also appended to a spill file (one tab-separated line each),
+      which search() scans on demand. spill_path=False disables spilling.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, spill_path=None):
+        if spill_path is None:
+            spill_path = os.environ.get("DASHBOARD_LOG_FILE") or os.path.join(
+                tempfile.gettempdir(), f"supply_chain_dashboard_{int(time.time())}.log")
+        self.spill_path = spill_path or None
+        self._records = collections.deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._spill = open(self.spill_path, "a", buffering=1, encoding="utf-8") if self.spill_path else None
+
+    def append(self, message, log_type="INFO"):
+        with self._lock:
+            self._seq += 1
+            record = LogRecord(self._seq, time.time(), log_type, message)
+            self._records.append(record)
+            if self._spill is not None:
+                # One line per record: newlines/tabs in the message are escaped
+                self._spill.write(f"{record.seq}\t{record.timestamp:.3f}\t{log_type}\t{_escape(message)}\n")
+        return record
+
+    @property
+    def last_seq(self):
+        return self._seq
+
+    def page(self, min_severity=DEBUG, page=0, page_size=200):
+        """
+        Records of one page at or above min_severity, oldest first. Page 0 is the newest;
+        only the ring buffer is read, and only until the page is filled.
+        """
+        skip = page * page_size
+        selected = []
+        with self._lock:
+            for record in reversed(self._records):
+                if record.severity < min_severity:
+                    continue
+                if skip:
+                    skip -= 1
+                    continue
+                selected.append(record)
+                if len(selected) == page_size:
+                    break
+        selected.reverse()
+        return selected
+
+    def search(self, text, min_severity=DEBUG, limit=200):
+        """Latest 'limit' records in the full history whose message contains text (case-insensitive)."""
+        needle = text.lower()
+        matches = collections.deque(maxlen=limit)
+        if self._spill is None:
+            with self._lock:
+                records = list(self._records)
+            for record in records:
+                if record.severity >= min_severity and needle in record.message.lower():
+                    matches.append(record)
+            return list(matches)
+
+        with open(self.spill_path, encoding="utf-8") as f:
+            for line in f:
+                seq, timestamp, log_type, message = line.rstrip("\n").split("\t", 3)
+                if severity_of(log_type) < min_severity or needle not in message.lower():
+                    continue
+                matches.append(LogRecord(int(seq), float(timestamp), log_type, _unescape(message)))
+        return list(matches)
+
+    def clear(self):
+        """Empties the in-memory view; the spill file keeps the full history."""
+        with self._lock:
+            self._records.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"total": self._seq, "in_memory": len(self._records), "capacity": self._records.maxlen,
+                    "spill_path": self.spill_path}
+
+    def close(self):
+        with self._lock:
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
@@ -0,0 +1,169 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+import policy_engine
+
+# --- SIMULATION PARAMETERS ---
+LOW_STOCK_THRESHOLD = float(policy_engine.LOW_STOCK_THRESHOLD)
+UNDERCUT_STEP = float(policy_engine.UNDERCUT_STEP)
+RESTOCK_QUANTITY = policy_engine.RESTOCK_QUANTITY
+
+COMPETITOR_MOVE_PROB = 0.02    # Chance per tick that a competitor nudges its price
+COMPETITOR_MOVE_SIGMA = 0.04   # Size of a nudge (log-normal, relative)
+PRICE_WAR_PROB = 0.002         # Chance per tick of an aggressive competitor cut
+PRICE_WAR_DROP = 0.15          # Relative size of that cut
+DEMAND_ELASTICITY = 1.5        # How strongly a price gap moves volume when we are competitive
+
+
+class MarketSimulator:
+    """
+    Headless market model for N products held as NumPy arrays.
+    Each tick moves competitor prices, books sales and evaluates the trigger rules for
+    every product at once. With apply_policy=True the fast-path rules are applied in
+    vectorized form so the market keeps healing itself (no AWS calls are made).
+    """
+
+    def __init__(self, n_products=1000, seed=42, apply_policy=True, product_ids=None):
+        self.n = int(n_products)
+        self.rng = np.random.default_rng(seed)
+        self.apply_policy = apply_policy
+        self.product_ids = product_ids or [f"SKU_{i:07d}" for i in range(self.n)]
+
+        rng = self.rng
+        self.cost = rng.lognormal(mean=np.log(60), sigma=0.5, size=self.n)
+        self.price = np.round(self.cost * rng.uniform(1.6, 2.2, size=self.n), 2)
+        self.competitor = np.round(self.price * rng.normal(1.08, 0.05, size=self.n), 2)
+        self.stock = rng.integers(1500, 5000, size=self.n).astype(np.int64)
+        self.base_demand = rng.uniform(50, 150, size=self.n)  # Mean units per tick (dashboard: randint(50, 150))
+
+        self.tick = 0
+        self.units_sold = 0
+        self.revenue = 0.0
+        self.trigger_counts = {policy_engine.LOW_STOCK: 0, policy_engine.PRICE_DISADVANTAGE: 0}
+        self.restocks = 0
+        self.reprices = 0
+
+    @property
+    def floor_price(self):
+        return policy_engine.floor_prices(self.cost)
+
+    def _move_competitors(self):
+        rng = self.rng
+        moving = rng.random(self.n) < COMPETITOR_MOVE_PROB
+        if moving.any():
+            self.competitor[moving] *= rng.lognormal(0.0, COMPETITOR_MOVE_SIGMA, size=int(moving.sum()))
+        war = rng.random(self.n) < PRICE_WAR_PROB
+        if war.any():
+            self.competitor[war] *= (1.0 - PRICE_WAR_DROP)
+        np.maximum(self.competitor, self.cost * 0.5, out=self.competitor)
+        np.round(self.competitor, 2, out=self.competitor)
+
+    def _book_sales(self):
+        # Same merchant logic as the dashboard: no sales while we are more expensive.
+        competitive = self.price <= self.competitor
+        rate = self.base_demand * np.power(self.competitor / self.price, DEMAND_ELASTICITY)
+        demand = self.rng.poisson(np.where(competitive, rate, 0.0))
+        sold = np.minimum(demand, self.stock)
+        self.stock -= sold
+        self.units_sold += int(sold.sum())
+        self.revenue += float((sold * self.price).sum())
+
+    def detect(self):
+        """Evaluates the trigger rules for every product. Returns {reason: product indices}."""
+        low_stock = self.stock < LOW_STOCK_THRESHOLD
+        # Mirrors the dashboard's if/elif: Low Stock wins over Price Disadvantage
+        price_disadvantage = ~low_stock & (self.competitor < self.price)
+        return {
+            policy_engine.LOW_STOCK: np.flatnonzero(low_stock),
+            policy_engine.PRICE_DISADVANTAGE: np.flatnonzero(price_disadvantage),
+        }
+
+    def _apply_policy(self, events):
+        restock = events[policy_engine.LOW_STOCK]
+        self.stock[restock] += RESTOCK_QUANTITY
+        self.restocks += len(restock)
+
+        reprice = events[policy_engine.PRICE_DISADVANTAGE]
+        if len(reprice):
+            floor_price = self.floor_price[reprice]
+            target = np.maximum(self.competitor[reprice] - UNDERCUT_STEP, floor_price)
+            changed = target != self.price[reprice]
+            self.price[reprice] = target
+            self.reprices += int(changed.sum())
+
+    def step(self):
+        """Advances every product by one tick and returns that tick's trigger events."""
+        self.tick += 1
+        self._move_competitors()
+        self._book_sales()
+        events = self.detect()
+        for reason, idx in events.items():
+            self.trigger_counts[reason] += len(idx)
+        if self.apply_policy:
+            self._apply_policy(events)
+        return events
+
+    def to_jobs(self, events):
+        """Converts trigger events into (product_id, trigger_reason) jobs for catalog_runner."""
+        return [(self.product_ids[i], reason) for reason, idx in events.items() for i in idx]
+
+    def run(self, ticks, on_events=None):
+        """
+        Runs the simulation as fast as the CPU allows.
+        on_events(tick, events) is called for ticks that produced at least one trigger.
+        """
+        started = time.perf_counter()
+        for _ in range(int(ticks)):
+            events = self.step()
+            if on_events is not None and any(len(idx) for idx in events.values()):
+                on_events(self.tick, events)
+        elapsed = time.perf_counter() - started
+        return self.summary(elapsed)
+
+    def summary(self, elapsed=None):
+        result = {
+            "products": self.n,
+            "ticks": self.tick,
+            "units_sold": self.units_sold,
+            "revenue": round(self.revenue, 2),
+            "triggers": dict(self.trigger_counts),
+            "restocks": self.restocks,
+            "reprices": self.reprices,
+            "stockouts": int((self.stock == 0).sum()),
+            "below_floor": int((self.price < self.floor_price).sum()),
+        }
+        if elapsed is not None:
+            result["elapsed_s"] = round(elapsed, 3)
+            result["ticks_per_s"] = round(self.tick / elapsed, 1) if elapsed else None
+            result["product_ticks_per_s"] = round(self.tick * self.n / elapsed) if elapsed else None
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless vectorized market simulator for load testing.")
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--ticks", type=int, default=10080, help="Default: one week of 1-minute ticks")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-policy", action="store_true", help="Emit triggers without healing the market")
+    parser.add_argument("--events-out", help="Write trigger jobs per tick to this JSONL file")
+    args = parser.parse_args()
+
+    sim = MarketSimulator(n_products=args.products, seed=args.seed, apply_policy=not args.no_policy)
+    print(f"🏁 [SIM] {args.products} products x {args.ticks} ticks (seed={args.seed})...")
+
+    if args.events_out:
+        with open(args.events_out, "w") as out:
+            def write_events(tick, events):
+                out.write(json.dumps({"tick": tick, "jobs": sim.to_jobs(events)}) + "\n")
+            summary = sim.run(args.ticks, on_events=write_events)
+    else:
+        summary = sim.run(args.ticks)
+
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
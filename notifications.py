@@ -0,0 +1,334 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import aws_clients
+import rate_limiter
+
+# --- CONFIGURATION ---
+DEFAULT_RECIPIENT = os.environ.get("NOTIFY_RECIPIENT", "executive@enterprise.com")
+SENDER = os.environ.get("NOTIFY_SENDER", "Autonomous_Supply_Chain_Agent <agent@enterprise.com>")
+DEFAULT_WINDOW_SECONDS = float(os.environ.get("NOTIFY_WINDOW", "60"))      # A digest is sent this long after its first event
+DEFAULT_MAX_EVENTS = int(os.environ.get("NOTIFY_MAX_EVENTS", "50"))         # ...or as soon as it holds this many
+DEFAULT_MAX_PENDING = int(os.environ.get("NOTIFY_MAX_PENDING", "10000"))    # Events buffered at most; newer ones are dropped
+SEND_RETRIES = 3
+FLUSH_TIMEOUT_SECONDS = 10.0
+# SQS queue for action events. Lambda freezes the process once the handler returns, so there
+# events go to this queue and a single digest sender (digest_handler) drains it.
+QUEUE_URL = os.environ.get("NOTIFY_QUEUE_URL")
+QUEUE_REGION = os.environ.get("NOTIFY_QUEUE_REGION", "eu-west-1")
+SMTP_HOST = os.environ.get("NOTIFY_SMTP_HOST", "localhost")
+SMTP_PORT = int(os.environ.get("NOTIFY_SMTP_PORT", "1025"))
+SES_REGION = os.environ.get("NOTIFY_SES_REGION", "eu-west-1")
+SES_SEND_RATE = float(os.environ.get("NOTIFY_SES_RATE", "1"))  # SES sandbox quota: 1 message/s
+
+
+# --- TRANSPORTS (send(recipient, subject, body); raise on failure) ---
+
+class RelayTransport:
+    """The simulated internal relay: prints the message."""
+
+    def send(self, recipient, subject, body):
+        print(f"""
+    ================ [ 📧 PRIORITY NOTIFICATION ] ================
+    TO: {recipient}
+    FROM: {SENDER}
+    SUBJECT: {subject}
+    --------------------------------------------------------------
+{body}
+    --------------------------------------------------------------
+    [System: Delivered via Internal Secure Relay]
+    ==============================================================
+    """)
+
+
+class SmtpTransport:
+    """Plain SMTP, e.g. a local stand-in: python -m aiosmtpd -n -l localhost:1025"""
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, sender=SENDER):
+        self.host = host
+        self.port = port
+        self.sender = sender
+
+    def send(self, recipient, subject, body):
+        import smtplib
+        from email.message import EmailMessage
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = recipient
+        message["Subject"] = subject
+        message.set_content(body)
+        with smtplib.SMTP(self.host, self.port, timeout=10) as smtp:
+            smtp.send_message(message)
+
+
+class SesTransport:
+    """Amazon SES SendEmail, paced by the account's send rate."""
+
+    def __init__(self, region=SES_REGION, sender=SENDER):
+        self.region = region
+        self.sender = sender
+        self.limiter = rate_limiter.limiter(f"ses:{region}", SES_SEND_RATE)
+
+    def send(self, recipient, subject, body):
+        rate_limiter.call(self.limiter, aws_clients.client('ses', self.region).send_email,
+                          Source=self.sender,
+                          Destination={'ToAddresses': [recipient]},
+                          Message={'Subject': {'Data': subject}, 'Body': {'Text': {'Data': body}}})
+
+
+class MemoryTransport:
+    """Keeps sent digests in a list (offline replay, benchmarks)."""
+
+    def __init__(self):
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send(self, recipient, subject, body):
+        with self._lock:
+            self.sent.append({"recipient": recipient, "subject": subject, "body": body})
+
+
+TRANSPORTS = {"relay": RelayTransport, "smtp": SmtpTransport, "ses": SesTransport, "memory": MemoryTransport}
+
+def transport_from_env():
+    """Transport named by NOTIFY_TRANSPORT (relay, smtp, ses or memory; default relay)."""
+    return TRANSPORTS[os.environ.get("NOTIFY_TRANSPORT", "relay")]()
+
+
+# --- DIGESTS ---
+
+def format_event(event):
+    line = f"[{time.strftime('%H:%M:%S', time.localtime(event['time']))}] {event['product_id']}: {event['action']}"
+    return f"{line} - {event['details']}" if event.get('details') else line
+
+def _new_event(product_id, action, details, episode_id):
+    return {"time": time.time(), "product_id": product_id, "action": action, "details": details,
+            "episode_id": episode_id}
+
+def format_digest(events):
+    """(subject, body) of one digest, actions grouped by product in arrival order."""
+    by_product = OrderedDict()
+    for event in events:
+        by_product.setdefault(event['product_id'], []).append(event)
+    subject = (f"Supply chain digest: {len(events)} action(s) on {len(by_product)} product(s)"
+               if len(events) > 1 else f"{events[0]['action'].title()} for {events[0]['product_id']}")
+    lines = ["Mr. Ahmet, the agent took the following action(s):", ""]
+    for product_events in by_product.values():
+        lines.extend(f"  {format_event(event)}" for event in product_events)
+    return subject, "\n".join(lines)
+
+def deliver(transport, recipient, events):
+    """Sends one digest, retrying with backoff. Returns False if it could not be delivered."""
+    subject, body = format_digest(events)
+    for attempt in range(SEND_RETRIES + 1):
+        try:
+            transport.send(recipient, subject, body)
+            return True
+        except Exception as e:
+            if attempt == SEND_RETRIES:
+                print(f"   ⚠️ [NOTIFY] Digest to {recipient} failed ({len(events)} event(s)): {e}")
+                return False
+            time.sleep(0.5 * (2 ** attempt))
+
+
+class Dispatcher:
+    """
+    Collects action events and sends them as per-recipient digests.
+    - publish() only appends to an in-memory buffer; agent runs never wait for delivery.
+    - A recipient's digest goes out window_seconds after its first event, or once it holds
+      max_events, on a background thread (started on first publish).
+    - Failed sends are retried with backoff, then counted as failed.
+    - At most max_pending events are buffered; beyond that new events are dropped and counted.
+    """
+
+    def __init__(self, transport=None, window_seconds=DEFAULT_WINDOW_SECONDS, max_events=DEFAULT_MAX_EVENTS,
+                 max_pending=DEFAULT_MAX_PENDING):
+        self.transport = transport
+        self.window_seconds = window_seconds
+        self.max_events = max_events
+        self.max_pending = max_pending
+        self._open = {}      # recipient -> (opened_at, [events])
+        self._ready = []     # [(recipient, [events])] full digests waiting for the sender thread
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self.stats = {"published": 0, "dropped": 0, "digests_sent": 0, "events_sent": 0, "failed": 0}
+
+    def publish(self, product_id, action, details="", recipient=None, episode_id=None):
+        """Queues one action event. Returns False if it was dropped (buffer full)."""
+        event = _new_event(product_id, action, details, episode_id)
+        recipient = recipient or DEFAULT_RECIPIENT
+        with self._cond:
+            if self._pending >= self.max_pending:
+                self.stats["dropped"] += 1
+                return False
+            opened_at, events = self._open.setdefault(recipient, (time.monotonic(), []))
+            events.append(event)
+            self._pending += 1
+            self.stats["published"] += 1
+            if len(events) >= self.max_events:
+                self._ready.append((recipient, self._open.pop(recipient)[1]))
+                self._cond.notify()
+            elif len(events) == 1:
+                self._cond.notify()  # A new window: the sender thread recomputes its wake-up time
+            if self._thread is None:
+                self._start()
+        return True
+
+    def _start(self):
+        """Caller holds the lock."""
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="notify-dispatcher", daemon=True)
+        self._thread.start()
+
+    def _take_due(self, force=False):
+        """Caller holds the lock. Moves digests whose window has closed to the ready list."""
+        now = time.monotonic()
+        for recipient, (opened_at, _) in list(self._open.items()):
+            if force or now - opened_at >= self.window_seconds:
+                self._ready.append((recipient, self._open.pop(recipient)[1]))
+        ready, self._ready = self._ready, []
+        return ready
+
+    def _next_due(self):
+        if not self._open:
+            return None
+        return max(0.0, min(opened_at for opened_at, _ in self._open.values()) + self.window_seconds - time.monotonic())
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._ready and not self._stopping:
+                    self._cond.wait(self._next_due())
+                ready = self._take_due(force=self._stopping)
+                stopping = self._stopping
+            for recipient, events in ready:
+                self._send(recipient, events)
+            if stopping and not ready:
+                return
+
+    def _send(self, recipient, events):
+        if deliver(self.transport or _default_transport(), recipient, events):
+            outcome = {"digests_sent": 1, "events_sent": len(events)}
+        else:
+            outcome = {"failed": len(events)}
+        with self._cond:
+            self._pending -= len(events)
+            for key, value in outcome.items():
+                self.stats[key] += value
+            self._cond.notify_all()
+
+    def flush(self, timeout=FLUSH_TIMEOUT_SECONDS):
+        """
+        Sends every buffered event now, on the calling thread (end of a batch, shutdown), then waits up to 'timeout' for digests the sender thread is still delivering.
+        """
+        with self._cond:
+            ready = self._take_due(force=True)
+        for recipient, events in ready:
+            self._send(recipient, events)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._pending and not self._open and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+
+    def close(self):
+        """Stops the background thread after it has sent everything still buffered."""
+        with self._cond:
+            thread, self._stopping = self._thread, True
+            self._cond.notify()
+        if thread is not None:
+            thread.join()
+        with self._cond:
+            self._thread = None
+        self.flush()
+
+    def snapshot(self):
+        with self._cond:
+            return dict(self.stats, pending=self._pending)
+
+
+class QueuePublisher:
+    """
+    Hands action events to an SQS queue instead of buffering them in the process (Lambda).
+    publish() is one SendMessage and never waits for email delivery; digest_handler, the
+    queue's only consumer, groups the events into digests. Same interface as Dispatcher.
+    """
+
+    def __init__(self, queue_url=QUEUE_URL, region=QUEUE_REGION):
+        self.queue_url = queue_url
+        self.region = region
+        self._lock = threading.Lock()
+        self.stats = {"published": 0, "dropped": 0}
+
+    def publish(self, product_id, action, details="", recipient=None, episode_id=None):
+        """Queues one action event. Returns False if the queue could not take it."""
+        event = dict(_new_event(product_id, action, details, episode_id), recipient=recipient or DEFAULT_RECIPIENT)
+        try:
+            aws_clients.client('sqs', self.region).send_message(QueueUrl=self.queue_url,
+                                                                MessageBody=json.dumps(event, default=str))
+            outcome = "published"
+        except Exception as e:
+            print(f"   ⚠️ [NOTIFY] Event for {product_id} not queued: {e}")
+            outcome = "dropped"
+        with self._lock:
+            self.stats[outcome] += 1
+        return outcome == "published"
+
+    def flush(self, timeout=FLUSH_TIMEOUT_SECONDS):
+        """Nothing is buffered here."""
+
+    def close(self):
+        """Nothing is buffered here."""
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, pending=0)
+
+
+def digest_handler(event, context):
+    """
+    SQS-triggered digest sender: the only consumer of NOTIFY_QUEUE_URL (reserved concurrency 1).
+    The event source mapping's batch size and MaximumBatchingWindowInSeconds (up to 300 s) set
+    how many events a digest collects. Events of digests that could not be sent are returned
+    as batchItemFailures (ReportBatchItemFailures), so SQS redelivers only those.
+    """
+    by_recipient = OrderedDict()
+    for record in event.get("Records", []):
+        body = json.loads(record["body"])
+        by_recipient.setdefault(body.pop("recipient", DEFAULT_RECIPIENT), []).append((record["messageId"], body))
+
+    transport = _default_transport()
+    failures = []
+    for recipient, entries in by_recipient.items():
+        for start in range(0, len(entries), DEFAULT_MAX_EVENTS):
+            chunk = entries[start:start + DEFAULT_MAX_EVENTS]
+            if not deliver(transport, recipient, [body for _, body in chunk]):
+                failures.extend({"itemIdentifier": message_id} for message_id, _ in chunk)
+    print(f"📬 [NOTIFY] {len(event.get('Records', [])) - len(failures)} event(s) sent as digests, {len(failures)} to retry")
+    return {"batchItemFailures": failures}
+
+
+_transport = None
+
+def _default_transport():
+    global _transport
+    if _transport is None:
+        _transport = transport_from_env()
+    return _transport
+
+# Process-wide publisher used by the tools: the SQS queue when NOTIFY_QUEUE_URL is set,
+# otherwise an in-process dispatcher (transport from NOTIFY_TRANSPORT)
+shared_dispatcher = QueuePublisher() if QUEUE_URL else Dispatcher()
+if os.environ.get("AWS_LAMBDA_FUNCTION_NAME") and not QUEUE_URL:
+    print("   ⚠️ [NOTIFY] NOTIFY_QUEUE_URL is not set: events buffered in a frozen Lambda may never be sent")
+# Short-lived processes (CLI runs, benchmarks) still deliver what is buffered when they exit
+atexit.register(lambda: shared_dispatcher.flush())
+
+def notify(product_id, action, details="", recipient=None, episode_id=None):
+    """Queues an action event on the shared dispatcher."""
+    return shared_dispatcher.publish(product_id, action, details, recipient=recipient, episode_id=episode_id)
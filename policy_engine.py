@@ -0,0 +1,204 @@
+import json
+from decimal import Decimal, ROUND_CEILING
+
+import demand_analytics
+import tools
+
+# --- BUSINESS RULES (mirrors SYSTEM_PROMPT in lambda_function.py) ---
+# Keep these in sync with the prompt: the fast path must reach the same
+# decision the model would reach for a rule-decidable trigger.
+LOW_STOCK_THRESHOLD = tools.RESTOCK_THRESHOLD
+RESTOCK_QUANTITY = 2000
+PROFIT_MARGIN = Decimal("1.10")    # Floor Price = cost_price * 1.10
+UNDERCUT_STEP = Decimal(1)         # Target Price = competitor_price - 1
+PRICE_STEP = Decimal("0.01")
+
+LOW_STOCK = "Low Stock"
+PRICE_DISADVANTAGE = "Price Disadvantage"
+PROFIT_PROTECTION = "Profit Protection"   # Our price sits below the floor (e.g. after a bad manual edit)
+
+
+# --- HELPERS ---
+
+def _to_decimal(value):
+    if value is None:
+        return None
+    try:
+        return Decimal(str(value))
+    except Exception:
+        return None
+
+def floor_price_for(cost_price):
+    """Minimum profitable price, rounded UP to the cent so we never dip below the margin."""
+    return (_to_decimal(cost_price) * PROFIT_MARGIN).quantize(PRICE_STEP, rounding=ROUND_CEILING)
+
+def floor_prices(cost_prices):
+    """
+    floor_price_for over a float array (catalog scans, simulations). Rounds before the
+    ceiling so float noise like 1.1 * 100 = 110.00000000000001 does not add a cent.
+    """
+    import numpy as np  # Deferred: only the batch paths need it, not the Lambda cold start
+    return np.ceil(np.round(np.asarray(cost_prices, dtype=float) * float(PROFIT_MARGIN) * 100, 6)) / 100
+
+
+def restock_quantity(product, stock):
+    """
+    Demand-driven order size from demand_analytics, never less than what lifts stock
+    back over the threshold. Falls back to RESTOCK_QUANTITY without sales history.
+    """
+    metrics = product.get('demand_metrics') or demand_analytics.tracker.metrics(
+        product['drug_id'], stock_level=stock, cost_price=product.get('cost_price'))
+    if not metrics or 'recommended_order_quantity' not in metrics:
+        return RESTOCK_QUANTITY
+    return max(int(metrics['recommended_order_quantity']), int(LOW_STOCK_THRESHOLD - stock) + 1)
+
+
+# --- DECISION LOGIC ---
+
+def decide(product, trigger_reason):
+    """
+    Evaluates the SYSTEM_PROMPT rules against a product record.
+    Returns a decision dict, or None when the rules cannot decide
+    (unknown trigger, missing/invalid fields) and the LLM must take over.
+    """
+    if not product or 'drug_id' not in product:
+        return None
+
+    if trigger_reason == LOW_STOCK:
+        stock = _to_decimal(product.get('stock_level'))
+        if stock is None:
+            return None
+        if stock >= LOW_STOCK_THRESHOLD:
+            return {"action": "none", "summary": f"Stock level {int(stock)} is healthy. No restock needed."}
+        return {"action": "restock", "quantity": restock_quantity(product, stock), "stock_level": int(stock)}
+
+    if trigger_reason == PRICE_DISADVANTAGE:
+        current = _to_decimal(product.get('current_price'))
+        competitor = _to_decimal(product.get('competitor_price'))
+        cost = _to_decimal(product.get('cost_price'))
+        if current is None or competitor is None or cost is None or cost <= 0:
+            return None
+
+        floor_price = floor_price_for(cost)
+        target_price = competitor - UNDERCUT_STEP
+        if target_price >= floor_price:
+            decision = {"action": "reprice", "scenario": "2A", "new_price": target_price}
+        else:
+            decision = {"action": "reprice", "scenario": "2B", "new_price": floor_price}
+        decision["floor_price"] = floor_price
+
+        if decision["new_price"] == current:
+            # Already holding the rule's price -> nothing to execute or report.
+            return {"action": "none", "summary": f"Price already at {current} TL. No change needed."}
+        return decision
+
+    if trigger_reason == PROFIT_PROTECTION:
+        current = _to_decimal(product.get('current_price'))
+        cost = _to_decimal(product.get('cost_price'))
+        if current is None or cost is None or cost <= 0:
+            return None
+
+        floor_price = floor_price_for(cost)
+        if current >= floor_price:
+            return {"action": "none", "summary": f"Price {current} TL is above the floor ({floor_price} TL)."}
+        return {"action": "reprice", "scenario": "3", "new_price": floor_price, "floor_price": floor_price}
+
+    return None
+
+
+# --- DETECTION ---
+
+def detect_trigger(product):
+    """
+    Scalar version of the anomaly rules (same precedence as catalog_scanner.evaluate_page):
+    Low Stock, then Profit Protection, then Price Disadvantage. Returns a reason or None.
+    """
+    stock = _to_decimal(product.get('stock_level'))
+    current = _to_decimal(product.get('current_price'))
+    competitor = _to_decimal(product.get('competitor_price'))
+    cost = _to_decimal(product.get('cost_price'))
+
+    if stock is not None and stock < LOW_STOCK_THRESHOLD:
+        return LOW_STOCK
+    if current is not None and cost is not None and cost > 0 and current < floor_price_for(cost):
+        return PROFIT_PROTECTION
+    if current is not None and competitor is not None and competitor < current:
+        return PRICE_DISADVANTAGE
+    return None
+
+
+# --- EXECUTION ---
+
+def execute(product, decision, episode_id=None):
+    """Runs the tools for a decision. Returns (success, summary)."""
+    product_id = product['drug_id']
+
+    if decision["action"] == "none":
+        return True, decision["summary"]
+
+    if decision["action"] == "restock":
+        result = tools.execute_tool_router("create_restock_order", {
+            "product_id": product_id,
+            "quantity": decision["quantity"],
+        }, episode_id=episode_id)
+        if "error" in result:
+            return False, f"Restock failed: {result['error']}"
+        if result.get("status") == "skipped":
+            return True, result["message"]
+        po_number = result["po_details"]["po_number"]
+        body = (f"Mr. Ahmet, stock for {product_id} dropped to {decision['stock_level']} units. "
+                f"I placed purchase order {po_number} for {decision['quantity']} units.")
+
+    elif decision["action"] == "reprice":
+        new_price = decision["new_price"]
+        if decision["scenario"] == "2A":
+            reason = "Undercutting competitor while staying above floor price"
+            body = f"Mr. Ahmet, I undercut the competitor to {new_price}. We remain profitable."
+        elif decision["scenario"] == "3":
+            reason = "Price below floor - raising to floor price"
+            body = (f"Mr. Ahmet, our price for {product_id} was below the Floor Price. "
+                    f"I raised it to {decision['floor_price']} to protect margins.")
+        else:
+            reason = "Competitor below floor price - holding at floor"
+            body = (f"Mr. Ahmet, the competitor's price is predatory. I held our price at the "
+                    f"Floor Price ({decision['floor_price']}) to protect margins.")
+        inputs = {"product_id": product_id, "new_price": float(new_price), "reason": reason}
+        if product.get('competitor_price') is not None:
+            # Guard: only reprice if the market hasn't moved since we decided
+            inputs["expected_competitor_price"] = float(product['competitor_price'])
+        result = tools.execute_tool_router("update_product_price", inputs, episode_id=episode_id)
+        if "error" in result:
+            return False, f"Price update failed: {result['error']}"
+        if result.get("status") == "skipped":
+            return True, result["message"]
+
+    else:
+        return False, f"Unknown action: {decision['action']}"
+
+    # The tool has queued the action event for the notification digest
+    return True, body
+
+
+def run_fast_path(product_id, trigger_reason, product=None, episode_id=None):
+    """
+    Tries to handle a trigger without Bedrock.
+    'product' is an optional pre-fetched snapshot; otherwise the record is fetched.
+    Returns a lambda-style response dict, or None if the LLM loop must handle it.
+    """
+    if product is None:
+        product = tools.execute_tool_router("get_product_market_data", {"product_id": product_id})
+    if "error" in product:
+        return None
+
+    decision = decide(product, trigger_reason)
+    if decision is None:
+        return None
+
+    print(f"   ⚡ [POLICY] Rule-decidable trigger '{trigger_reason}' -> {decision['action']}")
+    success, summary = execute(product, decision, episode_id=episode_id)
+    return {
+        'statusCode': 200 if success else 500,
+        'body': json.dumps(summary),
+        'path': "fast_path",
+        'metrics': {"turns": 0, "input_tokens": 0, "output_tokens": 0, "total_tokens": 0},
+    }
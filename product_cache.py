@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import rate_limiter
+import tracing
+
+# --- CONSISTENCY MODES ---
+CACHED = "cached"        # Serve from cache while fresh; eventually consistent read on miss
+EVENTUAL = "eventual"    # Always read DynamoDB (eventually consistent), refresh the cache
+STRONG = "strong"        # Always read DynamoDB with ConsistentRead=True, refresh the cache
+
+# --- CONFIGURATION ---
+DEFAULT_TTL_SECONDS = float(os.environ.get("PRODUCT_CACHE_TTL", "2.0"))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("PRODUCT_CACHE_SIZE", "1024"))
+
+
+class ProductStateCache:
+    """
+    Thread-safe LRU + TTL cache of 'pharma_products' items keyed by drug_id.
+    Writers should call put() with the item returned by DynamoDB (ReturnValues="ALL_NEW")
+    or invalidate() when the new state is unknown.
+    """
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # drug_id -> (expires_at, item)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.db_reads = 0
+        self.writes = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def lookup(self, product_id):
+        """Returns a copy of the cached item, or None on miss/expiry."""
+        with self._lock:
+            entry = self._entries.get(product_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[product_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(product_id)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, product_id, item):
+        """Write-through: stores the latest known state of a product."""
+        with self._lock:
+            self._entries[product_id] = (time.monotonic() + self.ttl_seconds, dict(item))
+            self._entries.move_to_end(product_id)
+            self.writes += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, product_id):
+        with self._lock:
+            if self._entries.pop(product_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_item(self, table, product_id, consistency=CACHED):
+        """
+        Read-through access to a product item.
+        Returns the item dict, or None if the product does not exist.
+        DynamoDB errors propagate to the caller.
+        """
+        if consistency == CACHED:
+            item = self.lookup(product_id)
+            if item is not None:
+                return item
+
+        with tracing.span(tracing.DB_CALL, "get_item", product_id=product_id, consistency=consistency):
+            # Strongly consistent reads cost a full RCU, eventually consistent ones half
+            response = rate_limiter.call(rate_limiter.table_limiter(table.name), table.get_item,
+                                         cost=1.0 if consistency == STRONG else 0.5,
+                                         Key={'drug_id': product_id}, ConsistentRead=(consistency == STRONG))
+        with self._lock:
+            self.db_reads += 1
+        item = response.get('Item')
+        if item is None:
+            self.invalidate(product_id)
+            return None
+        self.put(product_id, item)
+        return dict(item)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "db_reads": self.db_reads,
+                "writes": self.writes,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+            }
+
+
+# Process-wide instance shared by tools.py and dashboard.py
+shared_cache = ProductStateCache()
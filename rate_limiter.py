@@ -0,0 +1,372 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import tracing
+
+# --- CONFIGURATION ---
+# Rate (units/s) per limiter. A table limiter counts capacity units (reads and writes separately),
+# a model limiter counts requests. The configured rate is also the ceiling: the rate halves on a
+# throttle and, while calls succeed, climbs back by INCREASE_FRACTION of it per second.
+# Provisioned (RCU, WCU) per table, as created by creating_tables/create_data.py.
+# Override with RATE_LIMIT_CAPACITY="pharma_products=100/50,..." (read/write).
+TABLE_CAPACITY = {
+    "pharma_products": (1.0, 1.0),
+    "sales_transactions": (5.0, 5.0),
+    "supply_chain_actions": (1.0, 1.0),
+}
+for _spec in filter(None, os.environ.get("RATE_LIMIT_CAPACITY", "").split(",")):
+    _name, _, _value = _spec.rpartition("=")
+    _read, _, _write = _value.partition("/")
+    TABLE_CAPACITY[_name.strip()] = (float(_read), float(_write or _read))
+DEFAULT_TABLE_RATE = float(os.environ.get("RATE_LIMIT_TABLE_RATE", "5"))  # Tables not in TABLE_CAPACITY
+# A table bucket holds this many seconds of capacity. DynamoDB itself keeps up to 300 s of unused
+# capacity as burst, so this stays well inside what the table accepts without throttling.
+TABLE_BURST_SECONDS = float(os.environ.get("RATE_LIMIT_TABLE_BURST", "5"))
+MIN_TABLE_BURST = 2.0  # A transactional write costs 2 units per item: every bucket takes one at once
+DEFAULT_MODEL_RATE = float(os.environ.get("RATE_LIMIT_MODEL_RATE", "10"))
+INCREASE_FRACTION = float(os.environ.get("RATE_LIMIT_INCREASE", "0.1"))
+DECREASE_FACTOR = 0.5
+DEFAULT_DEADLINE_SECONDS = float(os.environ.get("RATE_LIMIT_DEADLINE", "20"))
+BACKOFF_BASE_SECONDS = 0.05
+BACKOFF_CAP_SECONDS = 2.0
+BATCH_WRITE_LIMIT = 25   # DynamoDB BatchWriteItem request limit
+BATCH_GET_LIMIT = 100    # DynamoDB BatchGetItem key limit
+BATCH_MAX_RETRIES = 8    # Rounds of UnprocessedItems / UnprocessedKeys retries per request
+ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "1") != "0"
+
+# Per-limiter overrides: "dynamodb:pharma_products:write=2/4,bedrock:<model id>=1/2" (rate/burst)
+OVERRIDES = {}
+for _spec in filter(None, os.environ.get("RATE_LIMITS", "").split(",")):
+    _name, _, _value = _spec.rpartition("=")
+    _rate, _, _burst = _value.partition("/")
+    OVERRIDES[_name.strip()] = (float(_rate), float(_burst or _rate))
+
+# AWS error codes that mean "slow down"
+THROTTLE_CODES = frozenset({
+    "ProvisionedThroughputExceededException", "ThrottlingException", "Throttling",
+    "RequestLimitExceeded", "TooManyRequestsException", "ServiceQuotaExceededException",
+})
+
+READ = "read"
+WRITE = "write"
+
+
+class RateLimitTimeout(Exception):
+    """The call could not get capacity (or stop being throttled) before its deadline."""
+
+
+def is_throttle(error):
+    """True for botocore ClientErrors that carry a throttling code (no botocore import needed)."""
+    response = getattr(error, "response", None) or {}
+    code = response.get("Error", {}).get("Code")
+    if code == "TransactionCanceledException":
+        # A transaction is cancelled as a whole when one of its items was throttled
+        return any(r.get("Code") in ("ThrottlingError", "ProvisionedThroughputExceeded")
+                   for r in response.get("CancellationReasons", []))
+    return code in THROTTLE_CODES
+
+
+class AdaptiveLimiter:
+    """
+    Token bucket whose refill rate adapts to the service (AIMD).
+    acquire() reserves tokens in arrival order, so concurrent callers queue behind
+    each other and share the rate instead of bursting into throttles. A request that
+    costs more than the burst waits for a full bucket and leaves the rest as debt,
+    which the callers behind it wait out.
+    """
+
+    def __init__(self, name, rate, burst=None, min_rate=None, max_rate=None):
+        self.name = name
+        self.initial_rate = rate
+        self.rate = rate
+        self.burst = burst or rate
+        self.min_rate = min_rate or max(rate / 50.0, 0.1)
+        self.max_rate = max_rate or rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        self._last_increase = 0.0
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=1000)  # Recent queue waits (s), for percentiles
+        self.acquired = 0
+        self.waited = 0
+        self.throttles = 0
+        self.timeouts = 0
+
+    def configure(self, rate, burst=None):
+        """Sets a new configured rate (and ceiling), e.g. after the table's capacity changed."""
+        with self._lock:
+            self.initial_rate = self.rate = self.max_rate = rate
+            self.burst = burst or rate
+            self.min_rate = max(rate / 50.0, 0.1)
+            self._tokens = min(self._tokens, self.burst)
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def on_success(self):
+        """Additive increase: one step per second of successful calls, never while idle or above max_rate."""
+        if self.rate >= self.max_rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_decrease > 1.0 and now - self._last_increase >= 1.0:
+                self._refill(now)
+                self.rate = min(self.max_rate, self.rate + self.initial_rate * INCREASE_FRACTION)
+                self._last_increase = now
+
+    def acquire(self, cost=1.0, deadline=None):
+        """Blocks until 'cost' tokens are available. Returns the wait in seconds."""
+        wait = self.reserve(cost, deadline)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def reserve(self, cost=1.0, deadline=None):
+        """Takes 'cost' tokens and returns how long the caller has to wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0.0, (min(cost, self.burst) - self._tokens) / self.rate)
+            if deadline is not None and now + wait > deadline:
+                self.timeouts += 1
+                raise RateLimitTimeout(f"{self.name}: no capacity within the deadline (rate {self.rate:.2f}/s)")
+            self._tokens -= cost  # May go negative: later callers wait behind this reservation
+            self.acquired += 1
+            if wait:
+                self.waited += 1
+            self._waits.append(wait)
+        return wait
+
+    def release(self, cost):
+        """Gives back tokens reserved for a call that is not made."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.burst, self._tokens + cost)
+
+    def charge(self, units):
+        """Debits tokens after the fact, e.g. when a call consumed more than it reserved."""
+        if units <= 0:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= units  # Later callers wait for the difference
+
+    def on_throttle(self):
+        """Multiplicative decrease, at most once per second so a burst of throttles counts once."""
+        with self._lock:
+            self.throttles += 1
+            now = time.monotonic()
+            self._refill(now)
+            if now - self._last_decrease > 1.0:
+                self.rate = max(self.min_rate, self.rate * DECREASE_FACTOR)
+                self._last_decrease = now
+            self._tokens = min(self._tokens, 0.0)
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(w * 1000 for w in self._waits)
+            return {
+                "rate": round(self.rate, 2),
+                "acquired": self.acquired,
+                "waited": self.waited,
+                "throttles": self.throttles,
+                "timeouts": self.timeouts,
+                "wait_p50_ms": round(tracing.percentile(waits, 50), 2) if waits else 0.0,
+                "wait_p95_ms": round(tracing.percentile(waits, 95), 2) if waits else 0.0,
+                "wait_max_ms": round(waits[-1], 2) if waits else 0.0,
+            }
+
+
+# --- SHARED LIMITERS ---
+
+_limiters = {}
+_lock = threading.Lock()
+
+def limiter(name, rate, burst=None):
+    """Process-wide limiter by name, created on first use (RATE_LIMITS overrides rate/burst)."""
+    existing = _limiters.get(name)
+    if existing is not None:
+        return existing
+    with _lock:
+        if name not in _limiters:
+            rate, burst = OVERRIDES.get(name, (rate, burst))
+            _limiters[name] = AdaptiveLimiter(name, rate, burst)
+        return _limiters[name]
+
+def _table_rate(table_name, mode):
+    read_units, write_units = TABLE_CAPACITY.get(table_name, (DEFAULT_TABLE_RATE, DEFAULT_TABLE_RATE))
+    return read_units if mode == READ else write_units
+
+def table_burst(rate):
+    return max(rate * TABLE_BURST_SECONDS, MIN_TABLE_BURST)
+
+def table_limiter(table_name, mode=READ):
+    """Limiter for one table and mode, at the table's provisioned capacity (TABLE_CAPACITY)."""
+    rate = _table_rate(table_name, mode)
+    return limiter(f"dynamodb:{table_name}:{mode}", rate, table_burst(rate))
+
+def configure_table(table_name, read_units=None, write_units=None):
+    """Sets a table's capacity (e.g. from describe_table or a simulated table); live limiters follow."""
+    read_default, write_default = TABLE_CAPACITY.get(table_name, (DEFAULT_TABLE_RATE, DEFAULT_TABLE_RATE))
+    TABLE_CAPACITY[table_name] = (float(read_units or read_default), float(write_units or write_default))
+    for mode in (READ, WRITE):
+        existing = _limiters.get(f"dynamodb:{table_name}:{mode}")
+        if existing is not None:
+            rate = _table_rate(table_name, mode)
+            existing.configure(rate, table_burst(rate))
+
+def model_limiter(model_id):
+    return limiter(f"bedrock:{model_id}", DEFAULT_MODEL_RATE, DEFAULT_MODEL_RATE)
+
+def set_enabled(enabled):
+    """Turns limiting on/off process-wide (e.g. against in-memory stand-ins). Returns the previous value."""
+    global ENABLED
+    previous, ENABLED = ENABLED, enabled
+    return previous
+
+def stats():
+    with _lock:
+        limiters = list(_limiters.values())
+    return {l.name: l.stats() for l in limiters}
+
+def reset():
+    with _lock:
+        _limiters.clear()
+
+
+# --- CALLS ---
+
+def _reserve(limiters, cost, deadline):
+    """Reserves 'cost' on every limiter. Returns the longest wait: the buckets refill side by side."""
+    reserved = []
+    try:
+        for bucket in limiters:
+            reserved.append((bucket, bucket.reserve(cost, deadline)))
+    except RateLimitTimeout:
+        for bucket, _ in reserved:
+            bucket.release(cost)
+        raise
+    return max(wait for _, wait in reserved)
+
+def call(limiters, fn, *args, cost=1.0, deadline_seconds=DEFAULT_DEADLINE_SECONDS, **kwargs):
+    """
+    Runs fn(*args, **kwargs) once every limiter in 'limiters' has granted 'cost' tokens.
+    Throttling errors lower the limiters' rate and are retried with full-jitter backoff
+    until the deadline (deadline_seconds=None: no deadline, for background work); any
+    other error propagates. The wait and retry count are added to the current trace span.
+    """
+    if not ENABLED:
+        return fn(*args, **kwargs)
+    if isinstance(limiters, AdaptiveLimiter):
+        limiters = (limiters,)
+    deadline = None if deadline_seconds is None else time.monotonic() + deadline_seconds
+    waited = 0.0
+    attempt = 0
+    span = tracing.current_span()
+    try:
+        while True:
+            wait = _reserve(limiters, cost, deadline)
+            if wait:
+                time.sleep(wait)
+                waited += wait
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                if not is_throttle(e):
+                    raise
+                for bucket in limiters:
+                    bucket.on_throttle()
+                attempt += 1
+                backoff = random.uniform(0, min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+                if deadline is not None and time.monotonic() + backoff > deadline:
+                    raise
+                print(f"   🚦 [LIMITER] {limiters[0].name} throttled, retry {attempt} in {backoff * 1000:.0f} ms")
+                time.sleep(backoff)
+                waited += backoff
+                continue
+            for bucket in limiters:
+                bucket.on_success()
+            return result
+    finally:
+        if span is not None:
+            span.set(rate_wait_ms=round(waited * 1000, 2), throttle_retries=attempt)
+
+
+# --- BATCH REQUESTS (BatchWriteItem / BatchGetItem) ---
+
+def batch_size(bucket, unit_cost, limit):
+    """Entries per request, so that one request fits in the bucket's burst (at least one)."""
+    if not ENABLED:
+        return limit
+    return max(1, min(limit, int(bucket.burst / unit_cost)))
+
+def _send_batches(send, operation, table_name, entries, limit, unit_cost, bucket, request_of, unprocessed_of,
+                  max_retries, deadline_seconds):
+    """
+    Sends 'entries' in requests sized to the bucket, each paced by call() as it goes.
+    What comes back unprocessed slows the bucket down and is retried with backoff.
+    Returns (entries done, entries left, responses, requests, retries, error); after an
+    error every entry not done yet is left.
+    """
+    done, left, responses, requests, retries = 0, [], [], 0, 0
+    size = batch_size(bucket, unit_cost, limit)
+    for start in range(0, len(entries), size):
+        chunk = entries[start:start + size]
+        try:
+            for attempt in range(max_retries + 1):
+                with tracing.span(tracing.DB_CALL, operation, items=len(chunk)):
+                    response = call(bucket, send, cost=unit_cost * len(chunk), deadline_seconds=deadline_seconds,
+                                    RequestItems={table_name: request_of(chunk)})
+                requests += 1
+                responses.append(response)
+                unprocessed = unprocessed_of(response)
+                done += len(chunk) - len(unprocessed)
+                chunk = unprocessed
+                if not chunk or attempt == max_retries:
+                    break
+                retries += 1
+                if ENABLED:
+                    bucket.on_throttle()  # Unprocessed entries mean the table is over its capacity
+                time.sleep(min(BACKOFF_BASE_SECONDS * 2 ** attempt, BACKOFF_CAP_SECONDS))
+        except Exception as e:
+            return done, left + chunk + entries[start + size:], responses, requests, retries, e
+        left.extend(chunk)
+    return done, left, responses, requests, retries, None
+
+def batch_write(send, table_name, requests, bucket=None, max_retries=BATCH_MAX_RETRIES,
+                deadline_seconds=DEFAULT_DEADLINE_SECONDS):
+    """
+    Writes PutRequest / DeleteRequest entries to one table. 'send' is a batch_write_item
+    (e.g. the resource's meta.client one). Each request holds at most 25 entries and no more
+    than the table's write bucket, at one WCU per entry (items under 1 KB).
+    Returns {"written", "unwritten": [entries], "requests", "retries", "error"}.
+    """
+    bucket = bucket or table_limiter(table_name, WRITE)
+    written, unwritten, _, sent, retries, error = _send_batches(
+        send, "batch_write_item", table_name, list(requests), BATCH_WRITE_LIMIT, 1.0, bucket,
+        lambda chunk: chunk,
+        lambda response: (response.get('UnprocessedItems') or {}).get(table_name, []),
+        max_retries, deadline_seconds)
+    return {"written": written, "unwritten": unwritten, "requests": sent, "retries": retries, "error": error}
+
+def batch_get(send, table_name, keys, bucket=None, max_retries=BATCH_MAX_RETRIES,
+              deadline_seconds=DEFAULT_DEADLINE_SECONDS):
+    """
+    Reads items of one table by key. 'send' is a batch_get_item. Each request holds at most
+    100 keys and no more than the table's read bucket, at 0.5 RCU per key (eventually
+    consistent reads of items up to 4 KB).
+    Returns {"items", "unread": [keys], "requests", "retries", "error"}.
+    """
+    bucket = bucket or table_limiter(table_name, READ)
+    _, unread, responses, sent, retries, error = _send_batches(
+        send, "batch_get_item", table_name, list(keys), BATCH_GET_LIMIT, 0.5, bucket,
+        lambda chunk: {'Keys': chunk},
+        lambda response: (response.get('UnprocessedKeys') or {}).get(table_name, {}).get('Keys', []),
+        max_retries, deadline_seconds)
+    items = [item for response in responses for item in response.get('Responses', {}).get(table_name, [])]
+    return {"items": items, "unread": unread, "requests": sent, "retries": retries, "error": error}
@@ -0,0 +1,682 @@
+import argparse
+import copy
+import hashlib
+import json
+import re
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from decimal import Decimal
+
+from botocore.exceptions import ClientError
+
+import aws_clients
+import lambda_function
+import notifications
+import policy_engine
+import rate_limiter
+import streaming
+import tools
+import tracing
+from product_cache import shared_cache
+
+# --- CONFIGURATION ---
+# Key attribute of every table the agent touches (see creating_tables/create_data.py)
+KEY_SCHEMA = {
+    'pharma_products': 'drug_id',
+    'supply_chain_actions': 'action_id',
+    'sales_transactions': 'transaction_id',
+}
+
+# Canned products for the demo scenarios (README "Simulation Scenarios")
+SCENARIOS = {
+    "low_stock": {
+        "trigger_reason": policy_engine.LOW_STOCK,
+        "product": {"stock_level": Decimal(300), "current_price": Decimal(100),
+                    "competitor_price": Decimal(100), "cost_price": Decimal(60)},
+    },
+    "price_war": {
+        "trigger_reason": policy_engine.PRICE_DISADVANTAGE,
+        "product": {"stock_level": Decimal(5000), "current_price": Decimal(100),
+                    "competitor_price": Decimal(90), "cost_price": Decimal(60)},
+    },
+    "profit_protection": {
+        "trigger_reason": policy_engine.PROFIT_PROTECTION,
+        "product": {"stock_level": Decimal(5000), "current_price": Decimal(60),
+                    "competitor_price": Decimal(90), "cost_price": Decimal(60)},
+    },
+}
+
+_PRODUCT_RE = re.compile(r"Analyze product: '([^']*)'")
+_TRIGGER_RE = re.compile(r"CRITICAL TRIGGER REASON: '([^']*)'")
+_SNAPSHOT_RE = re.compile(r"CURRENT PRODUCT DATA[^\n]*\n\s*(\{.*\})\s*\n")
+
+
+class ReplayMiss(LookupError):
+    """The corpus has no recorded response for this conversation state."""
+
+
+# --- IN-MEMORY DYNAMODB ---
+
+def _condition_failed(operation, message="The conditional request failed"):
+    return ClientError({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': message}}, operation)
+
+def _operand(token, item, values, names):
+    token = token.strip()
+    if token.startswith(':'):
+        return values[token]
+    return item.get(names.get(token, token))
+
+def _evaluate_condition(expression, item, values, names):
+    """Supports the subset the agent uses: AND-joined comparisons and attribute_(not_)exists."""
+    if not expression:
+        return True
+    for clause in re.split(r"\s+AND\s+", expression.strip(), flags=re.IGNORECASE):
+        clause = clause.strip()
+        match = re.fullmatch(r"(attribute_exists|attribute_not_exists)\(\s*([#\w]+)\s*\)", clause)
+        if match:
+            exists = names.get(match.group(2), match.group(2)) in item
+            if exists != (match.group(1) == "attribute_exists"):
+                return False
+            continue
+        match = re.fullmatch(r"([#:\w]+)\s*(<>|<=|>=|=|<|>)\s*([#:\w]+)", clause)
+        if not match:
+            raise ValueError(f"Unsupported condition expression: {clause}")
+        left = _operand(match.group(1), item, values, names)
+        right = _operand(match.group(3), item, values, names)
+        op = match.group(2)
+        if left is None or right is None:
+            if op == "<>" and (left is None) != (right is None):
+                continue
+            return False
+        if not {"=": left == right, "<>": left != right, "<": left < right,
+                "<=": left <= right, ">": left > right, ">=": left >= right}[op]:
+            return False
+    return True
+
+def _apply_update(expression, item, values, names):
+    """Supports 'SET a = :x, b = b + :y' (and '-')."""
+    match = re.fullmatch(r"\s*SET\s+(.*)", expression, flags=re.IGNORECASE | re.DOTALL)
+    if not match:
+        raise ValueError(f"Unsupported update expression: {expression}")
+    for assignment in match.group(1).split(','):
+        target, value = assignment.split('=', 1)
+        target = names.get(target.strip(), target.strip())
+        arithmetic = re.fullmatch(r"\s*([#:\w]+)\s*([+-])\s*([#:\w]+)\s*", value)
+        if arithmetic:
+            left = _operand(arithmetic.group(1), item, values, names)
+            right = _operand(arithmetic.group(3), item, values, names)
+            if left is None or right is None:
+                raise ClientError({'Error': {'Code': 'ValidationException',
+                                             'Message': "An operand in the update expression has an incorrect data type"}},
+                                  'UpdateItem')
+            item[target] = left + right if arithmetic.group(2) == '+' else left - right
+        else:
+            item[target] = copy.deepcopy(_operand(value, item, values, names))
+
+
+class ProvisionedCapacity:
+    """
+    Simulated provisioned throughput: a token bucket that throttles instead of waiting.
+    DynamoDB keeps up to 300 s of unused capacity as burst; the stand-in keeps burst_seconds,
+    so sustained overload throttles quickly.
+    """
+
+    def __init__(self, units_per_second, code="ProvisionedThroughputExceededException", burst_seconds=10.0):
+        self.rate = float(units_per_second)
+        self.code = code
+        self.burst = max(self.rate * burst_seconds, 2.0)  # A transaction item (2 units) always fits
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.consumed = 0
+        self.throttled = 0
+
+    def consume(self, units, operation, partial=False):
+        """
+        Takes 'units' of capacity, raising a throttling error when they are not available.
+        With partial=True whatever whole units are available are taken instead, and the
+        count is returned (it only raises when none are).
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            granted = min(units, int(self._tokens)) if partial else units
+            if granted <= 0 or self._tokens < granted:
+                self.throttled += 1
+                raise ClientError({'Error': {'Code': self.code, 'Message': "Rate of requests exceeds the allowed throughput"}},
+                                  operation)
+            self._tokens -= granted
+            self.consumed += granted
+            return granted
+
+
+class InMemoryTable:
+    """Dict-backed stand-in for a boto3 Table resource (the calls the agent makes)."""
+
+    def __init__(self, name, store, lock, write_capacity=None):
+        self.name = name
+        self.key = KEY_SCHEMA.get(name, 'id')
+        self._items = store
+        self._lock = lock
+        self.write_capacity = write_capacity  # ProvisionedCapacity, or None for unlimited
+
+    def get_item(self, Key, ConsistentRead=False):
+        with self._lock:
+            item = self._items.get(Key[self.key])
+            return {'Item': copy.deepcopy(item)} if item is not None else {}
+
+    def put_item(self, Item, ConditionExpression=None, ExpressionAttributeValues=None,
+                 ExpressionAttributeNames=None):
+        with self._lock:
+            current = self._items.get(Item[self.key], {})
+            if not _evaluate_condition(ConditionExpression, current, ExpressionAttributeValues or {},
+                                       ExpressionAttributeNames or {}):
+                raise _condition_failed('PutItem')
+            self._items[Item[self.key]] = copy.deepcopy(Item)
+        return {}
+
+    def delete_item(self, Key):
+        with self._lock:
+            self._items.pop(Key[self.key], None)
+        return {}
+
+    def update_item(self, Key, UpdateExpression, ConditionExpression=None, ExpressionAttributeValues=None,
+                    ExpressionAttributeNames=None, ReturnValues="NONE"):
+        if self.write_capacity is not None:
+            self.write_capacity.consume(1, 'UpdateItem')
+        with self._lock:
+            item = self._update(Key, UpdateExpression, ConditionExpression,
+                                ExpressionAttributeValues or {}, ExpressionAttributeNames or {}, 'UpdateItem')
+            return {'Attributes': copy.deepcopy(item)} if ReturnValues == "ALL_NEW" else {}
+
+    def _update(self, key, update_expression, condition, values, names, operation):
+        """Caller holds the lock. Applies the update to a copy and swaps it in only on success."""
+        current = self._items.get(key[self.key])
+        item = copy.deepcopy(current) if current is not None else dict(key)
+        if not _evaluate_condition(condition, current or {}, values, names):
+            raise _condition_failed(operation)
+        _apply_update(update_expression, item, values, names)
+        self._items[key[self.key]] = item
+        return item
+
+    def scan(self, Segment=0, TotalSegments=1, Limit=None, ExclusiveStartKey=None, ReturnConsumedCapacity='NONE'):
+        with self._lock:
+            keys = sorted(k for k in self._items if zlib.crc32(str(k).encode()) % TotalSegments == Segment)
+            if ExclusiveStartKey is not None:
+                keys = [k for k in keys if k > ExclusiveStartKey[self.key]]
+            page = keys[:Limit] if Limit else keys
+            response = {'Items': [copy.deepcopy(self._items[k]) for k in page], 'Count': len(page)}
+            if Limit and len(keys) > Limit:
+                response['LastEvaluatedKey'] = {self.key: page[-1]}
+            if ReturnConsumedCapacity != 'NONE':
+                # Eventually consistent read: 0.5 unit per started 4 KB of items read
+                size = sum(len(json.dumps(item, cls=tools.DecimalEncoder, default=str)) for item in response['Items'])
+                response['ConsumedCapacity'] = {'TableName': self.name,
+                                                'CapacityUnits': max(1, -(-size // 4096)) * 0.5}
+            return response
+
+    def item_count(self):
+        with self._lock:
+            return len(self._items)
+
+
+class _ClientMeta:
+    def __init__(self, client):
+        self.client = client
+
+
+class InMemoryDynamoDB:
+    """
+    Offline stand-in for the boto3 DynamoDB resource used by tools.py.
+    Covers Table(), batch_get_item and, through meta.client, transact_write_items and
+    batch_write_item with native (non-serialized) values, like the resource's own client.
+    write_capacity (WCU/s per table) makes writes throttle like a provisioned table.
+    """
+
+    def __init__(self, write_capacity=None):
+        self._lock = threading.RLock()
+        self._tables = {}
+        self.write_capacity = write_capacity
+        self.meta = _ClientMeta(self)
+
+    def Table(self, name):
+        with self._lock:
+            if name not in self._tables:
+                capacity = ProvisionedCapacity(self.write_capacity) if self.write_capacity else None
+                self._tables[name] = InMemoryTable(name, {}, self._lock, capacity)
+            return self._tables[name]
+
+    def throttled(self):
+        """Throttled write requests per table (simulated capacity only)."""
+        with self._lock:
+            return {name: t.write_capacity.throttled for name, t in self._tables.items() if t.write_capacity}
+
+    def seed(self, items, table_name='pharma_products'):
+        table = self.Table(table_name)
+        for item in items:
+            table.put_item(Item=item)
+        return table
+
+    def batch_get_item(self, RequestItems):
+        responses = {}
+        for table_name, request in RequestItems.items():
+            table = self.Table(table_name)
+            responses[table_name] = [r['Item'] for r in (table.get_item(Key=key) for key in request['Keys'])
+                                     if 'Item' in r]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def batch_write_item(self, RequestItems):
+        """Like DynamoDB, writes what the capacity allows and returns the rest as UnprocessedItems."""
+        unprocessed = {}
+        for table_name, requests in RequestItems.items():
+            table = self.Table(table_name)
+            if table.write_capacity is not None:
+                granted = table.write_capacity.consume(len(requests), 'BatchWriteItem', partial=True)
+                if granted < len(requests):
+                    requests, unprocessed[table_name] = requests[:granted], requests[granted:]
+            for request in requests:
+                if 'PutRequest' in request:
+                    table.put_item(Item=request['PutRequest']['Item'])
+                else:
+                    table.delete_item(Key=request['DeleteRequest']['Key'])
+        return {'UnprocessedItems': unprocessed}
+
+    def transact_write_items(self, TransactItems):
+        """All-or-nothing: every condition is checked before anything is written."""
+        for entry in TransactItems:
+            table = self.Table(next(iter(entry.values()))['TableName'])
+            if table.write_capacity is not None:
+                table.write_capacity.consume(2, 'TransactWriteItems')  # Transactions cost 2 WCU per item
+        with self._lock:
+            reasons = []
+            for entry in TransactItems:
+                operation, spec = next(iter(entry.items()))
+                table = self.Table(spec['TableName'])
+                key = spec['Key'] if operation != 'Put' else {table.key: spec['Item'][table.key]}
+                current = table._items.get(key[table.key]) or {}
+                ok = _evaluate_condition(spec.get('ConditionExpression'), current,
+                                         spec.get('ExpressionAttributeValues', {}),
+                                         spec.get('ExpressionAttributeNames', {}))
+                reasons.append({'Code': 'None'} if ok else {'Code': 'ConditionalCheckFailed',
+                                                            'Message': "The conditional request failed"})
+            if any(r['Code'] != 'None' for r in reasons):
+                raise ClientError({'Error': {'Code': 'TransactionCanceledException',
+                                             'Message': "Transaction cancelled"},
+                                   'CancellationReasons': reasons}, 'TransactWriteItems')
+
+            for entry in TransactItems:
+                operation, spec = next(iter(entry.items()))
+                table = self.Table(spec['TableName'])
+                if operation == 'Put':
+                    table._items[spec['Item'][table.key]] = copy.deepcopy(spec['Item'])
+                elif operation == 'Update':
+                    table._update(spec['Key'], spec['UpdateExpression'], None,
+                                  spec.get('ExpressionAttributeValues', {}),
+                                  spec.get('ExpressionAttributeNames', {}), 'TransactWriteItems')
+                elif operation == 'Delete':
+                    table._items.pop(spec['Key'][table.key], None)
+        return {}
+
+
+# --- CORPUS ---
+
+def _plain(value):
+    """JSON-safe copy of a Bedrock request/response (Decimals become numbers)."""
+    return json.loads(json.dumps(value, cls=tools.DecimalEncoder, default=str))
+
+def to_item(value):
+    """Corpus JSON back to DynamoDB-style values (numbers as Decimal)."""
+    return json.loads(json.dumps(value), parse_float=Decimal, parse_int=Decimal)
+
+def parse_prompt(messages):
+    """Returns (product_id, trigger_reason, product_snapshot) from the first user message."""
+    text = messages[0]['content'][0]['text']
+    product = _PRODUCT_RE.search(text)
+    trigger = _TRIGGER_RE.search(text)
+    snapshot = _SNAPSHOT_RE.search(text)
+    return (product.group(1) if product else None,
+            trigger.group(1) if trigger else None,
+            json.loads(snapshot.group(1)) if snapshot else None)
+
+def conversation_key(messages):
+    """
+    Identifies a conversation state independently of the product id:
+    hash of the initial prompt with the id masked, plus the number of model turns so far.
+    """
+    text = messages[0]['content'][0]['text']
+    product = _PRODUCT_RE.search(text)
+    product_id = product.group(1) if product else None
+    if product_id:
+        text = text.replace(product_id, "{product_id}")
+    turn = sum(1 for message in messages if message['role'] == "assistant")
+    return f"{hashlib.sha1(text.encode()).hexdigest()[:16]}:{turn}", product_id
+
+def _trace_id():
+    current = tracing.current_span()
+    return current.trace_id if current else None
+
+
+class CorpusWriter:
+    """Appends corpus records as JSON lines. Safe across threads."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", buffering=1)
+
+    def write(self, record):
+        line = json.dumps(record, cls=tools.DecimalEncoder, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+def load_corpus(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# --- BEDROCK STAND-INS ---
+
+class RecordingBedrock:
+    """Wraps a bedrock-runtime client and writes every converse request/response to the corpus."""
+
+    def __init__(self, client, writer):
+        self._client = client
+        self._writer = writer
+
+    def converse(self, **kwargs):
+        response = self._client.converse(**kwargs)
+        self._record(kwargs, response)
+        return response
+
+    def converse_stream(self, **kwargs):
+        """Passes the chunks through and records the assembled response once the stream ends."""
+        response = self._client.converse_stream(**kwargs)
+        return dict(response, stream=self._tee(kwargs, response['stream']))
+
+    def _tee(self, request, stream):
+        assembler = streaming.MessageAssembler()
+        for chunk in stream:
+            assembler.feed(chunk)
+            yield chunk
+        self._record(request, assembler.response())
+
+    def _record(self, request, response):
+        key, product_id = conversation_key(request['messages'])
+        self._writer.write({
+            "kind": "converse", "key": key, "product_id": product_id, "trace_id": _trace_id(),
+            "request": _plain({"messages": request['messages']}),
+            "response": _plain({k: v for k, v in response.items() if k != 'ResponseMetadata'}),
+        })
+
+
+class ReplayBedrock:
+    """
+    Serves recorded converse responses by conversation_key. The recorded product id is
+    swapped for the current one, so one recording can be replayed for many products.
+    Recorded latencyMs is slept scaled by latency_scale (0 = as fast as possible).
+    """
+
+    def __init__(self, records, fallback=None, latency_scale=0.0):
+        self._responses = {r["key"]: (r["product_id"], r["response"]) for r in records if r["kind"] == "converse"}
+        self.fallback = fallback
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def converse(self, **kwargs):
+        response = self._lookup(kwargs)
+        if response is None:
+            return self.fallback.converse(**kwargs)
+        if self.latency_scale:
+            time.sleep(self._latency_ms(response) / 1000.0)
+        return response
+
+    def converse_stream(self, **kwargs):
+        """Same lookup; the recorded latency is spread over the synthesized chunks."""
+        response = self._lookup(kwargs)
+        if response is None:
+            return self.fallback.converse_stream(**kwargs)
+        return {"stream": streaming.to_stream(response, delay_ms=self._latency_ms(response))}
+
+    def _latency_ms(self, response):
+        return response.get('metrics', {}).get('latencyMs', 0) * self.latency_scale
+
+    def _lookup(self, request):
+        """Recorded response for this conversation state, None to use the fallback."""
+        key, product_id = conversation_key(request['messages'])
+        entry = self._responses.get(key)
+        with self._lock:
+            self.stats["hits" if entry else "misses"] += 1
+        if entry is None:
+            if self.fallback is not None:
+                return None
+            raise ReplayMiss(f"No recorded response for conversation state {key}")
+
+        recorded_id, response = entry
+        text = json.dumps(response)
+        if recorded_id and product_id:
+            text = text.replace(recorded_id, product_id)
+        return json.loads(text)
+
+
+class ScriptedBedrock:
+    """
+    Deterministic model that follows the SYSTEM_PROMPT rules (via policy_engine.decide):
+    one turn for the action, then a final answer.
+    Used when there is no recording to replay. latency_ms simulates model time per call
+    (spread over the chunks for converse_stream).
+    """
+
+    def __init__(self, latency_ms=0.0, max_rps=None):
+        self.latency_ms = latency_ms
+        self.capacity = ProvisionedCapacity(max_rps, code="ThrottlingException") if max_rps else None
+
+    @staticmethod
+    def _tool_product(messages):
+        for message in reversed(messages):
+            for block in message['content']:
+                result = block.get('toolResult')
+                if result:
+                    data = result['content'][0].get('json', {})
+                    if 'drug_id' in data:
+                        return data
+        return None
+
+    def _plan(self, product_id, trigger_reason, product):
+        decision = policy_engine.decide(product, trigger_reason) or {"action": "none"}
+        steps = []
+        if decision["action"] == "restock":
+            steps.append(("create_restock_order", {"product_id": product_id, "quantity": decision["quantity"]}))
+        elif decision["action"] == "reprice":
+            inputs = {"product_id": product_id, "new_price": float(decision["new_price"]),
+                      "reason": f"{trigger_reason} (scenario {decision['scenario']})"}
+            if product.get('competitor_price') is not None:
+                inputs["expected_competitor_price"] = float(product['competitor_price'])
+            steps.append(("update_product_price", inputs))
+        return steps
+
+    def converse(self, **kwargs):
+        if self.capacity is not None:
+            self.capacity.consume(1, 'Converse')
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        return self._reply(kwargs)
+
+    def converse_stream(self, **kwargs):
+        if self.capacity is not None:
+            self.capacity.consume(1, 'ConverseStream')
+        return {"stream": streaming.to_stream(self._reply(kwargs), delay_ms=self.latency_ms)}
+
+    def _reply(self, kwargs):
+        messages = kwargs['messages']
+        product_id, trigger_reason, product = parse_prompt(messages)
+        turn = sum(1 for message in messages if message['role'] == "assistant")
+
+        step = turn
+        if product is None:
+            if turn == 0:
+                content = [{"toolUse": {"toolUseId": "tool_0_0", "name": "get_product_market_data",
+                                        "input": {"product_id": product_id}}}]
+                return self._respond(kwargs, content, "tool_use")
+            product = self._tool_product(messages) or {}
+            step = turn - 1
+
+        steps = self._plan(product_id, trigger_reason, product) if product else []
+        if step < len(steps):
+            name, inputs = steps[step]
+            content = [{"text": f"Trigger '{trigger_reason}' applies: calling {name}."},
+                       {"toolUse": {"toolUseId": f"tool_{turn}_0", "name": name, "input": inputs}}]
+            return self._respond(kwargs, content, "tool_use")
+        return self._respond(kwargs, [{"text": f"Handled '{trigger_reason}' for {product_id}."}], "end_turn")
+
+    def _respond(self, request, content, stop_reason):
+        # Billed input = history + system prompt + tool specs
+        input_tokens = len(json.dumps([request['messages'], request.get('system'), request.get('toolConfig')],
+                                      default=str)) // 4
+        output_tokens = len(json.dumps(content)) // 4
+        return {
+            "output": {"message": {"role": "assistant", "content": content}},
+            "stopReason": stop_reason,
+            "usage": {"inputTokens": input_tokens, "outputTokens": output_tokens,
+                      "totalTokens": input_tokens + output_tokens},
+            "metrics": {"latencyMs": int(self.latency_ms)},
+        }
+
+
+# --- TOOL TAP ---
+
+def tool_outcome(result):
+    """Stable summary of a tool result for replay comparisons (ids and timestamps vary)."""
+    if not isinstance(result, dict):
+        return "ok"
+    if "error" in result:
+        return "error"
+    return result.get("status") or result.get("reason") or "ok"
+
+
+class ToolTap:
+    """
+    Wraps tools.execute_tool_router while active. Records tool I/O to a corpus writer
+    and/or keeps (tool, outcome) per episode for replay fidelity checks.
+    """
+
+    def __init__(self, writer=None):
+        self.writer = writer
+        self.calls = {}  # episode_id -> [(tool_name, outcome)]
+        self._lock = threading.Lock()
+        self._original = None
+
+    def __enter__(self):
+        self._original = tools.execute_tool_router
+        tools.execute_tool_router = self._route
+        return self
+
+    def __exit__(self, *exc):
+        tools.execute_tool_router = self._original
+
+    def _route(self, tool_name, inputs, episode_id=None):
+        result = self._original(tool_name, inputs, episode_id=episode_id)
+        with self._lock:
+            self.calls.setdefault(episode_id, []).append((tool_name, tool_outcome(result)))
+        if self.writer is not None:
+            self.writer.write({"kind": "tool", "trace_id": _trace_id(), "episode_id": episode_id,
+                               "name": tool_name, "input": inputs, "output": result})
+        return result
+
+
+# --- WIRING ---
+
+@contextmanager
+def offline(bedrock, dynamodb, rate_limit=False):
+    """
+    Points the agent at the given Bedrock and DynamoDB stand-ins, restoring the live clients on exit.
+    Client-side rate limiting is off unless rate_limit=True (e.g. against simulated capacity).
+    Notification digests go to a MemoryTransport (notifications.shared_dispatcher.transport.sent).
+    """
+    saved_bedrock = aws_clients.override('bedrock-runtime', bedrock)
+    saved_dynamodb = aws_clients.override('dynamodb', dynamodb)
+    saved_limiting = rate_limiter.set_enabled(rate_limit)
+    saved_dispatcher = notifications.shared_dispatcher
+    notifications.shared_dispatcher = notifications.Dispatcher(notifications.MemoryTransport())
+    if rate_limit:
+        rate_limiter.reset()
+    shared_cache.clear()
+    try:
+        yield dynamodb
+    finally:
+        aws_clients.clear_override('bedrock-runtime', saved_bedrock)
+        aws_clients.clear_override('dynamodb', saved_dynamodb)
+        rate_limiter.set_enabled(saved_limiting)
+        notifications.shared_dispatcher.close()
+        notifications.shared_dispatcher = saved_dispatcher
+        shared_cache.clear()
+
+def scenario_product(name, product_id):
+    return dict(SCENARIOS[name]["product"], drug_id=product_id)
+
+def recorded_conversations(records):
+    """
+    First-turn prompts of a corpus, one per recorded conversation:
+    [{"trace_id", "product_id", "trigger_reason", "product_snapshot", "tools": [(name, outcome)]}].
+    """
+    tool_calls = {}
+    for record in records:
+        if record["kind"] == "tool":
+            tool_calls.setdefault(record["trace_id"], []).append((record["name"], tool_outcome(record["output"])))
+
+    conversations = []
+    for record in records:
+        if record["kind"] == "converse" and record["key"].endswith(":0"):
+            product_id, trigger_reason, snapshot = parse_prompt(record["request"]["messages"])
+            conversations.append({"trace_id": record["trace_id"], "product_id": product_id,
+                                  "trigger_reason": trigger_reason, "product_snapshot": snapshot,
+                                  "tools": tool_calls.get(record["trace_id"], [])})
+    return conversations
+
+
+def record_scenarios(path, scenarios=None, runs=1):
+    """
+    Runs the demo scenarios against live Bedrock (the LLM path) and an in-memory
+    product table, writing the converse and tool I/O to a JSONL corpus.
+    """
+    writer = CorpusWriter(path)
+    db = InMemoryDynamoDB()
+    try:
+        with offline(RecordingBedrock(lambda_function.get_bedrock(), writer), db, rate_limit=True), ToolTap(writer):
+            for name in scenarios or list(SCENARIOS):
+                for i in range(runs):
+                    product = scenario_product(name, f"REC_{name.upper()}_{i:03d}")
+                    db.seed([product])
+                    result = lambda_function.lambda_handler({
+                        "product_id": product["drug_id"],
+                        "trigger_reason": SCENARIOS[name]["trigger_reason"],
+                        "product_snapshot": product,
+                        "use_fast_path": False,
+                    }, {})
+                    print(f"🎙️ [RECORD] {name} #{i}: {result['statusCode']} in {result['metrics'].get('turns')} turn(s)")
+    finally:
+        writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record agent conversations for offline replay.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    record_cmd = sub.add_parser("record", help="Run the demo scenarios against live Bedrock and save a corpus")
+    record_cmd.add_argument("--out", required=True)
+    record_cmd.add_argument("--scenario", action="append", choices=list(SCENARIOS))
+    record_cmd.add_argument("--runs", type=int, default=1)
+    args = parser.parse_args()
+
+    record_scenarios(args.out, scenarios=args.scenario, runs=args.runs)
+    print(f"🎙️ [RECORD] Corpus written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import demand_analytics
+import rate_limiter
+import tools
+import tracing
+from product_cache import shared_cache
+
+# --- CONFIGURATION ---
+SALES_TABLE = 'sales_transactions'
+DEFAULT_FLUSH_SIZE = int(os.environ.get("LEDGER_FLUSH_SIZE", "100"))
+DEFAULT_FLUSH_INTERVAL = float(os.environ.get("LEDGER_FLUSH_INTERVAL", "5"))
+DEFAULT_FOLD_INTERVAL = float(os.environ.get("LEDGER_FOLD_INTERVAL", "5"))
+
+
+def _add(deltas, product_id, delta):
+    """Adds to a per-product delta; entries that reach zero are dropped."""
+    total = deltas.get(product_id, Decimal(0)) + delta
+    if total:
+        deltas[product_id] = total
+    else:
+        deltas.pop(product_id, None)
+
+
+class SalesLedger:
+    """
+    Buffered writer for 'sales_transactions'.
+    Sales are kept in memory and flushed with BatchWriteItem when the buffer reaches
+    flush_size or flush_interval elapses. The stock impact is aggregated per product and
+    folded into 'pharma_products' as one update per product every fold_interval.
+    """
+
+    def __init__(self, flush_size=DEFAULT_FLUSH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 fold_interval=DEFAULT_FOLD_INTERVAL, max_retries=rate_limiter.BATCH_MAX_RETRIES):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.fold_interval = fold_interval
+        self.max_retries = max_retries
+
+        self._buffer = []
+        self._stock_deltas = {}  # drug_id -> pending stock change (negative for sales)
+        self._folding = {}       # drug_id -> stock change being written by fold_stock()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # One flush at a time, buffer stays writable
+        self._last_flush = time.monotonic()
+        self._last_fold = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {"sales": 0, "items_written": 0, "batch_requests": 0,
+                      "unprocessed_retries": 0, "stock_updates": 0, "write_failures": 0}
+
+    # --- RECORDING ---
+
+    def record_sale(self, product_id, quantity, unit_price=None):
+        """Buffers one sale and returns its transaction_id. Never touches DynamoDB directly."""
+        quantity = Decimal(str(quantity))
+        item = {
+            'transaction_id': uuid.uuid4().hex,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'drug_id': product_id,
+            'quantity': quantity,
+        }
+        if unit_price is not None:
+            item['unit_price'] = Decimal(str(unit_price))
+            item['total'] = item['unit_price'] * quantity
+
+        with self._lock:
+            self._buffer.append(item)
+            _add(self._stock_deltas, product_id, -quantity)
+            self.stats["sales"] += 1
+            due = (len(self._buffer) >= self.flush_size
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+
+        # Velocity is tracked at record time, not at flush time
+        demand_analytics.tracker.observe(product_id, quantity)
+        if due:
+            self.flush()
+        return item['transaction_id']
+
+    def pending(self):
+        with self._lock:
+            return {"transactions": len(self._buffer), "products": len(self._stock_deltas)}
+
+    def pending_stock_delta(self, product_id):
+        """
+        Stock change recorded for the product but not in 'pharma_products' yet. A delta that is
+        being folded counts until its write has landed and the cached item shows it.
+        """
+        with self._lock:
+            return self._stock_deltas.get(product_id, Decimal(0)) + self._folding.get(product_id, Decimal(0))
+
+    # --- FLUSHING ---
+
+    def flush(self, fold=None):
+        """
+        Writes all buffered transactions. fold=True forces the stock fold, fold=None folds
+        only when fold_interval has elapsed.
+        """
+        with self._flush_lock:
+            with self._lock:
+                items, self._buffer = self._buffer, []
+                self._last_flush = time.monotonic()
+
+            outcome = rate_limiter.batch_write(tools.get_dynamodb().meta.client.batch_write_item, SALES_TABLE,
+                                               [{'PutRequest': {'Item': item}} for item in items],
+                                               max_retries=self.max_retries)
+            if outcome["error"] is not None:
+                print(f"   ⚠️ [LEDGER] Batch write failed: {outcome['error']}")
+            unwritten = [entry['PutRequest']['Item'] for entry in outcome["unwritten"]]
+            with self._lock:
+                self.stats["items_written"] += outcome["written"]
+                self.stats["batch_requests"] += outcome["requests"]
+                self.stats["unprocessed_retries"] += outcome["retries"]
+                if unwritten:
+                    # Keep them for the next flush instead of dropping sales
+                    self.stats["write_failures"] += len(unwritten)
+                    self._buffer[:0] = unwritten
+
+            if fold or (fold is None and time.monotonic() - self._last_fold >= self.fold_interval):
+                self.fold_stock()
+
+    def fold_stock(self):
+        """
+        Applies the aggregated stock delta of each product with a single update. Until that
+        write has landed the delta stays visible through pending_stock_delta().
+        """
+        with self._lock:
+            deltas, self._stock_deltas = self._stock_deltas, {}
+            for product_id, delta in deltas.items():
+                _add(self._folding, product_id, delta)
+            self._last_fold = time.monotonic()
+
+        for product_id, delta in deltas.items():
+            if delta == 0:
+                continue
+            try:
+                with tracing.span(tracing.DB_CALL, "update_item", product_id=product_id):
+                    response = rate_limiter.call(
+                        rate_limiter.table_limiter(tools.TABLE_NAME, rate_limiter.WRITE), tools.get_table().update_item,
+                        Key={'drug_id': product_id},
+                        UpdateExpression="set stock_level = stock_level + :d",
+                        ExpressionAttributeValues={':d': delta},
+                        ReturnValues="ALL_NEW"
+                    )
+                with self._lock:
+                    # The cached item and the pending delta change together
+                    shared_cache.put(product_id, response['Attributes'])
+                    _add(self._folding, product_id, -delta)
+                    self.stats["stock_updates"] += 1
+            except Exception as e:
+                print(f"   ⚠️ [LEDGER] Stock fold failed for {product_id}: {e}")
+                shared_cache.invalidate(product_id)
+                with self._lock:
+                    _add(self._folding, product_id, -delta)
+                    _add(self._stock_deltas, product_id, delta)
+
+    # --- BACKGROUND FLUSHER ---
+
+    def start(self):
+        """Flushes on the time threshold even when no new sales arrive."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="sales-ledger", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(min(self.flush_interval, self.fold_interval)):
+            self.flush()
+
+    def close(self):
+        """Stops the background flusher and writes everything that is still pending."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush(fold=True)
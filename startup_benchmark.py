@@ -0,0 +1,116 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# --- CONFIGURATION ---
+# Events of a typical cold invocation. The snapshot spares the initial read, as the
+# coordinator / change feed usually provide it.
+SNAPSHOT = {"drug_id": "COLD_START_SKU", "stock_level": 300, "current_price": 100,
+            "competitor_price": 100, "cost_price": 60}
+EVENTS = {
+    "fast_path": {"product_id": "COLD_START_SKU", "trigger_reason": "Low Stock",
+                  "product_snapshot": SNAPSHOT},
+    "llm": {"product_id": "COLD_START_SKU", "trigger_reason": "Low Stock",
+            "product_snapshot": SNAPSHOT, "use_fast_path": False},
+}
+
+# Prefix of the child's result line (other output, e.g. notification digests, may follow it)
+RESULT_TAG = "STARTUP_RESULT "
+
+# Canned wire responses for stubbed (offline) runs
+STUB_RESPONSES = {
+    "transact_write_items": {},
+    "converse": {
+        "output": {"message": {"role": "assistant", "content": [{"text": "Cold start probe."}]}},
+        "stopReason": "end_turn",
+        "usage": {"inputTokens": 1, "outputTokens": 1, "totalTokens": 2},
+        "metrics": {"latencyMs": 0},
+    },
+}
+
+
+# --- CHILD PROCESS (one cold start) ---
+
+def _stub_network(service, obj):
+    """Attaches a botocore Stubber so real clients are built but no request leaves the machine."""
+    from botocore.stub import Stubber
+    client = getattr(getattr(obj, "meta", None), "client", obj)
+    stubber = Stubber(client)
+    for operation, response in STUB_RESPONSES.items():
+        if hasattr(client, operation):
+            for _ in range(4):
+                stubber.add_response(operation, response)
+    stubber.activate()
+
+def child(event_name, live):
+    started = time.perf_counter()
+    import lambda_function
+    imported = time.perf_counter()
+
+    import aws_clients
+    if not live:
+        os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+        os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+        aws_clients.add_creation_hook(_stub_network)
+
+    result = lambda_function.lambda_handler(dict(EVENTS[event_name]), {})
+    responded = time.perf_counter()
+    print(RESULT_TAG + json.dumps({
+        "import_ms": round((imported - started) * 1000, 2),
+        "first_response_ms": round((responded - imported) * 1000, 2),
+        "total_ms": round((responded - started) * 1000, 2),
+        "status": result.get("statusCode"),
+        "path": result.get("path"),
+        "clients_built": aws_clients.built(),
+    }))
+
+
+# --- PARENT ---
+
+def measure(event_name, samples, live=False):
+    """Runs 'samples' fresh interpreters and aggregates their cold-start phases."""
+    import tracing  # Parent only, so the child's import timing starts from a bare interpreter
+    runs = []
+    for _ in range(samples):
+        command = [sys.executable, os.path.abspath(__file__), "--child", event_name] + (["--live"] if live else [])
+        # Digests go to memory: the probe measures start-up, not the relay printing at exit
+        output = subprocess.run(command, capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                env=dict(os.environ, NOTIFY_TRANSPORT="memory")).stdout
+        line = next(line for line in output.splitlines() if line.startswith(RESULT_TAG))
+        runs.append(json.loads(line[len(RESULT_TAG):]))
+
+    report = {"event": event_name, "samples": samples, "live": live,
+              "status": sorted({run["status"] for run in runs}),
+              "clients_built": runs[-1]["clients_built"]}
+    for phase in ("import_ms", "first_response_ms", "total_ms"):
+        values = sorted(run[phase] for run in runs)
+        report[phase] = {"p50": tracing.percentile(values, 50), "p95": tracing.percentile(values, 95), "min": values[0]}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure Lambda cold start: import-to-first-response in fresh processes.")
+    parser.add_argument("--event", action="append", choices=list(EVENTS), help="Default: all")
+    parser.add_argument("--samples", type=int, default=10)
+    parser.add_argument("--live", action="store_true", help="Call real AWS instead of stubbed responses")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.live)
+        return
+
+    for event_name in args.event or list(EVENTS):
+        report = measure(event_name, args.samples, live=args.live)
+        print(f"🥶 [COLD START] {event_name} ({report['samples']} samples, clients: {', '.join(report['clients_built'])})")
+        for phase in ("import_ms", "first_response_ms", "total_ms"):
+            row = report[phase]
+            print(f"   {phase:<18} p50 {row['p50']:>8.1f}  p95 {row['p95']:>8.1f}  min {row['min']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
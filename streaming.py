@@ -0,0 +1,102 @@
+import json
+import time
+
+# --- STREAM EVENTS (what callers of the streaming agent receive) ---
+TEXT = "text"                    # {"type", "text"}: incremental model text
+TOOL_START = "tool_start"        # {"type", "name", "tool_use_id"}: the model started writing a tool call
+TOOL_DISPATCHED = "tool_dispatched"  # {"type", "name", "tool_use_id", "input"}: the call is running
+TOOL_INVALID = "tool_invalid"    # {"type", "name", "tool_use_id", "error"}: cut-off or malformed input, not run
+TOOL_RESULT = "tool_result"      # {"type", "name", "tool_use_id", "result"}
+TURN_END = "turn_end"            # {"type", "turn", "stop_reason", "usage"}
+RESULT = "result"                # {"type", "result"}: the lambda-style response, always last
+
+
+class MessageAssembler:
+    """
+    Rebuilds a converse()-style response from converse_stream chunks.
+    feed() returns the toolUse block as soon as that block is complete, so it can be
+    executed while the rest of the message is still streaming. A block whose input is not
+    valid JSON (e.g. cut off by max_tokens) comes back as TOOL_INVALID with the parse error.
+    """
+
+    def __init__(self):
+        self._blocks = {}        # contentBlockIndex -> content block
+        self._tool_inputs = {}   # contentBlockIndex -> partial JSON string
+        self.stop_reason = None
+        self.usage = {}
+        self.metrics = {}
+
+    def feed(self, chunk):
+        """Consumes one stream chunk. Returns (event_type, payload) or None."""
+        if 'contentBlockStart' in chunk:
+            index = chunk['contentBlockStart']['contentBlockIndex']
+            tool_use = chunk['contentBlockStart']['start'].get('toolUse')
+            if tool_use:
+                self._blocks[index] = {"toolUse": {"toolUseId": tool_use['toolUseId'], "name": tool_use['name'], "input": {}}}
+                self._tool_inputs[index] = ""
+                return TOOL_START, self._blocks[index]["toolUse"]
+        elif 'contentBlockDelta' in chunk:
+            index = chunk['contentBlockDelta']['contentBlockIndex']
+            delta = chunk['contentBlockDelta']['delta']
+            if 'text' in delta:
+                block = self._blocks.setdefault(index, {"text": ""})
+                block["text"] += delta['text']
+                return TEXT, delta['text']
+            if 'toolUse' in delta:
+                self._tool_inputs[index] += delta['toolUse'].get('input', "")
+        elif 'contentBlockStop' in chunk:
+            index = chunk['contentBlockStop']['contentBlockIndex']
+            if index in self._tool_inputs:
+                raw = self._tool_inputs.pop(index)
+                tool_use = self._blocks[index]["toolUse"]
+                try:
+                    tool_use["input"] = json.loads(raw) if raw.strip() else {}
+                except ValueError as e:
+                    return TOOL_INVALID, (tool_use, f"Tool input is incomplete or not valid JSON: {e}")
+                return TOOL_DISPATCHED, tool_use
+        elif 'messageStop' in chunk:
+            self.stop_reason = chunk['messageStop']['stopReason']
+        elif 'metadata' in chunk:
+            self.usage = chunk['metadata'].get('usage', {})
+            self.metrics = chunk['metadata'].get('metrics', {})
+        return None
+
+    def response(self):
+        content = [self._blocks[i] for i in sorted(self._blocks)]
+        return {
+            "output": {"message": {"role": "assistant", "content": content}},
+            "stopReason": self.stop_reason,
+            "usage": self.usage,
+            "metrics": self.metrics,
+        }
+
+
+def to_stream(response, chunk_chars=16, delay_ms=0.0):
+    """
+    Replays a converse() response as converse_stream chunks (offline stand-ins).
+    delay_ms is spread evenly over the chunks to mimic generation time.
+    """
+    chunks = [{"messageStart": {"role": "assistant"}}]
+    for index, block in enumerate(response['output']['message']['content']):
+        if 'text' in block:
+            text = block['text']
+            for start in range(0, len(text), chunk_chars):
+                chunks.append({"contentBlockDelta": {"contentBlockIndex": index,
+                                                     "delta": {"text": text[start:start + chunk_chars]}}})
+        elif 'toolUse' in block:
+            tool_use = block['toolUse']
+            chunks.append({"contentBlockStart": {"contentBlockIndex": index, "start": {
+                "toolUse": {"toolUseId": tool_use['toolUseId'], "name": tool_use['name']}}}})
+            raw = json.dumps(tool_use.get('input', {}))
+            for start in range(0, len(raw), chunk_chars):
+                chunks.append({"contentBlockDelta": {"contentBlockIndex": index,
+                                                     "delta": {"toolUse": {"input": raw[start:start + chunk_chars]}}}})
+        chunks.append({"contentBlockStop": {"contentBlockIndex": index}})
+    chunks.append({"messageStop": {"stopReason": response['stopReason']}})
+    chunks.append({"metadata": {"usage": response.get('usage', {}), "metrics": response.get('metrics', {})}})
+
+    pause = delay_ms / 1000.0 / len(chunks)
+    for chunk in chunks:
+        if pause:
+            time.sleep(pause)
+        yield chunk
@@ -0,0 +1,96 @@
+from decimal import Decimal
+
+import pytest
+
+import replay_harness
+import tools
+from tools import MutationRejected
+
+PRODUCT = {"drug_id": "P1", "stock_level": Decimal(1000), "current_price": Decimal("12.50"),
+           "competitor_price": Decimal("12.00"), "cost_price": Decimal("10.00")}
+
+
+@pytest.fixture
+def db():
+    db = replay_harness.InMemoryDynamoDB()
+    db.seed([dict(PRODUCT)])
+    with replay_harness.offline(replay_harness.ScriptedBedrock(), db):
+        yield db
+
+
+def product(db):
+    return db.Table(tools.TABLE_NAME).get_item(Key={"drug_id": "P1"})["Item"]
+
+
+def actions(db):
+    return db.Table(tools.ACTIONS_TABLE).item_count()
+
+
+# --- IDEMPOTENCY KEYS ---
+
+def test_idempotency_key_is_deterministic_per_episode():
+    key = tools.make_idempotency_key("P1", "reprice", "ep-1", Decimal("11.99"))
+    assert key == tools.make_idempotency_key("P1", "reprice", "ep-1", Decimal("11.99"))
+    assert key != tools.make_idempotency_key("P1", "reprice", "ep-2", Decimal("11.99"))
+    assert key != tools.make_idempotency_key("P1", "reprice", "ep-1", Decimal("11.98"))
+    assert key != tools.make_idempotency_key("P1", "restock", "ep-1")
+
+
+def test_idempotency_key_without_episode_is_unique():
+    assert tools.make_idempotency_key("P1", "restock") != tools.make_idempotency_key("P1", "restock")
+
+
+# --- CONDITIONAL TRANSACTION ---
+
+def restock_update(quantity=500):
+    return {"Key": {"drug_id": "P1"},
+            "UpdateExpression": "SET stock_level = stock_level + :q",
+            "ConditionExpression": "stock_level < :threshold",
+            "ExpressionAttributeValues": {":q": Decimal(quantity), ":threshold": tools.RESTOCK_THRESHOLD}}
+
+
+def test_commit_applies_update_and_records_action(db):
+    tools._commit_with_action_record(restock_update(), {"action_id": "P1#restock#ep-1", "action": "restock"})
+    assert product(db)["stock_level"] == 1500
+    record = db.Table(tools.ACTIONS_TABLE).get_item(Key={"action_id": "P1#restock#ep-1"})["Item"]
+    assert record["action"] == "restock" and "created_at" in record
+
+
+def test_commit_with_existing_action_is_a_duplicate_and_changes_nothing(db):
+    tools._commit_with_action_record(restock_update(100), {"action_id": "P1#restock#ep-1"})
+    with pytest.raises(MutationRejected) as rejected:
+        tools._commit_with_action_record(restock_update(100), {"action_id": "P1#restock#ep-1"})
+    assert rejected.value.reason == "duplicate"
+    assert product(db)["stock_level"] == 1100
+    assert actions(db) == 1
+
+
+def test_commit_with_failed_product_condition_is_stale_and_records_nothing(db):
+    db.Table(tools.TABLE_NAME).update_item(Key={"drug_id": "P1"}, UpdateExpression="SET stock_level = :s",
+                                           ExpressionAttributeValues={":s": Decimal(2000)})
+    with pytest.raises(MutationRejected) as rejected:
+        tools._commit_with_action_record(restock_update(), {"action_id": "P1#restock#ep-1"})
+    assert rejected.value.reason == "stale"
+    assert product(db)["stock_level"] == 2000
+    assert actions(db) == 0
+
+
+# --- TOOLS ---
+
+def test_restock_runs_once_per_episode(db):
+    first = tools.create_restock_order("P1", 300, episode_id="ep-1")
+    again = tools.create_restock_order("P1", 300, episode_id="ep-1")
+    assert first["status"] == "success"
+    assert again["status"] == "skipped" and again["reason"] == "duplicate"
+    assert again["po_details"] == first["po_details"]  # The original order is reported back
+    assert product(db)["stock_level"] == 1300
+
+
+def test_reprice_is_rejected_when_competitor_price_moved(db):
+    result = tools.update_product_price("P1", 11.99, "undercut", expected_competitor_price=12.5, episode_id="ep-1")
+    assert result["status"] == "skipped" and result["reason"] == "stale"
+    assert product(db)["current_price"] == Decimal("12.50")
+
+    result = tools.update_product_price("P1", 11.99, "undercut", expected_competitor_price=12.0, episode_id="ep-1")
+    assert result["status"] == "success"
+    assert product(db)["current_price"] == Decimal("11.99")
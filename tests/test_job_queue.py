@@ -0,0 +1,130 @@
+import threading
+import time
+
+import pytest
+
+import job_queue
+from job_queue import JobQueue, QueueFull, WorkerPool
+
+OK = {"statusCode": 200, "body": "{}"}
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def run_pool(jobs, handler, timeout=3.0, **pool_args):
+    """Runs a WorkerPool until 'timeout' or until each job has a final status."""
+    pool = WorkerPool(jobs, handler, poll_seconds=0.02, retry_base_seconds=0.01, **pool_args).start()
+    finished = []
+    try:
+        wait_for(lambda: finished.extend(pool.drain()) or jobs.depth()["waiting"] + jobs.depth()["in_flight"] == 0,
+                 timeout)
+    finally:
+        pool.stop()
+    return finished + pool.drain()
+
+
+# --- VISIBILITY ---
+
+def test_received_message_is_hidden_until_visibility_timeout():
+    jobs = JobQueue(visibility_timeout=0.1)
+    jobs.send_message({"n": 1})
+    first = jobs.receive_message()[0]
+    assert jobs.receive_message() == []
+    time.sleep(0.15)
+    again = jobs.receive_message()[0]
+    assert again.message_id == first.message_id
+    assert again.receive_count == 2
+    assert not jobs.delete_message(first.receipt_handle)  # Stale: the redelivery owns it
+    assert jobs.delete_message(again.receipt_handle)
+
+
+def test_priority_order():
+    jobs = JobQueue()
+    jobs.send_message({"n": "price"}, priority=job_queue.PRIORITY_PRICE)
+    jobs.send_message({"n": "stock"}, priority=job_queue.PRIORITY_STOCKOUT)
+    assert [m.body["n"] for m in jobs.receive_message(max_messages=2)] == ["stock", "price"]
+
+
+def test_full_queue_rejects_producer():
+    jobs = JobQueue(max_depth=1)
+    jobs.send_message({})
+    with pytest.raises(QueueFull):
+        jobs.send_message({}, timeout=0)
+
+
+# --- DEAD LETTERS ---
+
+def test_expired_receives_dead_letter_after_max_receives():
+    jobs = JobQueue(visibility_timeout=0.05, max_receives=2)
+    message_id = jobs.send_message({"n": 1})
+    for _ in range(2):
+        assert jobs.receive_message()
+        time.sleep(0.06)
+    assert jobs.receive_message() == []
+
+    expired = jobs.take_expired()
+    assert [(job["message_id"], job["attempts"]) for job in expired] == [(message_id, 2)]
+    assert jobs.take_expired() == []  # Reported once
+    assert [dead["message_id"] for dead in jobs.dead_letters()] == [message_id]
+
+    assert jobs.redrive_dead_letters() == 1
+    assert jobs.receive_message()[0].message_id == message_id
+
+
+def test_failing_job_is_retried_then_dead_lettered():
+    jobs = JobQueue(max_receives=3)
+    jobs.send_message({"n": 1})
+    attempts = []
+
+    def handler(body):
+        attempts.append(body)
+        raise RuntimeError("boom")
+
+    finished = run_pool(jobs, handler)
+    assert len(attempts) == 3
+    assert [(job["status"], job["attempts"]) for job in finished] == [(job_queue.DEAD_LETTERED, 3)]
+    assert "boom" in finished[0]["error"]
+    assert jobs.depth()["dead_letters"] == 1
+
+
+def test_expired_job_is_reported_by_the_pool():
+    jobs = JobQueue(visibility_timeout=0.05, max_receives=1)
+    jobs.send_message({"n": 1})
+    assert jobs.receive_message()  # A worker that died without an outcome
+    time.sleep(0.06)
+    finished = run_pool(jobs, lambda body: OK)
+    assert [job["status"] for job in finished] == [job_queue.DEAD_LETTERED]
+
+
+# --- LOST LEASES ---
+
+def test_stale_handle_reports_lease_lost_once():
+    jobs = JobQueue(visibility_timeout=0.1)
+    jobs.send_message({"n": 1})
+    release = threading.Event()
+    calls = []
+
+    def handler(body):
+        calls.append(body)
+        if len(calls) == 1:
+            release.wait(2)  # Outlives the visibility timeout
+        return OK
+
+    pool = WorkerPool(jobs, handler, workers=2, poll_seconds=0.02).start()
+    try:
+        wait_for(lambda: len(calls) == 2)  # The second worker received the job again
+        wait_for(lambda: not pool.results.empty())
+        release.set()
+        finished = []
+        wait_for(lambda: finished.extend(pool.drain()) or len(finished) == 2)
+    finally:
+        release.set()
+        pool.stop()
+
+    assert [job["status"] for job in finished] == [job_queue.SUCCEEDED, job_queue.LEASE_LOST]
+    assert jobs.stats["deleted"] == 1
@@ -0,0 +1,126 @@
+import time
+
+import pytest
+
+import rate_limiter
+from rate_limiter import AdaptiveLimiter, RateLimitTimeout
+
+
+@pytest.fixture(autouse=True)
+def limiting_on():
+    previous = rate_limiter.set_enabled(True)
+    yield
+    rate_limiter.set_enabled(previous)
+
+
+def drained(name, rate, burst=1.0):
+    bucket = AdaptiveLimiter(name, rate, burst)
+    bucket.reserve(burst)
+    return bucket
+
+
+# --- COST VS BURST ---
+
+def test_cost_above_burst_is_granted_and_left_as_debt():
+    bucket = AdaptiveLimiter("t", rate=10.0, burst=2.0)
+    # Costs more than the bucket can ever hold, and more than rate x deadline
+    assert bucket.reserve(5.0, deadline=time.monotonic() + 0.1) == 0.0
+    # The 3 tokens of debt plus the next one take 0.4 s to refill
+    assert bucket.reserve(1.0) == pytest.approx(0.4, abs=0.02)
+
+
+def test_call_with_cost_above_burst_completes_within_deadline():
+    bucket = AdaptiveLimiter("t", rate=1.0, burst=2.0)
+    assert rate_limiter.call(bucket, lambda: "ok", cost=50.0, deadline_seconds=0.5) == "ok"
+
+
+# --- SEVERAL LIMITERS ---
+
+def test_reserve_waits_for_the_slowest_limiter_not_the_sum():
+    fast, slow = drained("fast", rate=10.0), drained("slow", rate=5.0)
+    wait = rate_limiter._reserve((fast, slow), 1.0, None)
+    assert wait == pytest.approx(0.2, abs=0.02)
+
+
+def test_call_sleeps_once_for_all_limiters():
+    limiters = (drained("a", rate=5.0), drained("b", rate=5.0), drained("c", rate=5.0))
+    started = time.monotonic()
+    rate_limiter.call(limiters, lambda: None, deadline_seconds=None)
+    assert time.monotonic() - started < 0.4  # 0.2 s once, not 0.6 s
+
+
+def test_timeout_releases_tokens_reserved_on_other_limiters():
+    open_bucket = AdaptiveLimiter("open", rate=1.0, burst=2.0)
+    closed = drained("closed", rate=0.1)
+    with pytest.raises(RateLimitTimeout):
+        rate_limiter._reserve((open_bucket, closed), 2.0, time.monotonic() + 0.05)
+    assert open_bucket.reserve(2.0) == pytest.approx(0.0, abs=0.01)
+    assert closed.timeouts == 1
+
+
+# --- BATCH REQUESTS ---
+
+class FakeBatchWrite:
+    """batch_write_item stand-in: leaves 'unprocessed' entries of the first request, then fails."""
+
+    def __init__(self, unprocessed=0, fail_on=None):
+        self.unprocessed = unprocessed
+        self.fail_on = fail_on
+        self.sizes = []
+
+    def __call__(self, RequestItems):
+        entries = RequestItems["t"]
+        self.sizes.append(len(entries))
+        if len(self.sizes) == self.fail_on:
+            raise RuntimeError("connection reset")
+        if len(self.sizes) == 1 and self.unprocessed:
+            return {"UnprocessedItems": {"t": entries[-self.unprocessed:]}}
+        return {"UnprocessedItems": {}}
+
+
+def entries(count):
+    return [{"PutRequest": {"Item": {"id": str(i)}}} for i in range(count)]
+
+
+def test_batch_size_fits_the_burst():
+    assert rate_limiter.batch_size(AdaptiveLimiter("t", 1.0, 3.5), 1.0, 25) == 3
+    assert rate_limiter.batch_size(AdaptiveLimiter("t", 1.0, 3.5), 0.5, 100) == 7
+    assert rate_limiter.batch_size(AdaptiveLimiter("t", 1.0, 0.5), 1.0, 25) == 1
+    assert rate_limiter.batch_size(AdaptiveLimiter("t", 1000.0, 1000.0), 1.0, 25) == 25
+
+
+def test_batch_write_sends_requests_no_larger_than_the_burst():
+    send = FakeBatchWrite()
+    outcome = rate_limiter.batch_write(send, "t", entries(10), bucket=AdaptiveLimiter("t", 1000.0, 4.0))
+    assert send.sizes == [4, 4, 2]
+    assert outcome["written"] == 10 and outcome["unwritten"] == [] and outcome["error"] is None
+
+
+def test_batch_write_retries_unprocessed_items():
+    send = FakeBatchWrite(unprocessed=3)
+    outcome = rate_limiter.batch_write(send, "t", entries(10), bucket=AdaptiveLimiter("t", 1000.0, 1000.0))
+    assert send.sizes == [10, 3]
+    assert outcome["written"] == 10
+    assert outcome["requests"] == 2 and outcome["retries"] == 1
+
+
+def test_batch_write_error_counts_only_the_entries_not_written():
+    send = FakeBatchWrite(unprocessed=2, fail_on=2)
+    requests = entries(30)
+    outcome = rate_limiter.batch_write(send, "t", requests, bucket=AdaptiveLimiter("t", 1000.0, 10.0))
+    assert isinstance(outcome["error"], RuntimeError)
+    assert outcome["written"] == 8
+    # The two unprocessed entries of the first request, then the 20 never sent
+    assert outcome["unwritten"] == requests[8:10] + requests[10:]
+
+
+def test_batch_get_collects_items_and_unread_keys():
+    def send(RequestItems):
+        keys = RequestItems["t"]["Keys"]
+        return {"Responses": {"t": [dict(k, found=True) for k in keys[:-1]]},
+                "UnprocessedKeys": {"t": {"Keys": keys[-1:]}}}
+
+    outcome = rate_limiter.batch_get(send, "t", [{"id": str(i)} for i in range(4)],
+                                     bucket=AdaptiveLimiter("t", 1000.0, 1000.0), max_retries=0)
+    assert [item["id"] for item in outcome["items"]] == ["0", "1", "2"]
+    assert outcome["unread"] == [{"id": "3"}]
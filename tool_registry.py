@@ -0,0 +1,173 @@
+import inspect
+import typing
+
+# --- TYPE MAPPING ---
+# Python annotation -> JSON Schema type used in the Bedrock toolSpec
+JSON_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean", dict: "object", list: "array"}
+
+# Parameters filled in by the runtime, never by the model
+CONTEXT_PARAMS = ("episode_id",)
+
+
+class ToolInputError(ValueError):
+    """The model's input does not match the tool's schema."""
+
+
+def _unwrap_optional(annotation):
+    """Optional[X] -> X (anything else is returned unchanged)."""
+    if typing.get_origin(annotation) is typing.Union:
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return args[0]
+    return annotation
+
+
+class _Param:
+    __slots__ = ("name", "json_type", "required")
+
+    def __init__(self, name, json_type, required):
+        self.name = name
+        self.json_type = json_type
+        self.required = required
+
+    def coerce(self, value):
+        """Checks one input value against its JSON type; integral floats are accepted for integers."""
+        json_type = self.json_type
+        if json_type == "number":
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return value
+        elif json_type == "integer":
+            if isinstance(value, int) and not isinstance(value, bool):
+                return value
+            if isinstance(value, float) and value.is_integer():
+                return int(value)
+        elif json_type == "string":
+            if isinstance(value, str):
+                return value
+        elif json_type == "boolean":
+            if isinstance(value, bool):
+                return value
+        elif json_type == "object":
+            if isinstance(value, dict):
+                return value
+        elif json_type == "array":
+            if isinstance(value, list):
+                return value
+        raise ToolInputError(f"'{self.name}' must be of type {json_type}, got {type(value).__name__}")
+
+
+class Tool:
+    """A registered tool: the function, its generated toolSpec and its dispatch metadata."""
+    __slots__ = ("name", "fn", "params", "context_params", "parallel_safe", "read_only", "spec")
+
+    def __init__(self, fn, description, parallel_safe, param_descriptions, hidden, read_only=False):
+        self.name = fn.__name__
+        self.fn = fn
+        self.parallel_safe = parallel_safe
+        self.read_only = read_only
+        self.params = []
+        self.context_params = []
+
+        hints = typing.get_type_hints(fn)
+        properties = {}
+        required = []
+        for name, parameter in inspect.signature(fn).parameters.items():
+            if name in CONTEXT_PARAMS:
+                self.context_params.append(name)
+                continue
+            if name in hidden:
+                continue
+            if name not in hints:
+                raise TypeError(f"Tool '{self.name}': parameter '{name}' needs a type hint")
+            json_type = JSON_TYPES.get(_unwrap_optional(hints[name]))
+            if json_type is None:
+                raise TypeError(f"Tool '{self.name}': unsupported type hint for '{name}': {hints[name]}")
+            is_required = parameter.default is inspect.Parameter.empty
+            self.params.append(_Param(name, json_type, is_required))
+            properties[name] = {"type": json_type}
+            if name in param_descriptions:
+                properties[name]["description"] = param_descriptions[name]
+            if is_required:
+                required.append(name)
+
+        self.spec = {
+            "toolSpec": {
+                "name": self.name,
+                "description": description,
+                "inputSchema": {"json": {"type": "object", "properties": properties, "required": required}},
+            }
+        }
+
+    def validate(self, inputs):
+        """Returns the keyword arguments for fn; unknown keys are dropped."""
+        if not isinstance(inputs, dict):
+            raise ToolInputError("Tool input must be an object")
+        kwargs = {}
+        for param in self.params:
+            value = inputs.get(param.name)
+            if value is None:
+                if param.required:
+                    raise ToolInputError(f"Missing required parameter '{param.name}'")
+                continue
+            kwargs[param.name] = param.coerce(value)
+        return kwargs
+
+
+class ToolRegistry:
+    """
+    Name -> Tool map. Tools are registered with the @registry.tool(...) decorator;
+    dispatch is a single dict lookup and the Bedrock tool_config is generated from it.
+    """
+
+    def __init__(self):
+        self._tools = {}
+
+    def tool(self, description, parallel_safe=True, params=None, hidden=(), read_only=False):
+        """
+        Registers a function as a tool. The JSON schema comes from its type hints:
+        parameters with defaults are optional, CONTEXT_PARAMS and 'hidden' ones are not exposed.
+        parallel_safe=False keeps the tool serial within a turn (see lambda_function.execute_tool_requests).
+        read_only=True marks a tool without side effects; streaming starts only those before the message ends.
+        """
+        def register(fn):
+            if fn.__name__ in self._tools:
+                raise ValueError(f"Tool '{fn.__name__}' is already registered")
+            self._tools[fn.__name__] = Tool(fn, description, parallel_safe, params or {}, hidden, read_only)
+            return fn
+        return register
+
+    def get(self, name):
+        return self._tools.get(name)
+
+    def names(self):
+        return list(self._tools)
+
+    def is_parallel_safe(self, name):
+        """Unknown tools are treated as serial."""
+        tool = self._tools.get(name)
+        return tool.parallel_safe if tool else False
+
+    def is_read_only(self, name):
+        """Unknown tools are treated as having side effects."""
+        tool = self._tools.get(name)
+        return tool.read_only if tool else False
+
+    def tool_config(self, names=None):
+        """toolSpec list for Bedrock, for all tools or the given subset (in registration order)."""
+        return [tool.spec for name, tool in self._tools.items() if names is None or name in names]
+
+    def call(self, name, inputs, **context):
+        """
+        Validates and runs a tool. Returns the tool's native result, or {"error": ...}
+        for unknown tools and invalid input.
+        """
+        tool = self._tools.get(name)
+        if tool is None:
+            return {"error": "Unknown tool"}
+        try:
+            kwargs = tool.validate(inputs)
+        except ToolInputError as e:
+            return {"error": f"Invalid input for {name}: {e}"}
+        for param in tool.context_params:
+            kwargs[param] = context.get(param)
+        return tool.fn(**kwargs)
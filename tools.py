@@ -1,131 +1,320 @@
-import boto3
 import json
 import random
+import uuid
+from datetime import datetime, timezone
 from decimal import Decimal
+from typing import Optional
+
+from botocore.exceptions import ClientError
+
+import aws_clients
+import demand_analytics
+import notifications
+import rate_limiter
+import tracing
+from product_cache import shared_cache
+from tool_registry import ToolRegistry
 
 # --- CONFIGURATION ---
 # region selection for AWS -- default eu-west-1
 REGION = 'eu-west-1'
-dynamodb = boto3.resource('dynamodb', region_name=REGION)
-table = dynamodb.Table('pharma_products')
+TABLE_NAME = 'pharma_products'
+ACTIONS_TABLE = 'supply_chain_actions'  # Idempotency + audit records (PO / reprice)
+
+# Restocking is only allowed while stock is below this level (SYSTEM_PROMPT rule 1)
+RESTOCK_THRESHOLD = Decimal(1500)
 
 # --- HELPERS ---
+def get_dynamodb():
+    """DynamoDB resource, built lazily on first use (see aws_clients.py)."""
+    return aws_clients.resource('dynamodb', REGION)
+
+def get_table():
+    """The 'pharma_products' Table of the calling thread."""
+    return aws_clients.table(TABLE_NAME, REGION)
+
 class DecimalEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, Decimal):
             return float(obj)
         return super(DecimalEncoder, self).default(obj)
 
+def to_native(value):
+    """DynamoDB value -> plain JSON-ready value in one pass (Decimal becomes int or float)."""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, dict):
+        return {k: to_native(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [to_native(v) for v in value]
+    return value
+
+class ProductRecord:
+    """
+    Compact view of a 'pharma_products' item, converted from the DynamoDB item once.
+    Attributes outside FIELDS (e.g. demand_metrics) are kept in 'extra'.
+    """
+    FIELDS = ("drug_id", "product_name", "category", "stock_level", "current_price",
+              "competitor_price", "cost_price")
+    __slots__ = FIELDS + ("extra",)
+
+    def __init__(self, **values):
+        for field in self.FIELDS:
+            setattr(self, field, values.pop(field, None))
+        self.extra = values
+
+    @classmethod
+    def from_item(cls, item):
+        return cls(**{k: to_native(v) for k, v in item.items()})
+
+    def to_dict(self):
+        """Tool-result shape (what the model sees). Missing attributes are left out."""
+        result = {field: getattr(self, field) for field in self.FIELDS if getattr(self, field) is not None}
+        result.update(self.extra)
+        return result
+
+# Every tool below is registered here; dispatch and tool_config come from the registry.
+registry = ToolRegistry()
+
+# --- IDEMPOTENT MUTATIONS ---
+# Every mutation commits the product change and its action record in a single
+# TransactWriteItems call. The action record is keyed by an idempotency key, so a
+# repeated action for the same trigger episode fails one conditional write instead
+# of applying twice.
+
+class MutationRejected(Exception):
+    """Raised when a conditional mutation was not applied ('duplicate' or 'stale')."""
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+def make_idempotency_key(product_id, action, episode_id=None, *details):
+    """Deterministic key per (product, action, trigger episode). No episode -> unique per call."""
+    episode = episode_id or uuid.uuid4().hex
+    return "#".join([product_id, action, str(episode)] + [str(d) for d in details])
+
+def _commit_with_action_record(product_update, action_record):
+    """
+    Applies a conditional product update and records the action atomically.
+    The resource's client serializes native Python/Decimal values itself.
+    """
+    product_id = product_update['Key']['drug_id']
+    action_record = dict(action_record, created_at=datetime.now(timezone.utc).isoformat())
+    try:
+        with tracing.span(tracing.DB_CALL, "transact_write_items", product_id=product_id):
+            # Transactional writes cost 2 WCU per item, on both tables
+            write_limits = (rate_limiter.table_limiter(TABLE_NAME, rate_limiter.WRITE),
+                            rate_limiter.table_limiter(ACTIONS_TABLE, rate_limiter.WRITE))
+            rate_limiter.call(write_limits, get_dynamodb().meta.client.transact_write_items, cost=2, TransactItems=[
+                {'Update': {
+                    'TableName': TABLE_NAME,
+                    'Key': product_update['Key'],
+                    'UpdateExpression': product_update['UpdateExpression'],
+                    'ConditionExpression': product_update['ConditionExpression'],
+                    'ExpressionAttributeValues': product_update['ExpressionAttributeValues'],
+                }},
+                {'Put': {
+                    'TableName': ACTIONS_TABLE,
+                    'Item': action_record,
+                    'ConditionExpression': "attribute_not_exists(action_id)",
+                }},
+            ])
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'TransactionCanceledException':
+            raise
+        codes = [r.get('Code') for r in e.response.get('CancellationReasons', [])]
+        if len(codes) > 1 and codes[1] == 'ConditionalCheckFailed':
+            raise MutationRejected("duplicate")
+        if codes and codes[0] == 'ConditionalCheckFailed':
+            shared_cache.invalidate(product_id)  # Our view of the product is stale
+            raise MutationRejected("stale")
+        raise
+    # Transactions don't return the new item, so drop the cached copy
+    shared_cache.invalidate(product_id)
+
+def _rejection_result(rejected, action_id, stale_message):
+    """Builds the tool result for a mutation that was not applied."""
+    if rejected.reason == "duplicate":
+        result = {"status": "skipped", "reason": "duplicate",
+                  "message": "This action was already executed for the current trigger. Nothing changed."}
+        try:
+            with tracing.span(tracing.DB_CALL, "get_item", table=ACTIONS_TABLE):
+                previous = rate_limiter.call(rate_limiter.table_limiter(ACTIONS_TABLE), aws_clients.table(ACTIONS_TABLE, REGION).get_item,
+                                             cost=0.5, Key={'action_id': action_id}).get('Item', {})
+            if 'po_details' in previous:
+                result["po_details"] = to_native(previous['po_details'])
+        except Exception:
+            pass
+        return result
+    return {"status": "skipped", "reason": "stale", "message": stale_message}
+
+def attach_demand_metrics(item):
+    """Adds streaming demand velocity / reorder recommendations to a product item (if known)."""
+    metrics = demand_analytics.tracker.metrics(item.get('drug_id'), stock_level=item.get('stock_level'),
+                                               cost_price=item.get('cost_price'))
+    if metrics is not None:
+        item['demand_metrics'] = metrics
+    return item
+
 # --- CORE FUNCTIONS ---
+# Tools return native dicts; the registry validates inputs against the type hints.
 
-def get_product_market_data(product_id):
-    """Fetches real-time product data from DynamoDB."""
+@registry.tool("Retrieves live market data (price, stock, competitor info) for a product.", read_only=True)
+def get_product_market_data(product_id: str):
+    """Fetches real-time product data from DynamoDB, plus demand metrics when available."""
     print(f"   🔧 [TOOLS] Fetching Data: {product_id}")
     try:
-        response = table.get_item(Key={'drug_id': product_id})
-        if 'Item' in response:
-            return json.dumps(response['Item'], cls=DecimalEncoder)
+        item = shared_cache.get_item(get_table(), product_id)
+        if item is not None:
+            return ProductRecord.from_item(attach_demand_metrics(item)).to_dict()
         else:
-            return json.dumps({"error": "Product not found"})
+            return {"error": "Product not found"}
     except Exception as e:
-        return json.dumps({"error": str(e)})
+        return {"error": str(e)}
 
-def update_product_price(product_id, new_price, reason):
-    """Updates the product price in the database."""
+@registry.tool("Updates the selling price of a product.", params={
+    "expected_competitor_price": "The competitor_price your decision is based on. The update is rejected if it has changed.",
+})
+def update_product_price(product_id: str, new_price: float, reason: str,
+                         expected_competitor_price: Optional[float] = None, episode_id: Optional[str] = None):
+    """
+    Updates the product price in the database.
+    The write is skipped if the competitor price moved since the decision was made
+    (expected_competitor_price) or if the same reprice was already applied for this episode.
+    """
     print(f"   🔧 [TOOLS] Updating Price: {new_price} (Reason: {reason})")
+    price = Decimal(str(new_price))
+    action_id = make_idempotency_key(product_id, "reprice", episode_id, price)
+
+    product_update = {
+        'Key': {'drug_id': product_id},
+        'UpdateExpression': "SET current_price = :p",
+        'ConditionExpression': "attribute_exists(drug_id)",
+        'ExpressionAttributeValues': {':p': price},
+    }
+    if expected_competitor_price is not None:
+        product_update['ConditionExpression'] += " AND competitor_price = :cp"
+        product_update['ExpressionAttributeValues'][':cp'] = Decimal(str(expected_competitor_price))
+
     try:
-        table.update_item(
-            Key={'drug_id': product_id},
-            UpdateExpression="set current_price = :p",
-            ExpressionAttributeValues={':p': Decimal(str(new_price))}
-        )
-        return json.dumps({"status": "success", "message": "Price updated successfully"})
+        _commit_with_action_record(product_update, {
+            'action_id': action_id,
+            'product_id': product_id,
+            'action': "reprice",
+            'new_price': price,
+            'reason': reason,
+        })
+        notifications.notify(product_id, "reprice", f"price set to {price} TL ({reason})", episode_id=episode_id)
+        return {"status": "success", "message": "Price updated successfully"}
+    except MutationRejected as rejected:
+        return _rejection_result(rejected, action_id,
+                                 "Product missing or competitor price changed since the decision. Price NOT updated; re-read the data.")
     except Exception as e:
-        return json.dumps({"error": str(e)})
+        return {"error": str(e)}
 
-def create_restock_order(product_id, quantity):
-    """Simulates placing a restock order with a supplier."""
+# Mutates stock, so it stays serial and keeps the model's ordering within a turn
+@registry.tool("Places a purchase order (PO) to restock inventory.", parallel_safe=False)
+def create_restock_order(product_id: str, quantity: int, episode_id: Optional[str] = None):
+    """
+    Simulates placing a restock order with a supplier.
+    Stock is only added while it is still below RESTOCK_THRESHOLD, and at most one
+    order is placed per (product, trigger episode).
+    """
     po_number = f"PO{random.randint(10000, 99999)}"
     supplier = "Global Pharma Logistics Ltd."
+    action_id = make_idempotency_key(product_id, "restock", episode_id)
     
     print(f"   🔧 [TOOLS] Placing Order #{po_number} for {quantity} Units")
     try:
-        table.update_item(
-            Key={'drug_id': product_id},
-            UpdateExpression="set stock_level = stock_level + :q",
-            ExpressionAttributeValues={':q': Decimal(str(quantity))}
-        )
-        return json.dumps({
+        _commit_with_action_record({
+            'Key': {'drug_id': product_id},
+            'UpdateExpression': "SET stock_level = stock_level + :q",
+            'ConditionExpression': "stock_level < :threshold",
+            'ExpressionAttributeValues': {':q': Decimal(str(quantity)), ':threshold': RESTOCK_THRESHOLD},
+        }, {
+            'action_id': action_id,
+            'product_id': product_id,
+            'action': "restock",
+            'quantity': Decimal(str(quantity)),
+            'po_details': {'po_number': po_number, 'supplier': supplier},
+        })
+        notifications.notify(product_id, "restock", f"PO {po_number}: {quantity} units from {supplier}",
+                             episode_id=episode_id)
+        return {
             "status": "success", 
             "message": "Order placed", 
             "po_details": {"po_number": po_number, "supplier": supplier}
-        })
+        }
+    except MutationRejected as rejected:
+        return _rejection_result(rejected, action_id,
+                                 f"Stock is no longer below {RESTOCK_THRESHOLD}. No order placed.")
     except Exception as e:
-        return json.dumps({"error": str(e)})
+        return {"error": str(e)}
 
-def send_notification_email(subject, body, recipient="executive@enterprise.com"):
+# Recipient inputtan gelmez, varsayılan kullanılır
+@registry.tool("Adds a note for the executive to the next notification digest. Actions are reported automatically; "
+               "use this only for something unusual.", hidden=("recipient",))
+def send_notification_email(subject: str, body: str, product_id: Optional[str] = None, recipient: Optional[str] = None):
     """
-    Simulates an Enterprise Email Service.
-    In a production environment, this would be replaced by AWS SES (boto3).
+    Queues a free-form note on the notification dispatcher (see notifications.py).
+    Delivery happens in the background, batched with the action events.
     """
-    print(f"   📧 [TOOLS] SIMULATING EMAIL TO {recipient}...")
-    
-    # Profesyonel görünen log formatı
-    email_log = f"""
-    ================ [ 📧 PRIORITY NOTIFICATION ] ================
-    TO: {recipient}
-    FROM: Autonomous_Supply_Chain_Agent
-    SUBJECT: {subject}
-    --------------------------------------------------------------
-    {body}
-    --------------------------------------------------------------
-    [System: Delivered via Internal Secure Relay]
-    ==============================================================
+    print(f"   📧 [TOOLS] Queued note for the next digest: {subject}")
+    notifications.notify(product_id or "general", "note", f"{subject}: {body}", recipient=recipient)
+    return {"status": "queued"}
+
+# --- BATCH READS (Prompt Pre-fetch) ---
+
+def batch_get_products(product_ids, max_retries=5):
     """
-    return json.dumps({"status": "email_sent", "content": email_log})
+    Fetches several products in as few round-trips as possible.
+    Fresh cache entries are served locally; the rest go through BatchGetItem
+    (rate_limiter.batch_get: up to 100 keys per call, UnprocessedKeys retried with backoff).
+    Returns {drug_id: item} for the products that exist.
+    """
+    found = {}
+    missing = []
+    for product_id in dict.fromkeys(product_ids):
+        item = shared_cache.lookup(product_id)
+        if item is not None:
+            found[product_id] = item
+        else:
+            missing.append(product_id)
+
+    if not missing:
+        return found
+    outcome = rate_limiter.batch_get(get_dynamodb().batch_get_item, TABLE_NAME,
+                                     [{'drug_id': pid} for pid in missing], max_retries=max_retries)
+    for item in outcome["items"]:
+        shared_cache.put(item['drug_id'], item)
+        found[item['drug_id']] = item
+    if outcome["error"] is not None:
+        raise outcome["error"]
+    if outcome["unread"]:
+        print(f"   ⚠️ [TOOLS] Batch read gave up on {len(outcome['unread'])} key(s)")
+    return found
 
 # --- TOOL ROUTER ---
-def execute_tool_router(tool_name, inputs):
-    """Routes the LLM's request to the correct Python function."""
-    if tool_name == "get_product_market_data":
-        return json.loads(get_product_market_data(inputs['product_id']))
-    elif tool_name == "update_product_price":
-        return json.loads(update_product_price(inputs['product_id'], inputs['new_price'], inputs['reason']))
-    elif tool_name == "create_restock_order":
-        return json.loads(create_restock_order(inputs['product_id'], inputs['quantity']))
-    elif tool_name == "send_notification_email":
-        # Recipient inputtan gelmezse varsayılan kullanılır
-        return json.loads(send_notification_email(inputs['subject'], inputs['body']))
-    return {"error": "Unknown tool"}
+def is_parallel_safe(tool_name):
+    """Whether a tool can run concurrently with the other tools of the same turn. Unknown tools are serial."""
+    return registry.is_parallel_safe(tool_name)
+
+def is_read_only(tool_name):
+    """Whether a tool only reads (no price change, order or note). Unknown tools are not."""
+    return registry.is_read_only(tool_name)
+
+def execute_tool_router(tool_name, inputs, episode_id=None):
+    """
+    Routes the LLM's request to the registered tool (one dict lookup) and returns its native result.
+    episode_id identifies the trigger episode and makes mutations idempotent across runs.
+    Every call is traced as a 'tool_call' span.
+    """
+    with tracing.span(tracing.TOOL_CALL, tool_name, product_id=inputs.get('product_id')) as call:
+        result = registry.call(tool_name, inputs, episode_id=episode_id)
+        if isinstance(result, dict) and result.get('status'):
+            call.set(status=result['status'])
+        return result
 
 # --- TOOL CONFIGURATION (JSON Schema for Bedrock) ---
-tool_config = [
-    {
-        "toolSpec": {
-            "name": "get_product_market_data",
-            "description": "Retrieves live market data (price, stock, competitor info) for a product.",
-            "inputSchema": {"json": {"type": "object", "properties": {"product_id": {"type": "string"}}, "required": ["product_id"]}}
-        }
-    },
-    {
-        "toolSpec": {
-            "name": "update_product_price",
-            "description": "Updates the selling price of a product.",
-            "inputSchema": {"json": {"type": "object", "properties": {"product_id": {"type": "string"}, "new_price": {"type": "number"}, "reason": {"type": "string"}}, "required": ["product_id", "new_price", "reason"]}}
-        }
-    },
-    {
-        "toolSpec": {
-            "name": "create_restock_order",
-            "description": "Places a purchase order (PO) to restock inventory.",
-            "inputSchema": {"json": {"type": "object", "properties": {"product_id": {"type": "string"}, "quantity": {"type": "integer"}}, "required": ["product_id", "quantity"]}}
-        }
-    },
-    {
-        "toolSpec": {
-            "name": "send_notification_email",
-            "description": "Sends a formal notification email to the executive/boss.",
-            "inputSchema": {"json": {"type": "object", "properties": {"subject": {"type": "string"}, "body": {"type": "string"}}, "required": ["subject", "body"]}}
-        }
-    }
-]
\ No newline at end of file
+# Generated from the registered functions' signatures
+tool_config = registry.tool_config()
@@ -0,0 +1,193 @@
+import argparse
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+# --- CONFIGURATION ---
+# Set AGENT_TRACE_FILE to export every finished span as one JSON line.
+TRACE_FILE = os.environ.get("AGENT_TRACE_FILE")
+
+# Span kinds, outermost to innermost
+INVOCATION = "invocation"
+TURN = "turn"
+MODEL_CALL = "model_call"
+TOOL_CALL = "tool_call"
+DB_CALL = "db_call"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "kind", "name", "start", "_t0", "duration_ms",
+                 "status", "attributes")
+
+    def __init__(self, kind, name, parent, attributes):
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.kind = kind
+        self.name = name
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self.duration_ms = None
+        self.status = "ok"
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self):
+        self.duration_ms = round((time.perf_counter() - self._t0) * 1000, 3)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            "kind": self.kind, "name": self.name, "start": self.start,
+            "duration_ms": self.duration_ms, "status": self.status, "attributes": self.attributes,
+        }
+
+
+# --- EXPORTERS ---
+
+class NullExporter:
+    def export(self, span):
+        pass
+
+class MemoryExporter:
+    """Keeps the most recent spans in memory (benchmarks, tests)."""
+    def __init__(self, maxlen=100000):
+        self.spans = deque(maxlen=maxlen)
+
+    def export(self, span):
+        self.spans.append(span.to_dict())
+
+class JsonLinesExporter:
+    """Appends one JSON object per finished span to a file. Safe across threads."""
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", buffering=1)
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_exporter = JsonLinesExporter(TRACE_FILE) if TRACE_FILE else NullExporter()
+
+def set_exporter(exporter):
+    """Replaces the process-wide exporter and returns the previous one."""
+    global _exporter
+    previous, _exporter = _exporter, exporter
+    return previous
+
+
+# --- SPAN API ---
+
+@contextmanager
+def span(kind, name=None, **attributes):
+    """
+    Opens a span nested under the current one (per thread / per context).
+    Exceptions mark the span as failed, record the AWS error code if any, and propagate.
+    """
+    current = Span(kind, name or kind, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.status = "error"
+        current.attributes["error"] = str(e)[:300]
+        response = getattr(e, "response", None)
+        error_code = response.get("Error", {}).get("Code") if isinstance(response, dict) else None
+        if error_code:
+            current.attributes["error_code"] = error_code
+        raise
+    finally:
+        current.finish()
+        _current_span.reset(token)
+        _exporter.export(current)
+
+def current_span():
+    return _current_span.get()
+
+def bind(fn):
+    """Wraps fn so it runs in a copy of the caller's context (keeps span nesting across thread pools)."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+# --- AGGREGATION ---
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    # Nearest-rank method
+    rank = math.ceil(pct / 100.0 * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+def summarize(spans, group_by="kind"):
+    """Latency percentiles per span kind (or per kind:name)."""
+    groups = {}
+    errors = {}
+    for s in spans:
+        key = s["kind"] if group_by == "kind" else f"{s['kind']}:{s['name']}"
+        groups.setdefault(key, []).append(s["duration_ms"])
+        if s.get("status") == "error":
+            errors[key] = errors.get(key, 0) + 1
+
+    report = {}
+    for key, durations in sorted(groups.items()):
+        durations.sort()
+        report[key] = {
+            "count": len(durations),
+            "errors": errors.get(key, 0),
+            "p50_ms": percentile(durations, 50),
+            "p95_ms": percentile(durations, 95),
+            "p99_ms": percentile(durations, 99),
+            "max_ms": durations[-1],
+        }
+    return report
+
+def load_spans(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent trace tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    summary_cmd = sub.add_parser("summarize", help="p50/p95/p99 per span type from a JSON-lines trace file")
+    summary_cmd.add_argument("path")
+    summary_cmd.add_argument("--by", choices=["kind", "name"], default="kind")
+    args = parser.parse_args()
+
+    spans = load_spans(args.path)
+    report = summarize(spans, group_by=args.by)
+    token_spans = [s for s in spans if s["kind"] == MODEL_CALL]
+    print(f"{'span':<40} {'count':>7} {'err':>5} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'max ms':>10}")
+    for key, row in report.items():
+        print(f"{key:<40} {row['count']:>7} {row['errors']:>5} {row['p50_ms']:>10.1f} "
+              f"{row['p95_ms']:>10.1f} {row['p99_ms']:>10.1f} {row['max_ms']:>10.1f}")
+    if token_spans:
+        input_tokens = sum(s["attributes"].get("input_tokens", 0) for s in token_spans)
+        output_tokens = sum(s["attributes"].get("output_tokens", 0) for s in token_spans)
+        print(f"\nModel calls: {len(token_spans)} | input tokens: {input_tokens} | output tokens: {output_tokens}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+import uuid
+
+# --- CONFIGURATION ---
+DEFAULT_COOLDOWN_SECONDS = float(os.environ.get("TRIGGER_COOLDOWN_SECONDS", "10"))
+
+# Fields that define "the same anomaly" per trigger reason. Stock drifts on every sale,
+# so a Low Stock episode only changes when it is resolved (stock back above threshold).
+# Our own price is excluded: the agent changes it, the market doesn't.
+FINGERPRINT_FIELDS = {
+    "Low Stock": (),
+    "Price Disadvantage": ("competitor_price", "cost_price"),
+    "Profit Protection": ("cost_price",),
+}
+DEFAULT_FINGERPRINT_FIELDS = ("competitor_price", "current_price", "cost_price", "stock_level")
+
+# --- OUTCOMES ---
+EXECUTED = "executed"
+SUPPRESSED_IN_FLIGHT = "suppressed_in_flight"
+SUPPRESSED_COOLDOWN = "suppressed_cooldown"
+SUPPRESSED_UNCHANGED = "suppressed_unchanged"
+
+
+def fingerprint(reason, state):
+    fields = FINGERPRINT_FIELDS.get(reason, DEFAULT_FINGERPRINT_FIELDS)
+    return tuple(str((state or {}).get(field)) for field in fields)
+
+
+class TriggerCoordinator:
+    """
+    Sits between anomaly detection and the agent.
+    Per (product_id, reason) it skips triggers while a run is in flight, applies a cooldown
+    after each run, and only re-escalates when the anomaly's state actually changed.
+    Each distinct anomaly state gets an episode_id, which makes the agent's mutations idempotent.
+    """
+
+    def __init__(self, cooldown_seconds=DEFAULT_COOLDOWN_SECONDS):
+        self.cooldown_seconds = cooldown_seconds
+        self._episodes = {}  # (product_id, reason) -> episode state
+        self._lock = threading.Lock()
+        self.counters = {EXECUTED: 0, SUPPRESSED_IN_FLIGHT: 0, SUPPRESSED_COOLDOWN: 0, SUPPRESSED_UNCHANGED: 0}
+
+    def submit(self, product_id, reason, state, run):
+        """
+        Offers a detected anomaly to the coordinator.
+        'run' is called as run(episode_id) when the trigger is admitted and must return truthy on success.
+        Returns (outcome, run_result); run_result is None when the trigger was suppressed.
+        """
+        outcome, episode_id = self.admit(product_id, reason, state)
+        if outcome != EXECUTED:
+            return outcome, None
+
+        success = False
+        try:
+            result = run(episode_id)
+            success = bool(result)
+            return outcome, result
+        finally:
+            self.complete(product_id, reason, success)
+
+    def admit(self, product_id, reason, state):
+        """
+        First half of submit() for asynchronous runs (e.g. via job_queue).
+        Returns (outcome, episode_id); when EXECUTED the episode stays in flight until complete().
+        """
+        key = (product_id, reason)
+        now = time.monotonic()
+        current = fingerprint(reason, state)
+
+        with self._lock:
+            episode = self._episodes.get(key)
+            if episode is None:
+                episode = {"fingerprint": current, "episode_id": uuid.uuid4().hex,
+                           "in_flight": False, "last_finished": None, "last_success": False}
+                self._episodes[key] = episode
+                outcome = EXECUTED
+            elif episode["in_flight"]:
+                outcome = SUPPRESSED_IN_FLIGHT
+            elif episode["last_finished"] is not None and now - episode["last_finished"] < self.cooldown_seconds:
+                outcome = SUPPRESSED_COOLDOWN
+            elif episode["fingerprint"] == current and episode["last_success"]:
+                outcome = SUPPRESSED_UNCHANGED
+            else:
+                if episode["fingerprint"] != current:
+                    # The anomaly escalated -> new episode, new idempotency scope
+                    episode["fingerprint"] = current
+                    episode["episode_id"] = uuid.uuid4().hex
+                outcome = EXECUTED
+
+            self.counters[outcome] += 1
+            if outcome != EXECUTED:
+                return outcome, None
+            episode["in_flight"] = True
+            return outcome, episode["episode_id"]
+
+    def complete(self, product_id, reason, success):
+        """Ends the in-flight run of an admitted trigger and starts its cooldown."""
+        with self._lock:
+            episode = self._episodes.get((product_id, reason))
+            if episode is not None:
+                episode["in_flight"] = False
+                episode["last_finished"] = time.monotonic()
+                episode["last_success"] = bool(success)
+
+    def resolve(self, product_id, reason):
+        """Marks an anomaly as cleared; the next occurrence starts a fresh episode."""
+        with self._lock:
+            episode = self._episodes.get((product_id, reason))
+            if episode is not None and not episode["in_flight"]:
+                del self._episodes[(product_id, reason)]
+
+    def stats(self):
+        with self._lock:
+            suppressed = sum(v for k, v in self.counters.items() if k != EXECUTED)
+            return dict(self.counters, suppressed=suppressed, open_episodes=len(self._episodes))